@@ -16,6 +16,19 @@ def create_app(test_config=None):
         SERVER_NAME='127.0.0.1:5000',
         PREFERRED_URL_SCHEME='https',
         WTF_CSRF_ENABLED=True,
+        # Disable when several workers run and use the expire-statuses command from cron instead
+        STATUS_SCHEDULER=True,
+        # Background database exports, finished files are kept for EXPORT_JOB_TTL seconds
+        EXPORT_JOB_WORKERS=2,
+        EXPORT_JOB_TTL=3600,
+        # Dashboard listings show an estimate instead of counting past this many rows
+        EXACT_COUNT_LIMIT=100000,
+        # Worker processes resizing uploaded dress photos
+        IMAGE_VARIANT_WORKERS=2,
+        # Bookings that hit a concurrent booking or a locked database are retried this many
+        # times, waiting up to BOOKING_RETRY_DELAY seconds, doubled on each attempt
+        BOOKING_ATTEMPTS=5,
+        BOOKING_RETRY_DELAY=0.05,
     )
 
     if test_config is None:
@@ -50,6 +63,22 @@ def create_app(test_config=None):
     # Initialize the LoginManager
     auth.init_app(app)
 
+    # Expire rent and maintenance statuses as their return dates pass
+    from cordelia import scheduler
+    scheduler.init_app(app)
+
+    # Run database exports in the background
+    from cordelia import jobs
+    jobs.init_app(app)
+
+    # Dress photo store commands
+    from cordelia import images
+    images.init_app(app)
+
+    # Bulk CSV / XLSX import command
+    from cordelia import importer
+    importer.init_app(app)
+
 
     log_dir = os.path.join(app.instance_path, 'logs')
     os.makedirs(log_dir, exist_ok=True)
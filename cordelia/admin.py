@@ -1,10 +1,18 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
-from sqlalchemy import case, desc, func
+from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, Response, jsonify, send_file
+from flask_wtf.csrf import generate_csrf
+from werkzeug.http import is_resource_modified
+from sqlalchemy import desc, func
 from cordelia.auth import login_required, admin_required
 from cordelia.db import db
-from cordelia.models import Dress, Customer, Rent, Maintenance, maintenance_association, Sale
-from cordelia.forms import SearchForm, DressForm, RentForm, CustomerForm, MaintenanceForm, DeleteForm, SaleForm
-from base64 import b64encode
+from cordelia.models import Dress, Customer, Rent, Maintenance, Sale
+from cordelia.forms import SearchForm, DressForm, RentForm, CustomerForm, MaintenanceForm, DeleteForm, SaleForm, ExportForm, ImportForm
+from cordelia.pagination import paginate
+from cordelia.status import resolve_dress_statuses, resolve_customer_statuses, resolve_maintenance_dresses
+from cordelia.search import SEARCH_INDEXES, SearchError, searchable_columns, ranked_search, column_predicate
+from cordelia.images import ImageError, store_image, image_variants
+from cordelia.booking import BookingError, book_rent
+from hashlib import sha1
+import io
 
 
 import logging
@@ -18,26 +26,147 @@ adminBp = Blueprint('admin', __name__, url_prefix='/admin')
 @admin_required
 def downloadExcel():
 
-    from cordelia.excel import excel_download
+    from cordelia.export import export_download, available_formats
 
-    return excel_download()
+    export_format = request.args.get('format', 'xlsx')
+    if export_format not in available_formats():
+        abort(404)
+
+    return export_download(export_format)
+
+
+@adminBp.route('/download/jobs', methods=['POST'])
+@login_required
+@admin_required
+def start_export_job():
+
+    from cordelia.export import available_formats
+    from cordelia.jobs import export_jobs
+
+    form = ExportForm()
+    form.format.choices = [(export_format, export_format) for export_format in available_formats()]
+
+    if not form.validate_on_submit():
+        return jsonify({'errors': form.errors}), 400
+
+    job = export_jobs.submit(form.format.data)
+
+    response = job.to_dict()
+    response['status_url'] = url_for('admin.export_job_status', job_id=job.id)
+    response['download_url'] = url_for('admin.export_job_file', job_id=job.id)
+
+    return jsonify(response), 202
+
+
+@adminBp.route('/download/jobs/<string:job_id>')
+@login_required
+@admin_required
+def export_job_status(job_id):
+
+    from cordelia.jobs import export_jobs
+
+    job = export_jobs.get(job_id)
+    if job is None:
+        abort(404)
+
+    return jsonify(job.to_dict())
+
+
+@adminBp.route('/download/jobs/<string:job_id>/file')
+@login_required
+@admin_required
+def export_job_file(job_id):
+
+    from cordelia.jobs import export_jobs
+
+    job = export_jobs.get(job_id)
+    if job is None or job.status != 'done':
+        abort(404)
+
+    return send_file(job.file_path, as_attachment=True, download_name=job.file_name)
+
+
+@adminBp.route('/import', methods=['POST'])
+@login_required
+@admin_required
+def import_data():
+
+    from cordelia.importer import ImportFileError, import_file, import_format
+
+    form = ImportForm()
+    db_views = {'dress': 'admin.dress_db', 'customer': 'admin.customer_db', 'rent': 'admin.rent_db'}
+
+    if not form.validate_on_submit():
+        for errors in form.errors.values():
+            flash(' '.join(errors), 'danger')
+        return redirect(url_for('admin.dress_db'))
+
+    upload = form.file.data
+    try:
+        result = import_file(form.kind.data, upload.stream, import_format(upload.filename))
+    except ImportFileError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for(db_views[form.kind.data]))
+
+    logging.debug(f"{result.inserted} of {result.rows} {form.kind.data} rows imported from dashboard")
+
+    if not result.failed:
+        flash(f'Imported {result.inserted} rows.', 'success')
+        return redirect(url_for(db_views[form.kind.data]))
+
+    # Send back the rows that failed, by line of the uploaded file
+    flash(f'Imported {result.inserted} of {result.rows} rows, {result.failed} had errors.', 'warning')
+    report = io.BytesIO(result.errors.to_csv(index=False).encode())
+    return send_file(report, mimetype='text/csv', as_attachment=True, download_name=f'import-errors-{form.kind.data}.csv')
+
+
+@adminBp.context_processor
+def inject_export_formats():
+    from cordelia.export import available_formats
+
+    return {'export_formats': available_formats(), 'export_csrf_token': generate_csrf()}
+
+
+# Columns offered in the dress search form, the internal bookkeeping columns of Dress
+# (last rent pointers, version) are left out
+DRESS_SEARCH_COLUMNS = [
+    'id', 'size', 'color', 'style', 'brand', 'cost', 'marketPrice', 'rentPrice', 'rentsForReturns',
+    'sellable', 'dateAdded', 'timesRented', 'rentStatus', 'maintenanceStatus', 'imageData', 'sold',
+]
 
 
 # SearchForm handler
 def handle_search_form(query, model_columns, model_class):
-    form = SearchForm(model_columns=model_columns)
+    # Returns the filtered query, the form and, for full-text searches, the order_by that
+    # sorts the matches by relevance (None otherwise)
+    form = SearchForm(model_columns=model_columns, text_search=model_class in SEARCH_INDEXES)
+    search_order = None
 
     if form.validate_on_submit():
         category = form.category.data
         filterSearch = form.search.data
 
-        model_columns = {column: getattr(model_class, column) for column in model_columns}
+        if category and filterSearch and (category == 'text' or category in model_columns):
+            if category == 'text' or category in searchable_columns(model_class):
+                # Text columns go through the full-text index, best matches first and the
+                # primary key breaking ties so the keyset pagination has a unique order
+                ranked = ranked_search(query, model_class, filterSearch, None if category == 'text' else [category])
+                if ranked is not None:
+                    query, rank = ranked
+                    search_order = [rank, model_class.id]
+                else:
+                    query = query.filter(db.false())
+            else:
+                # Numbers, dates and booleans are compared as such (1500..2000, >3, 2023-06, yes)
+                try:
+                    criterion = column_predicate(model_class, category, filterSearch)
+                except SearchError as e:
+                    flash(f'Invalid search for {category}: {e}', 'warning')
+                    criterion = None
 
-        if category and filterSearch and category in model_columns:
-            column = model_columns[category]
-            query = query.filter(column.ilike(f"%{filterSearch}%"))
+                query = query.filter(criterion if criterion is not None else db.false())
 
-    return query, form
+    return query, form, search_order
 
 
 @adminBp.route('/update-statuses', methods=['POST'])
@@ -48,11 +177,10 @@ def update_statuses_endpoint():
     confirm = request.form.get('confirm', False)
 
     if confirm:
-        Dress.update_statuses()
+        updated = Dress.update_statuses()
         db.session.commit()
-        flash('Statuses updated successfully.', 'success')
-
-    logging.debug("update_statuses() method called from dashboard")
+        flash(f'Statuses updated successfully. {updated} dresses changed.', 'success')
+        logging.debug(f"update_statuses() method called from dashboard, {updated} dresses changed")
     return redirect(url_for('admin.dress_db'))
 
 
@@ -62,10 +190,9 @@ def update_statuses_endpoint():
 def dress_db():
     model = 'Dress'
     
-    model_columns = Dress.__table__.columns.keys()
+    model_columns = DRESS_SEARCH_COLUMNS
 
     # Pagination settings
-    page = request.args.get('page', 1, type=int)
     items_per_page = 12
 
     # Get the selected column for ordering from the query parameters
@@ -74,50 +201,34 @@ def dress_db():
     # Initial inventory query
     inventory_query = Dress.query
 
-    # Apply sorting based on the selected column
+    # Sorting based on the selected column
     if order_by_column == 'popularity':
-        inventory_query = inventory_query.order_by(Dress.timesRented.desc())
+        order_by = [Dress.timesRented.desc()]
     elif order_by_column == 'id':
-        inventory_query = inventory_query.order_by(Dress.id)
+        order_by = [Dress.id]
     elif order_by_column == 'cost':
-        inventory_query = inventory_query.order_by(Dress.cost.desc())
+        order_by = [Dress.cost.desc()]
     else:
         # If 'default', sort by rentStatus and maintenanceStatus in descending order.
         # Lastly by their last rent's rentDate and maintenance date if there is one.
-
-        # Subquery to get the last rent date and the last maintenance date for each dress
-        subquery = db.session.query(
-            Rent.dressId,
-            func.max(Rent.rentDate).label('last_rent_date'),
-            func.max(Maintenance.date).label('last_maintenance_date')
-        ).outerjoin(
-            maintenance_association,
-            Rent.dressId == maintenance_association.c.dress_id
-        ).outerjoin(
-            Maintenance,
-            maintenance_association.c.maintenance_id == Maintenance.id
-        ).group_by(Rent.dressId).subquery()
-
-        # Query to order the Dress table
-        inventory_query = Dress.query.outerjoin(
-            subquery,
-            Dress.id == subquery.c.dressId
-        ).order_by(
+        order_by = [
             desc(Dress.rentStatus),
             desc(Dress.maintenanceStatus),
-            desc(subquery.c.last_rent_date),
-            desc(subquery.c.last_maintenance_date),
+            desc(Dress.last_rent_date),
+            desc(Dress.last_maintenance_date),
             desc(Dress.dateAdded)
-        )
+        ]
 
     # Handle search form
-    inventory_query, form = handle_search_form(inventory_query, model_columns, Dress)
+    inventory_query, form, search_order = handle_search_form(inventory_query, model_columns, Dress)
+    order_by = search_order or order_by
 
-    # Paginate the filtered results and store it in 'inventory' variable
-    inventory = inventory_query.paginate(page=page, per_page=items_per_page)
+    # Paginate the filtered results once, the same page object feeds the pagination macro
+    inventory = paginate(inventory_query, order_by, per_page=items_per_page)
+    pagination = inventory
 
-    # Separate pagination from the inventory query for pagination template to avoid errors.
-    pagination = inventory_query.paginate(page=page, per_page=items_per_page)
+    # Resolve the rent and maintenance status of every dress on the page at once
+    statuses = resolve_dress_statuses(inventory.items)
 
     delete_form = DeleteForm()
 
@@ -141,6 +252,7 @@ def dress_db():
 
     return render_template('admin_views/db_dress.html',
                            inventory=inventory,
+                           statuses=statuses,
                            form=form,
                            maintenance_form=maintenance_form,
                            delete_form=delete_form,
@@ -158,7 +270,6 @@ def maintenance_db():
 
     model_columns = Maintenance.__table__.columns.keys()
 
-    page = request.args.get('page', 1, type=int)
     items_per_page = 12
 
     order_by_column = request.args.get('sort', default='status')
@@ -166,19 +277,18 @@ def maintenance_db():
     inventory_query = Maintenance.query
 
     if order_by_column =='date':
-        inventory_query = inventory_query.order_by(Maintenance.date.desc())
+        order_by = [Maintenance.date.desc()]
     elif order_by_column == 'type':
-        inventory_query = inventory_query.order_by(Maintenance.maintenance_type.desc())
+        order_by = [Maintenance.maintenance_type.desc()]
     elif order_by_column == 'cost':
-        inventory_query = inventory_query.order_by(Maintenance.cost.desc())
+        order_by = [Maintenance.cost.desc()]
     else:
-        inventory_query = inventory_query.order_by(Maintenance.date.desc(), Maintenance.is_returned(Maintenance).desc())
-
-    inventory_query, form = handle_search_form(inventory_query, model_columns, Maintenance)
+        order_by = [Maintenance.date.desc(), Maintenance.is_returned(Maintenance).desc()]
 
-    inventory = inventory_query.paginate(page=page, per_page=items_per_page)
+    inventory_query, form, _ = handle_search_form(inventory_query, model_columns, Maintenance)
 
-    pagination = inventory_query.paginate(page=page, per_page=items_per_page)
+    inventory = paginate(inventory_query, order_by, per_page=items_per_page)
+    pagination = inventory
 
     delete_form = DeleteForm()
 
@@ -188,6 +298,7 @@ def maintenance_db():
 
     return render_template('admin_views/db_maintenance.html', 
                            inventory=inventory, 
+                           maintenance_dresses=resolve_maintenance_dresses(inventory.items), 
                            form=form, 
                            delete_form=delete_form, 
                            pagination=pagination, 
@@ -203,7 +314,6 @@ def rent_db():
 
     model_columns = Rent.__table__.columns.keys()
 
-    page = request.args.get('page', 1, type=int)
     items_per_page = 12
 
     order_by_column = request.args.get('sort', default='status')
@@ -211,20 +321,20 @@ def rent_db():
     inventory_query = Rent.query
 
     if order_by_column == 'id':
-        inventory_query = inventory_query.order_by(Rent.id)
+        order_by = [Rent.id]
     elif order_by_column == 'customer_last_name':
         # Join Rent and Customer tables and sort by Customer's lastName
-        inventory_query = inventory_query.join(Customer, Rent.clientId == Customer.id).order_by(Customer.lastName)
+        inventory_query = inventory_query.join(Customer, Rent.clientId == Customer.id)
+        order_by = [Customer.lastName]
     elif order_by_column == 'dress_id':
-        inventory_query = inventory_query.order_by(Rent.dressId.desc())
+        order_by = [Rent.dressId.desc()]
     else :
-        inventory_query = inventory_query.order_by(Rent.rentDate.desc(),Rent.is_returned(Rent).desc())
-
-    inventory_query, form = handle_search_form(inventory_query, model_columns, Rent)
+        order_by = [Rent.rentDate.desc(), Rent.is_returned(Rent).desc()]
 
-    inventory = inventory_query.paginate(page=page, per_page=items_per_page)
+    inventory_query, form, _ = handle_search_form(inventory_query, model_columns, Rent)
 
-    pagination = inventory_query.paginate(page=page, per_page=items_per_page)
+    inventory = paginate(inventory_query, order_by, per_page=items_per_page)
+    pagination = inventory
 
     delete_form = DeleteForm()
 
@@ -249,19 +359,21 @@ def customer_db():
 
     model_columns = Customer.__table__.columns.keys()
 
-    page = request.args.get('page', 1, type=int)
     items_per_page = 12
 
     order_by_column = request.args.get('sort', default='status')
 
-    inventory_query = Customer.query
+    # Search on the bare table, the count then skips the join the status sort needs
+    count_query, form, search_order = handle_search_form(Customer.query, model_columns, Customer)
+
+    inventory_query = count_query
 
     if order_by_column == 'id':
-        inventory_query = inventory_query.order_by(Customer.id)
+        order_by = [Customer.id]
     elif order_by_column == 'last_name':
-        inventory_query = inventory_query.order_by(Customer.lastName)
+        order_by = [Customer.lastName]
     elif order_by_column == 'date':
-        inventory_query = inventory_query.order_by(Customer.dateAdded.desc())
+        order_by = [Customer.dateAdded.desc()]
     else :
         # Subquery to get the last rent date for each customer
         subquery = db.session.query(
@@ -269,22 +381,19 @@ def customer_db():
             func.max(Rent.rentDate).label('last_rent_date')
         ).group_by(Rent.clientId).subquery()
 
-        # Query to order the inventory_query
+        # Customers with the most recent rents first, those without rents last
         inventory_query = inventory_query.outerjoin(
             subquery,
             Customer.id == subquery.c.clientId
-        ).order_by(
-            desc(case(
-                (subquery.c.last_rent_date != None, subquery.c.last_rent_date),
-                else_=None
-            ))
         )
+        order_by = [desc(subquery.c.last_rent_date)]
 
-    inventory_query, form = handle_search_form(inventory_query, model_columns, Customer)
+    order_by = search_order or order_by
 
-    inventory = inventory_query.paginate(page=page, per_page=items_per_page)
+    inventory = paginate(inventory_query, order_by, per_page=items_per_page, count_query=count_query)
+    pagination = inventory
 
-    pagination = inventory_query.paginate(page=page, per_page=items_per_page)
+    statuses = resolve_customer_statuses(inventory.items)
 
     delete_form = DeleteForm()
 
@@ -294,6 +403,7 @@ def customer_db():
 
     return render_template('admin_views/db_customer.html', 
                            inventory=inventory, 
+                           statuses=statuses, 
                            form=form, 
                            delete_form=delete_form, 
                            pagination=pagination, 
@@ -309,31 +419,29 @@ def sales_db():
 
     model_columns = Sale.__table__.columns.keys()
 
-    page = request.args.get('page', 1, type=int)
     items_per_page = 12
 
     order_by_column = request.args.get('sort', default='id')
 
-    inventory_query = Sale.query
+    # Search on the bare table, every sale has exactly one customer and one dress
+    # so the count can skip the joins
+    count_query, form, _ = handle_search_form(Sale.query, model_columns, Sale)
 
     # Add joins to include related Customer and Dress objects
-    inventory_query = inventory_query.join(Customer)
+    inventory_query = count_query.join(Customer)
     inventory_query = inventory_query.join(Dress)
 
     if order_by_column =='date':
-        inventory_query = inventory_query.order_by(Sale.sale_date.desc())
+        order_by = [Sale.sale_date.desc()]
     elif order_by_column == 'customer':
-        inventory_query = inventory_query.order_by(Customer.lastName)
+        order_by = [Customer.lastName]
     elif order_by_column == 'price':
-        inventory_query = inventory_query.order_by(Sale.sale_price.desc())
+        order_by = [Sale.sale_price.desc()]
     else:
-        inventory_query = inventory_query.order_by(Sale.id.desc())
-
-    inventory_query, form = handle_search_form(inventory_query, model_columns, Sale)
-
-    inventory = inventory_query.paginate(page=page, per_page=items_per_page)
+        order_by = [Sale.id.desc()]
 
-    pagination = inventory_query.paginate(page=page, per_page=items_per_page)
+    inventory = paginate(inventory_query, order_by, per_page=items_per_page, count_query=count_query)
+    pagination = inventory
 
     delete_form = DeleteForm()
 
@@ -389,12 +497,16 @@ def update(title, form_type):
             logging.debug(f'image_data from request: {image_data}')
 
             if image_data:
-                # If the image_data is a file object, read it as bytes and convert to base64
-                image_bytes = image_data.read()
-                image_base64 = b64encode(image_bytes).decode('utf-8')
+                # Save the photo to the image store, the dress only keeps its hash
+                try:
+                    image_hash = store_image(image_data.read())
+                    # The thumbnails are made in the background
+                    image_variants.submit(image_hash)
+                except ImageError as e:
+                    flash(str(e), 'danger')
+                    return render_template('admin_views/update.html', title=title, form_type=form_type, form=form)
             else:
-                # If the image_data is None, set image_base64 to None
-                image_base64 = None
+                image_hash = None
 
             dress = Dress(
                 brand=form.brand.data,
@@ -404,7 +516,7 @@ def update(title, form_type):
                 cost=form.cost.data,
                 marketPrice=form.marketPrice.data,
                 rentPrice=form.rentPrice.data,
-                imageData=image_base64
+                imageData=image_hash
             )
 
             db.session.add(dress)
@@ -416,40 +528,24 @@ def update(title, form_type):
         
         elif form_type == 'rent':
 
-            dress_id = form.dressId.data
-            customer_id = form.customerId.data
-
-            dress = Dress.query.get(dress_id)
-            customer = Customer.query.get(customer_id)
-
-            if not dress.check_status() and not dress.check_maintenance_status() and not dress.sold:
-                rent = Rent(
-                    dressId=form.dressId.data,
-                    clientId=form.customerId.data,
-                    rentDate=form.rentDate.data,
-                    paymentMethod=form.paymentMethod.data
+            # Checked against every booking of the dress for the whole rent, and committed only
+            # if no other booking of the dress got in first. The dress counters and statuses are
+            # updated by the session hooks in cordelia.models.
+            try:
+                rent = book_rent(
+                    dress_id=form.dressId.data,
+                    client_id=form.customerId.data,
+                    rent_date=form.rentDate.data,
+                    payment_method=form.paymentMethod.data
                 )
-                
-                db.session.add(rent)
-                
-                # Get id from un-committed rent for debugging purposes (cannot retrieve rent.id before commit).
-                provisional_id = Rent.query.order_by(Rent.id.desc()).first()
-                logging.debug(f'Rent {provisional_id} added but not yet committed')
-
-                # Update associated dress
-                dress.update_times_rented()
-                dress.update_rent_status()
-                logging.debug(f"{dress} update_times_rented() method called by created rent {provisional_id}")
-                logging.debug(f"{dress} update_rent_status() method called by created rent {provisional_id}")
-
-                db.session.commit()
+            except BookingError as e:
+                flash(str(e))
+            else:
                 logging.debug(f"{rent} committed")
                 flash(f'{rent} added successfully into the database.')
                 logging.debug(f"{rent} Added from dashboard")
 
-                return redirect(url_for('admin.rent_db')) 
-            else:
-                flash('Dress not available.')
+                return redirect(url_for('admin.rent_db'))
 
     return render_template('admin_views/update.html', title=title, form_type=form_type, form=form)
 
@@ -466,7 +562,7 @@ def add_maintenance():
         dress_id = dress_id_form.dress_id.data
         if dress_id:
             dress = Dress.query.get(dress_id)
-            if dress and not dress.check_status() and not dress.check_maintenance_status() and not dress.sold:
+            if dress and not dress.rentStatus and not dress.maintenanceStatus and not dress.sold:
                 selected_dresses.append(dress)
             else:
                 flash('One or more dresses are unavaiable.', 'error')
@@ -483,11 +579,7 @@ def add_maintenance():
         dresses=selected_dresses 
     )
 
-    # Update maintenance status for selected dresses
-    for dress in selected_dresses:
-        if dress and not dress.rentStatus:
-            dress.update_maintenance_status()
-
+    # The maintenance status of the selected dresses is updated on flush
     db.session.add(maintenance)
     db.session.commit()
     flash('Maintenance record updated successfully!', 'success')
@@ -504,7 +596,7 @@ def delete_object(dataBase, id):
     if dataBase == 'Dress':
         dress = Dress.query.get(int(id))
 
-        if dress and not dress.check_status() and not dress.check_maintenance_status() and not dress.sold:
+        if dress and not dress.rentStatus and not dress.maintenanceStatus and not dress.sold:
             db.session.delete(dress)
             db.session.commit()
             flash(f'{dress} deleted successfully.', 'success')
@@ -518,22 +610,8 @@ def delete_object(dataBase, id):
         rent = Rent.query.get(int(id))
 
         if rent and rent.is_returned():
-            # Store dress ID and customer ID before deleting rent object
-            dress_id = rent.dressId
-
+            # The associated dress is updated by the session hooks when the rent is deleted
             db.session.delete(rent)
-
-            associated_dress = Dress.query.get(dress_id)
-
-            if associated_dress:
-                associated_dress.update_times_rented()
-                associated_dress.update_rent_status()
-                
-                logging.debug(f"update_times_rented() method called for {associated_dress}. After {rent} deletion.")
-                logging.debug(f"update_rent_status() method called for {associated_dress}. After {rent} deletion.")
-            else:
-                flash(f'{associated_dress} not found.', 'danger')
-
             db.session.commit()
 
             flash(f'{rent} deleted successfully.', 'success')
@@ -561,16 +639,7 @@ def delete_object(dataBase, id):
         maintenance = Maintenance.query.get(int(id))
 
         if maintenance and maintenance.is_returned():
-            dresses = maintenance.dresses
-
             db.session.delete(maintenance)
-
-            associated_dresses = Dress.query.filter(Dress.id.in_([dress.id for dress in dresses])).all()
-
-            if associated_dresses:
-                for dress in associated_dresses:
-                    dress.update_maintenance_status()
-
             db.session.commit()
 
             flash(f'{maintenance} deleted successfully.', 'success')
@@ -598,19 +667,29 @@ def delete_object(dataBase, id):
 
 
 
+@adminBp.route('/lookup/<string:kind>', methods=['GET'])
+@login_required
+def lookup(kind):
+    from cordelia.lookup import LOOKUPS, LOOKUP_LIMIT, lookup
+
+    if kind not in LOOKUPS:
+        abort(404)
+
+    limit = min(request.args.get('limit', LOOKUP_LIMIT, type=int), 50)
+
+    return jsonify({'results': lookup(kind, request.args.get('q', ''), limit)})
+
+
 @adminBp.route('/sell-dress/', methods=['GET', 'POST'])
 def sell_dress():
     form = SaleForm()
 
     if form.validate_on_submit():
-        dress_id = form.dress_id.data
-        dress = Dress.query.get_or_404(dress_id)
+        # The form has checked that both ids exist
+        dress = db.session.get(Dress, form.dress_id.data)
 
         if not dress.sold and not dress.rentStatus and not dress.maintenanceStatus:
-            # Mark the dress as sold
-            dress.sold = True
-
-            # Create a new entry in the Sale model
+            # Create a new entry in the Sale model, the dress is marked as sold on flush
             sale = Sale(
                 dress_id=dress.id,
                 customer_id=form.customer_id.data,
@@ -625,6 +704,9 @@ def sell_dress():
             return redirect(url_for('admin.dress_db'))
         else:
             flash('Dress is already sold or has other active status', 'warning')
+    else:
+        for errors in form.errors.values():
+            flash(' '.join(errors), 'danger')
 
     return redirect(url_for('admin.dress_db'))
 
@@ -637,17 +719,46 @@ def sell_dress():
 @login_required
 @admin_required
 def display_plot(img_num):
-    if Dress.query.first() and Rent.query.first() and Customer.query.first() and Maintenance.query.first():
-        
-        from cordelia.plots import costs_vs_earnings, top_customers, plot_combined_statistics
-
-        if img_num == 1:
-            image_data = costs_vs_earnings()  
-        elif img_num == 2:
-            image_data = top_customers()
-        elif img_num == 3:
-            image_data = plot_combined_statistics()
-    
-        return render_template('admin_views/plots.html', image_data=image_data)
+    from cordelia.plots import PLOTS, render_plot
+
+    # The image itself is served by plot_image so browsers can cache it. It is rendered here
+    # first, into the plot cache, to show the no data message instead of a broken image.
+    image_url = None
+    if img_num in PLOTS and render_plot(img_num) is not None:
+        image_url = url_for('admin.plot_image', img_num=img_num)
+
+    return render_template('admin_views/plots.html', image_url=image_url)
+
+
+
+@adminBp.route('/dashboard/plot/<int:img_num>/image', methods=['GET'])
+@login_required
+@admin_required
+def plot_image(img_num):
+    from cordelia.plots import PLOTS, IMAGE_FORMATS, IMAGE_DPIS, plot_version, plot_modified, render_plot
+
+    image_format = request.args.get('format', 'png')
+    dpi = request.args.get('dpi', 100, type=int)
+
+    if img_num not in PLOTS or image_format not in IMAGE_FORMATS or dpi not in IMAGE_DPIS:
+        abort(404)
+
+    etag = sha1(repr(plot_version(img_num, image_format, dpi)).encode()).hexdigest()
+    last_modified = plot_modified(img_num)
+
+    # Answer revalidations without rendering anything
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = Response(status=304)
     else:
-        return render_template('admin_views/plots.html')
\ No newline at end of file
+        image_data = render_plot(img_num, image_format, dpi)
+        if image_data is None:
+            abort(404)
+        response = Response(image_data, mimetype=IMAGE_FORMATS[image_format])
+
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.max_age = 0
+    response.cache_control.must_revalidate = True
+
+    return response
@@ -0,0 +1,137 @@
+import threading
+from functools import partial
+import pandas as pd
+from cordelia.db import db, get_data_version, get_table_modified
+from cordelia.models import Dress, Rent, Maintenance, Sale
+from cordelia.loaders import load_table, read_select
+
+
+# Lazily built DataFrames for the dashboard plots. Each dataset is cached together with the
+# version of the tables it reads and only rebuilt after one of those tables changed.
+class AnalyticsData:
+    def __init__(self):
+        self._loaders = {}
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def dataset(self, name, tables):
+        # Decorator registering the function that builds a dataset from the given tables
+        def decorator(loader):
+            self._loaders[name] = (tables, loader)
+            return loader
+        return decorator
+
+    def get(self, name):
+        tables, loader = self._loaders[name]
+        version = get_data_version(*tables)
+
+        with self._lock:
+            cached = self._frames.get(name)
+
+            if cached is None or cached[0] != version:
+                cached = (version, loader())
+                self._frames[name] = cached
+
+        # Hand out a copy so callers can add columns without touching the cached frame
+        return cached[1].copy()
+
+    def version(self, *names):
+        # Combined version of the tables behind the given datasets
+        tables = sorted({table for name in names for table in self._loaders[name][0]})
+        return get_data_version(*tables)
+
+    def modified(self, *names):
+        # Time of the last write to the tables behind the given datasets
+        tables = {table for name in names for table in self._loaders[name][0]}
+        return get_table_modified(*tables)
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+
+
+analytics = AnalyticsData()
+
+
+# Whole tables, read column-wise through the shared loader
+for table_name in ('dress', 'customer', 'rent', 'maintenance', 'sale'):
+    analytics.dataset(table_name, tables=[table_name])(partial(load_table, table_name))
+
+
+# Aggregated datasets for the charts. Grouping happens in SQL so only a few dozen rows
+# reach pandas no matter how long the rent history is.
+WEEKDAYS = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+
+
+def by_month(column):
+    return db.func.strftime('%Y-%m', column).label('month')
+
+
+def month_index(frame):
+    # Index a frame on its 'YYYY-MM' month column as monthly periods
+    frame.index = pd.PeriodIndex(frame.pop('month'), freq='M', name='YearMonth')
+    return frame
+
+
+@analytics.dataset('rents_by_month', tables=['rent'])
+def load_rents_by_month():
+    month = by_month(Rent.rentDate)
+    statement = db.select(
+        month,
+        db.func.count(Rent.id).label('Rents'),
+        db.func.sum(Rent.paymentTotal).label('Earnings')
+    ).group_by(month).order_by(month)
+
+    return month_index(read_select(statement))
+
+
+@analytics.dataset('costs_by_month', tables=['maintenance', 'dress', 'sale'])
+def load_costs_by_month():
+    totals = {
+        'Maintenance Costs': (Maintenance.date, Maintenance.cost),
+        'Dress Acquisition Costs': (Dress.dateAdded, Dress.cost),
+        'Sales': (Sale.sale_date, Sale.sale_price),
+    }
+
+    series = {}
+    for name, (date_column, amount_column) in totals.items():
+        month = by_month(date_column)
+        statement = db.select(month, db.func.sum(amount_column).label(name)).group_by(month)
+        series[name] = month_index(read_select(statement))[name]
+
+    return pd.DataFrame(series, columns=list(totals))
+
+
+def load_top_customers(order_by, limit=15):
+    total_rentals = db.func.count(Rent.id).label('Total Rentals')
+    total_spending = db.func.sum(Rent.paymentTotal).label('Total Spending')
+
+    statement = db.select(
+        Rent.clientId.label('Customer Id'), total_rentals, total_spending
+    ).group_by(Rent.clientId).order_by(
+        (total_rentals if order_by == 'rentals' else total_spending).desc(), Rent.clientId
+    ).limit(limit)
+
+    return read_select(statement).set_index('Customer Id')
+
+
+@analytics.dataset('top_customers_by_rentals', tables=['rent'])
+def load_top_customers_by_rentals():
+    return load_top_customers('rentals')
+
+
+@analytics.dataset('top_customers_by_spending', tables=['rent'])
+def load_top_customers_by_spending():
+    return load_top_customers('spending')
+
+
+@analytics.dataset('rents_by_weekday', tables=['rent'])
+def load_rents_by_weekday():
+    weekday = db.func.strftime('%w', Rent.rentDate).label('Weekday')
+    rents = db.func.count(Rent.id).label('Rents')
+    statement = db.select(weekday, rents).group_by(weekday).order_by(rents.desc())
+
+    frame = read_select(statement)
+    frame['Weekday'] = [WEEKDAYS[int(day)] for day in frame['Weekday']]
+
+    return frame.set_index('Weekday')
@@ -0,0 +1,114 @@
+from datetime import timedelta
+from sqlalchemy import and_, or_, union
+from cordelia.db import db, get_data_version
+from cordelia.models import Dress, Rent, Maintenance, maintenance_association
+from cordelia.cache import LRUCache
+
+
+# Availability of dresses over a date range. A dress is busy on the days of its rents
+# (rentDate to returnDate) and maintenances (date to returnDate), both ends included,
+# and a range is free when no such interval overlaps it: start <= end_of_range and
+# end >= start_of_range.
+#
+# Only the start of an interval is indexed, so the lookups also bound it from below with the
+# longest interval on record: an overlapping interval can't start more than that many days
+# before the range. Both checks are then index range scans over a few days of bookings,
+# however long the history. The longest interval is cached on the table version, which
+# moves with writes from any process, so a long rent added elsewhere widens the bound too.
+
+# Longest interval in days, by table and table version
+max_duration_cache = LRUCache(maxsize=16)
+
+
+def max_duration(start_column, end_column):
+    table_name = start_column.table.name
+    key = (table_name, get_data_version(table_name))
+
+    days = max_duration_cache.get(key)
+    if days is None:
+        statement = db.select(db.func.max(db.func.julianday(end_column) - db.func.julianday(start_column)))
+        days = int(db.session.execute(statement).scalar() or 0)
+        max_duration_cache.set(key, days)
+
+    return timedelta(days=days)
+
+
+def overlap_criteria(start_column, end_column, start, end):
+    lowest_start = start - max_duration(start_column, end_column)
+    return and_(start_column >= lowest_start, start_column <= end, end_column >= start)
+
+
+def open_rent_criteria(end):
+    # A rent without a return date is still out
+    return and_(Rent.returnDate.is_(None), Rent.rentDate <= end)
+
+
+def busy_rents(start, end):
+    # Rents of deleted dresses keep a NULL dressId, which would make the NOT IN of
+    # available_dresses_query false for every dress
+    return db.select(Rent.dressId.label('dress_id')).where(
+        Rent.dressId.isnot(None),
+        or_(overlap_criteria(Rent.rentDate, Rent.returnDate, start, end), open_rent_criteria(end))
+    )
+
+
+def busy_maintenances(start, end):
+    return db.select(maintenance_association.c.dress_id).join(
+        Maintenance, maintenance_association.c.maintenance_id == Maintenance.id
+    ).where(
+        overlap_criteria(Maintenance.date, Maintenance.returnDate, start, end)
+    )
+
+
+def busy_dress_ids(start, end):
+    # Ids of the dresses rented or in maintenance on any day from start to end
+    return union(busy_rents(start, end), busy_maintenances(start, end))
+
+
+def available_dresses_query(start, end, size=None, style=None):
+    query = Dress.query.filter(
+        Dress.sold.isnot(True),
+        Dress.id.notin_(busy_dress_ids(start, end))
+    )
+
+    if size is not None:
+        query = query.filter(Dress.size == size)
+    if style:
+        query = query.filter(Dress.style == style)
+
+    return query
+
+
+def available_dresses(start, end, size=None, style=None):
+    return available_dresses_query(start, end, size, style).order_by(Dress.id).all()
+
+
+def conflicting_bookings(dress_id, start, end, exclude_rent_id=None):
+    # Rents and maintenances of a dress overlapping start to end, oldest first. The rents take
+    # two queries so the bounded one seeks the interval index from both sides.
+    rent_query = Rent.query.filter(
+        Rent.dressId == dress_id,
+        overlap_criteria(Rent.rentDate, Rent.returnDate, start, end)
+    ).union(
+        Rent.query.filter(Rent.dressId == dress_id, open_rent_criteria(end))
+    )
+    if exclude_rent_id is not None:
+        rent_query = rent_query.filter(Rent.id != exclude_rent_id)
+
+    maintenance_query = Maintenance.query.join(
+        maintenance_association, maintenance_association.c.maintenance_id == Maintenance.id
+    ).filter(
+        maintenance_association.c.dress_id == dress_id,
+        overlap_criteria(Maintenance.date, Maintenance.returnDate, start, end)
+    )
+
+    bookings = rent_query.all() + maintenance_query.all()
+    return sorted(bookings, key=lambda booking: booking.rentDate if isinstance(booking, Rent) else booking.date)
+
+
+def is_available(dress_id, start, end, exclude_rent_id=None):
+    dress = db.session.get(Dress, dress_id)
+    if dress is None or dress.sold:
+        return False
+
+    return not conflicting_bookings(dress_id, start, end, exclude_rent_id)
@@ -0,0 +1,80 @@
+import time
+import random
+import logging
+from flask import current_app
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm.exc import StaleDataError
+from cordelia.db import db
+from cordelia.models import Dress, Rent, RENT_DURATION
+from cordelia.availability import is_available
+
+
+# Booking transactions. A rent is checked and written against the version of the dress it
+# was read at: recording it updates the dress counters with a WHERE on that version, so when
+# two bookings of the same dress race, the second one to flush updates no row and fails with
+# StaleDataError instead of double booking. Conflicts and SQLite "database is locked" errors
+# are retried a few times with a growing, jittered delay, re-checking availability each time.
+
+
+class BookingError(Exception):
+    pass
+
+
+class BookingConflict(BookingError):
+    pass
+
+
+def is_retryable(error):
+    if isinstance(error, StaleDataError):
+        return True
+    if isinstance(error, OperationalError):
+        message = str(error.orig).lower()
+        return 'locked' in message or 'busy' in message
+    return False
+
+
+def run_with_retry(transaction, attempts=None, base_delay=None):
+    # Run transaction() and commit, starting over from a clean session on a conflict
+    attempts = attempts or current_app.config['BOOKING_ATTEMPTS']
+    base_delay = base_delay if base_delay is not None else current_app.config['BOOKING_RETRY_DELAY']
+
+    for attempt in range(1, attempts + 1):
+        try:
+            result = transaction()
+            db.session.commit()
+            return result
+        except (StaleDataError, OperationalError) as e:
+            db.session.rollback()
+            if not is_retryable(e):
+                raise
+            if attempt == attempts:
+                logging.debug(f'Booking transaction gave up after {attempts} attempts: {e}')
+                raise BookingConflict('The dress is being booked by someone else, please try again.') from e
+
+            # Exponential backoff with full jitter, so the losers don't collide again
+            time.sleep(random.uniform(0, base_delay * 2 ** (attempt - 1)))
+        except BaseException:
+            db.session.rollback()
+            raise
+
+
+def book_rent(dress_id, client_id, rent_date, payment_method=None):
+    # Add a rent if the dress is free for its whole duration. Raises BookingError when it
+    # isn't and BookingConflict when the retries run out.
+    def transaction():
+        # Read the dress, and so its version, fresh in this attempt
+        dress = db.session.get(Dress, dress_id, populate_existing=True)
+        if dress is None:
+            raise BookingError('Dress not found.')
+
+        if not is_available(dress_id, rent_date, rent_date + RENT_DURATION):
+            raise BookingError('Dress not available for those dates.')
+
+        rent = Rent(dressId=dress_id, clientId=client_id, rentDate=rent_date, paymentMethod=payment_method)
+        db.session.add(rent)
+        # The dress counters are updated in this flush, on the version read above
+        db.session.flush()
+
+        return rent
+
+    return run_with_retry(transaction)
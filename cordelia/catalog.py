@@ -0,0 +1,124 @@
+from sqlalchemy import and_, not_, desc
+from cordelia.db import db, get_data_version
+from cordelia.models import Dress
+from cordelia.cache import LRUCache
+from cordelia.pagination import paginate
+
+
+# Public catalog of the dresses for rent. Listings are keyset paginated and filtered on
+# indexed columns, and the facet counts are one GROUP BY per facet, cached until the
+# dress table changes, so a page costs the same however large the inventory.
+
+CATALOG_PER_PAGE = 24
+
+# Filterable columns, each gets a facet listing its values with the number of dresses
+CATALOG_FACETS = {
+    'size': Dress.size,
+    'color': Dress.color,
+    'style': Dress.style,
+    'brand': Dress.brand,
+}
+
+CATALOG_SORTS = {
+    'newest': [desc(Dress.dateAdded)],
+    'price': [Dress.rentPrice],
+    'price_desc': [desc(Dress.rentPrice)],
+    'popularity': [desc(Dress.timesRented)],
+}
+
+is_available = and_(not_(Dress.rentStatus), not_(Dress.maintenanceStatus))
+
+# Facet counts and price bounds by (facet, filters, dress table version)
+facet_cache = LRUCache(maxsize=512)
+
+
+def catalog_filters(args):
+    # Filters of a catalog request, as plain values usable in cache keys
+    filters = {}
+
+    for name, column in CATALOG_FACETS.items():
+        values = args.getlist(name, type=int if name == 'size' else str)
+        values = sorted({value for value in values if value not in (None, '')})
+        if values:
+            filters[name] = tuple(values)
+
+    for name in ('min_price', 'max_price'):
+        value = args.get(name, type=int)
+        if value is not None:
+            filters[name] = value
+
+    if args.get('available') == '1':
+        filters['available'] = True
+
+    return filters
+
+
+def filter_criteria(filters, exclude=None):
+    # Sold dresses are never listed. exclude leaves a facet's own filter out, so its
+    # counts show what choosing another value would give.
+    criteria = [Dress.sold.isnot(True)]
+
+    for name, column in CATALOG_FACETS.items():
+        if name in filters and name != exclude:
+            criteria.append(column.in_(filters[name]))
+
+    if 'min_price' in filters:
+        criteria.append(Dress.rentPrice >= filters['min_price'])
+    if 'max_price' in filters:
+        criteria.append(Dress.rentPrice <= filters['max_price'])
+    if filters.get('available') and exclude != 'available':
+        criteria.append(is_available)
+
+    return criteria
+
+
+def cached(key, compute):
+    key = key + (get_data_version(Dress.__tablename__),)
+
+    value = facet_cache.get(key)
+    if value is None:
+        value = compute()
+        facet_cache.set(key, value)
+
+    return value
+
+
+def filters_key(filters, exclude=None):
+    return tuple(sorted((name, value) for name, value in filters.items() if name != exclude))
+
+
+def facet_counts(filters):
+    # {facet: [(value, count), ...]} for every facet, plus the available count
+    def count_values(name, column):
+        statement = db.select(column, db.func.count()).where(
+            *filter_criteria(filters, exclude=name)
+        ).group_by(column).order_by(column)
+        return [tuple(row) for row in db.session.execute(statement)]
+
+    def count_available():
+        statement = db.select(db.func.count()).where(*filter_criteria(filters, exclude='available'), is_available)
+        return db.session.execute(statement).scalar()
+
+    facets = {
+        name: cached(('facet', name, filters_key(filters, name)), lambda: count_values(name, column))
+        for name, column in CATALOG_FACETS.items()
+    }
+    facets['available'] = cached(('available', filters_key(filters, 'available')), count_available)
+
+    return facets
+
+
+def price_range():
+    # Lowest and highest rent price in the catalog, for the price filter
+    def compute():
+        statement = db.select(db.func.min(Dress.rentPrice), db.func.max(Dress.rentPrice)).where(Dress.sold.isnot(True))
+        return tuple(db.session.execute(statement).one())
+
+    return cached(('price_range',), compute)
+
+
+def catalog_page(filters, sort='newest', per_page=CATALOG_PER_PAGE):
+    query = Dress.query.filter(*filter_criteria(filters))
+    order_by = CATALOG_SORTS.get(sort, CATALOG_SORTS['newest'])
+
+    return paginate(query, order_by, per_page=per_page)
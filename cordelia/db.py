@@ -1,7 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask import current_app
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, event
 from sqlalchemy.orm import scoped_session, sessionmaker
+from datetime import datetime
+import threading
 import click
 from flask.cli import with_appcontext
 
@@ -10,6 +12,128 @@ from flask.cli import with_appcontext
 db = SQLAlchemy()
 
 
+# Per-table change counters, kept in the database itself in the data_version table and bumped
+# by triggers on every insert, update and delete. Writes from other workers, the CLI commands
+# or plain SQL are counted the same as the ones of this process, and the counters survive
+# restarts. Caches key their entries on these versions so they rebuild only after a relevant
+# write.
+#
+# A named group of columns (see track_columns) has a counter of its own, bumped only when a row
+# is added or removed or one of those columns changes, for caches reading a few columns of a
+# table that is written often.
+data_version = db.Table(
+    'data_version',
+    db.Column('name', db.String(64), primary_key=True),
+    db.Column('version', db.Integer, nullable=False),
+    # Time of the last bump, also tells apart the counters of a recreated database
+    db.Column('modified', db.String(26), nullable=False),
+)
+
+# Column groups by name, as (table name, column names)
+column_groups = {}
+
+versions_started = datetime.utcnow()
+_tracked_databases = set()
+_versions_lock = threading.Lock()
+
+
+def track_columns(name, table, columns):
+    column_groups[name] = (table.name, list(columns))
+
+
+def version_triggers(name, table_name, columns=None):
+    # {trigger name: (table name, DDL)} of the triggers bumping the counter called name
+    bump = (
+        f"INSERT INTO data_version (name, version, modified) "
+        f"VALUES ('{name}', 1, strftime('%Y-%m-%d %H:%M:%f', 'now')) "
+        f"ON CONFLICT (name) DO UPDATE SET version = version + 1, modified = excluded.modified;"
+    )
+    update_of = ' OF ' + ', '.join(f'"{column}"' for column in columns) if columns else ''
+
+    triggers = {}
+    for suffix, trigger_event in [('ai', 'AFTER INSERT'), ('au', f'AFTER UPDATE{update_of}'), ('ad', 'AFTER DELETE')]:
+        trigger = f'{name}_version_{suffix}'
+        triggers[trigger] = (table_name, f'CREATE TRIGGER IF NOT EXISTS "{trigger}" {trigger_event} ON "{table_name}" BEGIN {bump} END')
+    return triggers
+
+
+def version_tracking_ddl():
+    # Triggers of every mapped table and column group
+    triggers = {}
+    for table in db.metadata.sorted_tables:
+        if table is not data_version:
+            triggers.update(version_triggers(table.name, table.name))
+    for name, (table_name, columns) in column_groups.items():
+        triggers.update(version_triggers(name, table_name, columns))
+    return triggers
+
+
+def install_version_tracking(connection):
+    # Create the data_version table and the missing triggers of the existing tables
+    if connection.dialect.name != 'sqlite':
+        return
+
+    data_version.create(connection, checkfirst=True)
+    existing_tables = set(inspect(connection).get_table_names())
+    for table_name, ddl in version_tracking_ddl().values():
+        if table_name in existing_tables:
+            connection.exec_driver_sql(ddl)
+
+
+@event.listens_for(db.metadata, 'after_create')
+def create_version_tracking(target, connection, **kw):
+    install_version_tracking(connection)
+
+
+def ensure_version_tracking():
+    # Install the tracking on databases created before it, once per database and process
+    url = db.engine.url.render_as_string()
+    if url in _tracked_databases:
+        return
+
+    with _versions_lock:
+        if url not in _tracked_databases:
+            with db.engine.connect() as connection:
+                existing = set(connection.exec_driver_sql(
+                    "SELECT name FROM sqlite_master WHERE type = 'trigger'"
+                ).scalars()) if connection.dialect.name == 'sqlite' else None
+            if existing is not None and not set(version_tracking_ddl()) <= existing:
+                with db.engine.begin() as connection:
+                    install_version_tracking(connection)
+            _tracked_databases.add(url)
+
+
+def read_versions(names):
+    # {name: (version, modified)} of the committed counters, read on a connection of its own
+    # so the uncommitted writes of the session don't count
+    ensure_version_tracking()
+    statement = db.select(data_version).where(data_version.c.name.in_(names))
+    with db.engine.connect() as connection:
+        return {name: (version, modified) for name, version, modified in connection.execute(statement)}
+
+
+def get_table_version(*table_names):
+    # Current version of one or more tables or column groups, usable as a cache key
+    versions = read_versions(table_names)
+    return tuple(versions.get(name, (0, None)) for name in table_names)
+
+
+def get_data_version(*table_names):
+    # Cache key for data read from the tables, also tied to the database the app is bound to
+    return (db.engine.url.render_as_string(),) + get_table_version(*table_names)
+
+
+def get_table_modified(*table_names):
+    # Time of the last committed write to any of the tables, tables not written since the
+    # tracking was installed are reported as modified when the process started
+    versions = read_versions(table_names)
+    times = [
+        datetime.fromisoformat(versions[name][1]) if name in versions else versions_started
+        for name in table_names
+    ]
+    return max(times) if times else versions_started
+
+
 def get_engine(app):
     # Get the SQLAlchemy engine for the current app
     engine = getattr(app, '_engine', None)
@@ -42,6 +166,9 @@ def close_session(e=None):
 
 def init_db(app):
     with app.app_context():
+        # The full-text indexes are created along with the tables they cover
+        import cordelia.search  # noqa: F401
+
         # Create all the database tables based on the defined models
         db.create_all()
 
@@ -61,6 +188,44 @@ def init_db(app):
         db.session.commit()
 
 
+def add_missing_columns(table):
+    # Add the columns (and their indexes) that a model gained after its table was created.
+    # db.create_all() only creates missing tables, so existing databases need this step.
+    existing_columns = {column['name'] for column in inspect(db.engine).get_columns(table.name)}
+    existing_indexes = {index['name'] for index in inspect(db.engine).get_indexes(table.name)}
+
+    added = []
+    with db.engine.begin() as connection:
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+            if column.server_default is not None:
+                ddl += f' DEFAULT {column.server_default.arg}'
+            connection.exec_driver_sql(ddl)
+            added.append(column.name)
+
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(connection)
+
+    return added
+
+
+def backfill_dress_db():
+    from cordelia.models import Dress, Rent, maintenance_association
+
+    add_missing_columns(Dress.__table__)
+    # Interval indexes of the availability checks
+    add_missing_columns(Rent.__table__)
+    add_missing_columns(maintenance_association)
+    updated = Dress.backfill_last_activity()
+    db.session.commit()
+
+    return updated
+
+
 # Command to initialize the database
 @click.command('init-db')
 @with_appcontext
@@ -69,6 +234,23 @@ def init_db_command():
     click.echo('Initialized the database.')
     
 
+# Command to add and fill the denormalized dress columns on an existing database.
+@click.command('backfill-dress-db')
+@with_appcontext
+def backfill_dress_db_command():
+    updated = backfill_dress_db()
+    click.echo(f'Backfilled {updated} dresses.')
+
+
+# Command to create the full-text search indexes on an existing database and reindex every row.
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    from cordelia.search import rebuild_search_indexes
+    rebuild_search_indexes()
+    click.echo('Rebuilt the search indexes.')
+
+
 # Command to populate the database with sample data.
 @click.command('populate-db')
 @with_appcontext
@@ -86,5 +268,9 @@ def init_app(app):
     app.teardown_appcontext(close_session)
     # Add the init-db command to the app's CLI
     app.cli.add_command(init_db_command)
+    # Add the backfill-dress-db command to the app's CLI
+    app.cli.add_command(backfill_dress_db_command)
+    # Add the rebuild-search-index command to the app's CLI
+    app.cli.add_command(rebuild_search_index_command)
     # Add the populate-db command to the app's CLI
     app.cli.add_command(populate_db_command)
\ No newline at end of file
@@ -0,0 +1,168 @@
+from flask import Response, stream_with_context
+from importlib.util import find_spec
+from datetime import date, datetime
+from functools import partial
+import pandas as pd
+import zipfile
+import gzip
+import json
+import csv
+import io
+from cordelia.loaders import table_labels, table_dtypes, apply_dtypes
+from cordelia.excel import EXPORT_SHEETS, export_rows, write_workbook, excel_download
+
+
+# Write-only file object collecting what zipfile / gzip write so a generator can hand it out.
+# It has no tell() or seek(), which makes zipfile write streaming data descriptors.
+class StreamBuffer:
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def generate_csv_zip(progress=None):
+    # One CSV per table in a zip, each chunk of rows is compressed and sent as soon as it is read
+    buffer = StreamBuffer()
+
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, sheet_name in EXPORT_SHEETS:
+            with archive.open(f'{sheet_name}.csv', 'w', force_zip64=True) as entry:
+                text = io.StringIO()
+                writer = csv.writer(text)
+                writer.writerow(table_labels(name))
+
+                for rows in export_rows(name, progress=progress):
+                    writer.writerows(rows)
+                    entry.write(text.getvalue().encode('utf-8'))
+                    text.seek(0)
+                    text.truncate()
+
+                    yield buffer.drain()
+
+                entry.write(text.getvalue().encode('utf-8'))
+
+            yield buffer.drain()
+
+    yield buffer.drain()
+
+
+def generate_ndjson(progress=None):
+    # One JSON object per row, tagged with the table it comes from
+    for name, sheet_name in EXPORT_SHEETS:
+        labels = table_labels(name)
+
+        for rows in export_rows(name, progress=progress):
+            lines = [
+                json.dumps({'table': name, **dict(zip(labels, row))}, default=json_default)
+                for row in rows
+            ]
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def generate_ndjson_gzip(progress=None):
+    buffer = StreamBuffer()
+
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as compressed:
+        for data in generate_ndjson(progress):
+            compressed.write(data)
+            yield buffer.drain()
+
+    yield buffer.drain()
+
+
+def export_frame(name, progress=None):
+    # Whole table as a typed DataFrame, built from the same chunks as the streamed formats
+    labels = table_labels(name)
+    frames = [pd.DataFrame(rows, columns=labels) for rows in export_rows(name, progress=progress)]
+    frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=labels)
+    return apply_dtypes(frame, table_dtypes(name))
+
+
+def generate_snapshot(file_format, progress=None):
+    # Parquet / Feather files are columnar and written whole, so each table is built in memory
+    # one at a time and added to a zip that streams out between tables
+    buffer = StreamBuffer()
+
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, sheet_name in EXPORT_SHEETS:
+            frame = export_frame(name, progress)
+
+            data = io.BytesIO()
+            if file_format == 'parquet':
+                frame.to_parquet(data, index=False)
+            else:
+                frame.to_feather(data)
+
+            archive.writestr(f'{sheet_name}.{file_format}', data.getvalue())
+            yield buffer.drain()
+
+    yield buffer.drain()
+
+
+# Export formats as (mimetype, file extension, generator of the response body)
+EXPORT_FORMATS = {
+    'csv': ('application/zip', 'csv.zip', generate_csv_zip),
+    'ndjson': ('application/x-ndjson', 'ndjson', generate_ndjson),
+    'ndjson.gz': ('application/gzip', 'ndjson.gz', generate_ndjson_gzip),
+    'parquet': ('application/zip', 'parquet.zip', partial(generate_snapshot, 'parquet')),
+    'feather': ('application/zip', 'feather.zip', partial(generate_snapshot, 'feather')),
+}
+
+# Parquet and Feather are written by pyarrow, they are left out on installs that lack it
+SNAPSHOT_FORMATS = ('parquet', 'feather')
+
+
+def available_formats():
+    formats = ['xlsx'] + list(EXPORT_FORMATS)
+    if find_spec('pyarrow') is None:
+        formats = [export_format for export_format in formats if export_format not in SNAPSHOT_FORMATS]
+    return formats
+
+
+def export_extension(export_format):
+    return 'xlsx' if export_format == 'xlsx' else EXPORT_FORMATS[export_format][1]
+
+
+def write_export(export_format, output, progress=None):
+    # Write a whole export into a binary file object, used by the background export jobs
+    if export_format == 'xlsx':
+        write_workbook(output, progress=progress)
+        return
+
+    generate = EXPORT_FORMATS[export_format][2]
+    for data in generate(progress):
+        output.write(data)
+
+
+def export_download(export_format='xlsx'):
+    if export_format == 'xlsx':
+        return excel_download()
+
+    mimetype, extension, generate = EXPORT_FORMATS[export_format]
+
+    current_datetime = datetime.now().strftime('%B-%d-%Y_%H-%M-%S')
+
+    file_name = f'database_data_{current_datetime}.{extension}'
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={file_name}'}
+    )
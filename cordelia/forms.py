@@ -4,12 +4,17 @@ from wtforms import (
     SelectField, DateField, HiddenField, FileField, FieldList, FormField
     )
 from wtforms.validators import DataRequired, Email, EqualTo, ValidationError, Optional
-from flask_wtf.file import FileAllowed
+from flask_wtf.file import FileAllowed, FileRequired
 import phonenumbers
 from phonenumbers.phonenumberutil import NumberParseException
+from cordelia.db import db
 from cordelia.models import User, Customer, Dress
 
 
+# Rent.paymentMethod values
+PAYMENT_METHOD_CHOICES = [('Transfer', 'Transfer'), ('Cash', 'Cash'), ('Credit Card', 'Credit Card')]
+
+
 class RegistrationForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired()])
     email = StringField('Email', validators=[DataRequired(), Email()])
@@ -60,9 +65,12 @@ class SearchForm(FlaskForm):
     search = StringField('Search')
     submit = SubmitField('Filter')
     
-    def __init__(self, model_columns, *args, **kwargs):
+    def __init__(self, model_columns, *args, text_search=False, **kwargs):
         super(SearchForm, self).__init__(*args, **kwargs)
         self.category.choices = [('Select', 'Select')] + [(column, column) for column in model_columns]
+        # Search every full-text indexed column at once
+        if text_search:
+            self.category.choices.insert(1, ('text', 'All text'))
 
 
 class DressIdForm(FlaskForm):
@@ -80,18 +88,29 @@ class MaintenanceForm(FlaskForm):
 class SaleForm(FlaskForm):
     sale_date = DateField('Sale Date')
     sale_price = IntegerField('Sale Price')
-    dress_id = SelectField('Dress', coerce=int)
-    customer_id = SelectField('Customer', coerce=int)
+    # Picked with the lookup autocomplete, only the submitted ids are checked
+    dress_id = IntegerField('Dress', validators=[DataRequired()])
+    customer_id = IntegerField('Customer', validators=[DataRequired()])
     submit = SubmitField('Submit')
 
-    def __init__(self, *args, **kwargs):
-        super(SaleForm, self).__init__(*args, **kwargs)
+    def validate_dress_id(self, field):
+        if db.session.get(Dress, field.data) is None:
+            raise ValidationError('Dress not found.')
+
+    def validate_customer_id(self, field):
+        if db.session.get(Customer, field.data) is None:
+            raise ValidationError('Customer not found.')
+
+
+class ExportForm(FlaskForm):
+    format = SelectField('Format', choices=[])
+    submit = SubmitField('Export')
 
-        # Populate dress choices
-        self.dress_id.choices = [(dress.id, f'D-{dress.id:02}') for dress in Dress.query.all()]
 
-        # Populate customer choices
-        self.customer_id.choices = [(customer.id, f'C-{customer.id:02}') for customer in Customer.query.all()]
+class ImportForm(FlaskForm):
+    kind = SelectField('Import', choices=[('dress', 'Dresses'), ('customer', 'Customers'), ('rent', 'Rents')])
+    file = FileField('File', validators=[FileRequired(), FileAllowed(['csv', 'xlsx'])])
+    submit = SubmitField('Import')
 
 
 class DeleteForm(FlaskForm):
@@ -143,10 +162,11 @@ class RentForm(FlaskForm):
     customerId = IntegerField('Customer Id', validators=[DataRequired()])
     dressId = IntegerField('Dress Id', validators=[DataRequired()])
     rentDate = DateField('Rent Date', validators=[DataRequired()])
-    paymentMethod = SelectField('Payment Method', choices=[('Transfer', 'Transfer'), ('Cash', 'Cash'), ('Credit Card', 'Credit Card')])
+    paymentMethod = SelectField('Payment Method', choices=PAYMENT_METHOD_CHOICES)
     submit = SubmitField('Submit')
 
 
 class UserRentForm(FlaskForm):
     rentDate = DateField('Rent Date', validators=[DataRequired()])
+    paymentMethod = SelectField('Payment Method', choices=PAYMENT_METHOD_CHOICES, default='Credit Card')
     submit = SubmitField('Check Out')
\ No newline at end of file
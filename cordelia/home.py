@@ -1,8 +1,12 @@
-from flask import Blueprint, render_template, redirect, url_for, flash
+import os
+from datetime import date
+from flask import Blueprint, render_template, redirect, url_for, flash, send_file, abort, request, jsonify
 from flask_login import login_required, current_user
-from cordelia.db import db
 from cordelia.models import Dress, Rent
 from cordelia.forms import UserRentForm
+from cordelia.availability import available_dresses_query
+from cordelia.booking import BookingError, book_rent
+from cordelia.images import ImageError, IMAGE_VARIANT_WIDTHS, image_path, variant_path, file_mimetype
 
 
 homeBp = Blueprint('home', __name__)
@@ -16,9 +20,94 @@ def home():
 
 @homeBp.route('/catalog')
 def catalog():
-    inventory = Dress.query.all()
+    from cordelia.catalog import CATALOG_FACETS, CATALOG_SORTS, catalog_filters, catalog_page, facet_counts, price_range
 
-    return render_template('home_views/catalog.html', inventory=inventory)
+    filters = catalog_filters(request.args)
+    sort = request.args.get('sort', 'newest')
+    if sort not in CATALOG_SORTS:
+        sort = 'newest'
+
+    inventory = catalog_page(filters, sort)
+
+    # Current filters as query arguments, carried over by the pagination links
+    filter_args = {name: list(value) if isinstance(value, tuple) else int(value) for name, value in filters.items()}
+
+    return render_template('home_views/catalog.html',
+                           inventory=inventory,
+                           pagination=inventory,
+                           facets=facet_counts(filters),
+                           facet_names=list(CATALOG_FACETS),
+                           price_range=price_range(),
+                           filters=filters,
+                           filter_args=filter_args,
+                           sort=sort,
+                           sorts=list(CATALOG_SORTS))
+
+
+@homeBp.route('/availability')
+def availability():
+    # Dresses free on every day from start to end, e.g. /availability?start=2023-06-01&end=2023-06-04&size=4
+    try:
+        start = date.fromisoformat(request.args.get('start', ''))
+        end = date.fromisoformat(request.args.get('end') or request.args.get('start', ''))
+    except ValueError:
+        return jsonify({'error': 'start and end must be YYYY-MM-DD dates.'}), 400
+
+    if end < start:
+        return jsonify({'error': 'end is before start.'}), 400
+
+    query = available_dresses_query(start, end, size=request.args.get('size', type=int), style=request.args.get('style'))
+    dress_ids = [dress_id for dress_id, in query.with_entities(Dress.id).order_by(Dress.id)]
+
+    return jsonify({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'count': len(dress_ids),
+        'dresses': dress_ids,
+    })
+
+
+@homeBp.route('/images/<string:image_hash>')
+def dress_image(image_hash):
+    try:
+        path = image_path(image_hash)
+    except ImageError:
+        abort(404)
+
+    if not os.path.exists(path):
+        abort(404)
+
+    # The URL names the content, so it can be cached for good
+    response = send_file(path, mimetype=file_mimetype(path), etag=image_hash, conditional=True, max_age=31536000)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+
+    return response
+
+
+@homeBp.route('/images/<string:image_hash>/<int:width>.webp')
+def dress_image_variant(image_hash, width):
+    if width not in IMAGE_VARIANT_WIDTHS:
+        abort(404)
+
+    try:
+        path = variant_path(image_hash, width)
+    except ImageError:
+        abort(404)
+
+    if not os.path.exists(path):
+        # Still being made, fall back to the original without letting it be cached
+        response = dress_image(image_hash)
+        response.cache_control.immutable = False
+        response.cache_control.max_age = 0
+        response.cache_control.no_cache = True
+        return response
+
+    response = send_file(path, mimetype='image/webp', etag=f'{image_hash}-{width}', conditional=True, max_age=31536000)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+
+    return response
 
 
 @homeBp.route('/cart/<int:dress_id>', methods=['GET', 'POST'])
@@ -34,13 +123,11 @@ def cart(dress_id):
     form = UserRentForm()
 
     if form.validate_on_submit():
-        rent = Rent(
-            dressId=dress.id,
-            clientId=user.id,
-            rentDate=form.rentDate.data
-        )
-        db.session.add(rent)
-        db.session.commit()
+        try:
+            rent = book_rent(dress_id=dress.id, client_id=user.id, rent_date=form.rentDate.data, payment_method=form.paymentMethod.data)
+        except BookingError as e:
+            flash(str(e), 'danger')
+            return render_template('home_views/cart.html', dress=dress, form=form)
 
         flash('Dress added to cart.', 'success')
         return redirect(url_for('home.checkout', rent_id=rent.id))
@@ -52,5 +139,7 @@ def cart(dress_id):
 @login_required
 def checkout(rent_id):
     rent = Rent.query.get(rent_id)
-    
+    if rent is None:
+        abort(404)
+
     return render_template('home_views/checkout.html', rent=rent)
\ No newline at end of file
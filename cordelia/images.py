@@ -0,0 +1,255 @@
+import os
+import re
+import hashlib
+import logging
+import tempfile
+import binascii
+import threading
+from base64 import b64decode
+from concurrent.futures import ProcessPoolExecutor
+import click
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+from cordelia.db import db
+
+
+# Dress photos live on disk under instance/images, named after the SHA-256 of their bytes,
+# and Dress.imageData only keeps that hash. The same photo is stored once, a stored file never
+# changes, and so its URL can be cached by browsers for good.
+
+IMAGE_HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Leading bytes of the accepted image formats
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+
+
+# Widths of the WebP variants made of every photo, pages pick the smallest that fits with srcset
+IMAGE_VARIANT_WIDTHS = [160, 320, 640, 1280]
+
+IMAGE_VARIANT_QUALITY = 80
+
+
+class ImageError(ValueError):
+    pass
+
+
+def image_dir():
+    return os.path.join(current_app.instance_path, 'images')
+
+
+def is_image_hash(value):
+    return bool(value) and IMAGE_HASH_PATTERN.match(value) is not None
+
+
+def image_path(image_hash):
+    if not is_image_hash(image_hash):
+        raise ImageError('Invalid image hash.')
+    # Two levels of folders keep directory listings short
+    return os.path.join(image_dir(), image_hash[:2], image_hash)
+
+
+def variant_path(image_hash, width):
+    return image_path(image_hash) + f'-{width}.webp'
+
+
+def image_mimetype(data):
+    for signature, mimetype in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return mimetype
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def file_mimetype(path):
+    with open(path, 'rb') as file:
+        return image_mimetype(file.read(12))
+
+
+def store_image(data):
+    # Save an image and return its hash. Storing a photo that is already there is a no-op.
+    if image_mimetype(data) is None:
+        raise ImageError('Unsupported image format.')
+
+    image_hash = hashlib.sha256(data).hexdigest()
+    path = image_path(image_hash)
+
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write next to the final path and rename, readers never see a partial file
+        fd, part_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(part_path, path)
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+
+    return image_hash
+
+
+def render_variants(path, widths=IMAGE_VARIANT_WIDTHS, quality=IMAGE_VARIANT_QUALITY):
+    # Write the WebP variants of the photo at path, next to it. Runs in a worker process, so
+    # it only deals with paths. Photos narrower than a width are saved at their own size
+    # rather than upscaled, every width exists once this is done.
+    from PIL import Image, ImageOps
+
+    with Image.open(path) as image:
+        # Let JPEG decode straight at a reduced scale when the photo is much larger than needed
+        image.draft('RGB', (max(widths), max(widths) * 4))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+        # Largest first, each variant is scaled down from the previous one
+        for width in sorted(widths, reverse=True):
+            image.thumbnail((width, width * 4), Image.LANCZOS)
+
+            target = f'{path}-{width}.webp'
+            if os.path.exists(target):
+                continue
+
+            part_path = target + '.part'
+            image.save(part_path, format='WEBP', quality=quality, method=4)
+            os.replace(part_path, target)
+
+    return widths
+
+
+def has_variants(image_hash, widths=IMAGE_VARIANT_WIDTHS):
+    return all(os.path.exists(variant_path(image_hash, width)) for width in widths)
+
+
+# Makes the variants of uploaded photos on a pool of worker processes, so resizing neither holds
+# up the request nor competes with it for the GIL. Until they are ready, the variant URLs fall
+# back to the original photo.
+class ImageVariants:
+    def __init__(self):
+        self.app = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def init_app(self, app):
+        self.app = app
+
+    def submit(self, image_hash):
+        path = image_path(image_hash)
+
+        with self._lock:
+            if image_hash in self._pending:
+                return self._pending[image_hash]
+
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.app.config['IMAGE_VARIANT_WORKERS'])
+
+            future = self._executor.submit(render_variants, path)
+            self._pending[image_hash] = future
+
+        future.add_done_callback(lambda future: self._done(image_hash, future))
+        return future
+
+    def _done(self, image_hash, future):
+        with self._lock:
+            self._pending.pop(image_hash, None)
+
+        if future.exception() is not None:
+            logging.error(f'Could not make the variants of image {image_hash}: {future.exception()}')
+
+
+image_variants = ImageVariants()
+
+
+def stored_hashes():
+    root = image_dir()
+    if not os.path.isdir(root):
+        return
+
+    for folder in sorted(os.listdir(root)):
+        folder_path = os.path.join(root, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        for name in sorted(os.listdir(folder_path)):
+            if is_image_hash(name):
+                yield name
+
+
+def image_url(image_hash, width=None):
+    if width is None:
+        return url_for('home.dress_image', image_hash=image_hash)
+    return url_for('home.dress_image_variant', image_hash=image_hash, width=width)
+
+
+def image_srcset(image_hash):
+    return ', '.join(f'{image_url(image_hash, width)} {width}w' for width in IMAGE_VARIANT_WIDTHS)
+
+
+def migrate_images(batch_size=100):
+    # Move the base64 photos stored in Dress.imageData to the image store. Returns the number
+    # of dresses migrated and the number whose data couldn't be decoded, which are left as is.
+    from cordelia.models import Dress
+
+    migrated, failed = 0, 0
+    last_id = 0
+
+    while True:
+        dresses = Dress.query.filter(
+            Dress.id > last_id,
+            Dress.imageData.isnot(None),
+            db.func.length(Dress.imageData) != 64
+        ).order_by(Dress.id).limit(batch_size).all()
+
+        if not dresses:
+            break
+
+        for dress in dresses:
+            last_id = dress.id
+            try:
+                image_hash = store_image(b64decode(dress.imageData, validate=True))
+                render_variants(image_path(image_hash))
+                dress.imageData = image_hash
+                migrated += 1
+            except (binascii.Error, ImageError, OSError):
+                logging.exception(f'Could not migrate the image of {dress}')
+                failed += 1
+
+        db.session.commit()
+
+    return migrated, failed
+
+
+# Command to move the inline dress photos of an existing database to the image store
+@click.command('migrate-images')
+@with_appcontext
+def migrate_images_command():
+    migrated, failed = migrate_images()
+    click.echo(f'Migrated {migrated} images, {failed} could not be decoded.')
+
+
+# Command to make the missing variants of every stored photo
+@click.command('image-variants')
+@with_appcontext
+def image_variants_command():
+    rendered = 0
+    for image_hash in stored_hashes():
+        if not has_variants(image_hash):
+            render_variants(image_path(image_hash))
+            rendered += 1
+    click.echo(f'Made the variants of {rendered} images.')
+
+
+def init_app(app):
+    app.cli.add_command(migrate_images_command)
+    app.cli.add_command(image_variants_command)
+    image_variants.init_app(app)
+
+    # Templates build <img srcset> attributes with these
+    app.add_template_global(image_url)
+    app.add_template_global(image_srcset)
@@ -0,0 +1,450 @@
+import os
+import json
+import logging
+import zipfile
+from datetime import datetime
+import click
+import pandas as pd
+import phonenumbers
+from phonenumbers.phonenumberutil import NumberParseException
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam
+from sqlalchemy.exc import SQLAlchemyError
+from cordelia.db import db
+from cordelia.models import Dress, Customer, Rent, RENT_DURATION, RENT_TAX_RATE
+from cordelia.loaders import TABLE_COLUMNS
+
+
+# Bulk import of dresses, customers and rents from CSV or XLSX files, e.g. the history of a new
+# store. A file is read into a DataFrame and checked a whole column at a time: numbers and
+# dates are parsed with pandas, emails with one regex over the column and phone numbers once
+# per distinct value. Duplicates are looked up with one IN query per unique column. The rows
+# that pass are written IMPORT_CHUNK_SIZE at a time, one statement and commit per chunk, and
+# the ones that don't are reported by file line and column.
+#
+# Headers can be the column names of the models (rentPrice) or the labels of the exports
+# (Rent Price), so an export can be imported back as is.
+
+IMPORT_FORMATS = ['csv', 'xlsx']
+
+# Rows per INSERT and commit
+IMPORT_CHUNK_SIZE = 5000
+
+# Region assumed for phone numbers without a country code, as in CustomerForm
+PHONE_REGION = 'MX'
+
+# Same choices as RentForm
+PAYMENT_METHODS = ['Transfer', 'Cash', 'Credit Card']
+
+EMAIL_PATTERN = r'^[^@\s]+@[^@\s]+\.[^@\s]+$'
+
+# Importable columns of each kind and whether a file must have them
+IMPORT_COLUMNS = {
+    'dress': {
+        'id': False, 'size': True, 'color': True, 'style': True, 'brand': True,
+        'cost': True, 'marketPrice': False, 'rentPrice': True, 'dateAdded': False,
+    },
+    'customer': {
+        'id': False, 'email': True, 'name': True, 'lastName': True, 'phoneNumber': True, 'dateAdded': False,
+    },
+    'rent': {
+        'id': False, 'dressId': True, 'clientId': True, 'rentDate': True,
+        'returnDate': False, 'paymentMethod': True, 'paymentTotal': False,
+    },
+}
+
+IMPORT_MODELS = {'dress': Dress, 'customer': Customer, 'rent': Rent}
+
+
+class ImportFileError(ValueError):
+    pass
+
+
+class ImportResult:
+    def __init__(self, kind, rows):
+        self.kind = kind
+        self.rows = rows
+        self.inserted = 0
+        self._errors = []
+
+    def add_errors(self, mask, column, message):
+        # One error for every row where mask is true
+        mask = mask.fillna(False).astype(bool)
+        if mask.any():
+            self._errors.append(pd.DataFrame({'row': mask.index[mask], 'column': column, 'error': message}))
+
+    def failed_rows(self):
+        if not self._errors:
+            return pd.Index([])
+        return pd.Index(pd.concat(self._errors)['row'].unique())
+
+    @property
+    def errors(self):
+        # Errors by line of the file, the header being line 1
+        if not self._errors:
+            return pd.DataFrame(columns=['line', 'column', 'error'])
+        errors = pd.concat(self._errors, ignore_index=True).sort_values('row', kind='stable')
+        errors.insert(0, 'line', errors.pop('row') + 2)
+        return errors.reset_index(drop=True)
+
+    @property
+    def failed(self):
+        return self.rows - self.inserted
+
+    def to_dict(self, max_errors=None):
+        errors = self.errors
+        if max_errors is not None:
+            errors = errors.head(max_errors)
+        return {
+            'kind': self.kind,
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': errors.to_dict('records'),
+        }
+
+    def write_report(self, target):
+        self.errors.to_csv(target, index=False)
+
+
+def import_format(filename):
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    if extension not in IMPORT_FORMATS:
+        raise ImportFileError(f'Unsupported file type, use one of {", ".join(IMPORT_FORMATS)}.')
+    return extension
+
+
+def read_import(source, file_format):
+    # Every cell as text, the columns are parsed by the validators
+    try:
+        if file_format == 'csv':
+            return pd.read_csv(source, dtype=str, keep_default_na=False)
+        return pd.read_excel(source, dtype=str, keep_default_na=False)
+    except (ValueError, UnicodeDecodeError, zipfile.BadZipFile, pd.errors.ParserError) as e:
+        raise ImportFileError(f'Could not read the file: {e}') from e
+
+
+def header_key(text):
+    return ''.join(char for char in str(text).lower() if char.isalnum())
+
+
+def header_names(kind):
+    # Normalized header -> column name, from the column names and the export labels
+    columns = IMPORT_COLUMNS[kind]
+    names = {header_key(name): name for name in columns}
+    for label, column, dtype in TABLE_COLUMNS[kind]:
+        if column.key in columns:
+            names.setdefault(header_key(label), column.key)
+    return names
+
+
+def rename_headers(kind, frame):
+    names = header_names(kind)
+    frame = frame.rename(columns=lambda header: names.get(header_key(header), header))
+
+    missing = [name for name, required in IMPORT_COLUMNS[kind].items() if required and name not in frame]
+    if missing:
+        raise ImportFileError(f'Missing columns for {kind} import: {", ".join(missing)}.')
+
+    return frame
+
+
+# Column checks. Each takes the raw text of a column, records its errors and returns the
+# parsed values, missing where the cell was empty or invalid.
+
+def text_values(frame, column):
+    if column not in frame:
+        return pd.Series(pd.NA, index=frame.index, dtype='string')
+    return frame[column].astype('string').str.strip().replace('', pd.NA)
+
+
+def check_text(result, values, column, max_length, required=True):
+    if required:
+        result.add_errors(values.isna(), column, 'Required.')
+    result.add_errors(values.str.len() > max_length, column, f'Longer than {max_length} characters.')
+    return values
+
+
+def check_integer(result, values, column, required=True, minimum=None):
+    numbers = pd.to_numeric(values.str.replace(r'[$,\s]', '', regex=True), errors='coerce')
+    invalid = values.notna() & (numbers.isna() | (numbers % 1 != 0))
+
+    if required:
+        result.add_errors(values.isna(), column, 'Required.')
+    result.add_errors(invalid, column, 'Not a whole number.')
+
+    numbers = numbers.mask(invalid)
+    if minimum is not None:
+        result.add_errors(numbers < minimum, column, f'Less than {minimum}.')
+
+    return numbers.astype('Float64').round().astype('Int64')
+
+
+def check_date(result, values, column, required=True):
+    dates = pd.to_datetime(values, errors='coerce')
+
+    if required:
+        result.add_errors(values.isna(), column, 'Required.')
+    result.add_errors(values.notna() & dates.isna(), column, 'Not a date.')
+
+    return dates
+
+
+def check_email(result, values, column):
+    emails = values.str.lower()
+    result.add_errors(emails.notna() & ~emails.str.match(EMAIL_PATTERN).fillna(False), column, 'Invalid email.')
+    return emails
+
+
+def normalize_phone(text):
+    # E.164 digits as stored in Customer.phoneNumber, None when the number is not valid
+    try:
+        parsed = phonenumbers.parse(text, PHONE_REGION)
+    except NumberParseException:
+        return None
+    if not phonenumbers.is_valid_number(parsed):
+        return None
+    return int(phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164).lstrip('+'))
+
+
+def phone_patterns(region):
+    # Country code, valid national numbers and national prefixes of a region, from the
+    # metadata phonenumbers validates with
+    metadata = phonenumbers.PhoneMetadata.metadata_for_region(region)
+    descriptions = [
+        metadata.fixed_line, metadata.mobile, metadata.toll_free, metadata.premium_rate, metadata.shared_cost,
+        metadata.personal_number, metadata.voip, metadata.pager, metadata.uan, metadata.voicemail,
+    ]
+    national = '|'.join(
+        f'(?:{description.national_number_pattern})' for description in descriptions
+        if description is not None and description.national_number_pattern
+    )
+    return metadata.country_code, national, metadata.national_prefix_for_parsing
+
+
+def check_phone(result, values, column):
+    # Most numbers are plain national numbers, maybe with the country code, and those are
+    # matched against the patterns of PHONE_REGION for the whole column at once. Numbers with
+    # a national prefix, another country code and so on go through phonenumbers, which is
+    # slow, once per distinct value.
+    country_code, national_pattern, prefix_pattern = phone_patterns(PHONE_REGION)
+
+    national = values.str.replace(r'[\s\-.()]', '', regex=True).str.replace(f'^\\+{country_code}', '', regex=True)
+    plain = national.str.fullmatch(national_pattern).fillna(False)
+    if prefix_pattern:
+        plain &= ~national.str.match(prefix_pattern).fillna(False)
+    phones = pd.to_numeric(str(country_code) + national.where(plain)).astype('Int64')
+
+    others = values[values.notna() & ~plain]
+    parsed = {text: normalize_phone(text) for text in others.unique()}
+    phones = phones.fillna(others.map(parsed).astype('Int64'))
+
+    result.add_errors(values.notna() & phones.isna(), column, 'Invalid phone number.')
+    return phones
+
+
+def json_values(values):
+    # The values as a one column table, bound as a single JSON parameter
+    values = [value.item() if hasattr(value, 'item') else value for value in pd.unique(values.dropna())]
+    return db.select(db.func.json_each(json.dumps(values)).table_valued('value').c.value)
+
+
+def existing_values(column, values, lower=False):
+    # Values already in column, with one IN query
+    if values.dropna().empty:
+        return set()
+    key = db.func.lower(column) if lower else column
+    return set(db.session.execute(db.select(key).where(key.in_(json_values(values)))).scalars())
+
+
+def check_unique(result, values, column, db_column, lower=False):
+    result.add_errors(values.notna() & values.duplicated(), column, 'Duplicate of an earlier row.')
+    result.add_errors(values.isin(list(existing_values(db_column, values, lower))), column, 'Already exists.')
+
+
+# Validators, from the raw frame to the column values of the rows to insert
+
+def dress_values(result, frame):
+    values = pd.DataFrame(index=frame.index)
+
+    values['id'] = check_integer(result, text_values(frame, 'id'), 'id', required=False, minimum=1)
+    check_unique(result, values['id'], 'id', Dress.id)
+
+    values['size'] = check_integer(result, text_values(frame, 'size'), 'size', minimum=0)
+    for column in ['color', 'style', 'brand']:
+        values[column] = check_text(result, text_values(frame, column), column, Dress.__table__.c[column].type.length)
+
+    values['cost'] = check_integer(result, text_values(frame, 'cost'), 'cost', minimum=0)
+    values['marketPrice'] = check_integer(result, text_values(frame, 'marketPrice'), 'marketPrice', required=False, minimum=0)
+    values['rentPrice'] = check_integer(result, text_values(frame, 'rentPrice'), 'rentPrice', minimum=1)
+    values['rentsForReturns'] = values['cost'] // values['rentPrice']
+
+    values['dateAdded'] = check_date(result, text_values(frame, 'dateAdded'), 'dateAdded', required=False)
+
+    return values
+
+
+def customer_values(result, frame):
+    values = pd.DataFrame(index=frame.index)
+
+    values['id'] = check_integer(result, text_values(frame, 'id'), 'id', required=False, minimum=1)
+    check_unique(result, values['id'], 'id', Customer.id)
+
+    values['email'] = check_email(result, check_text(result, text_values(frame, 'email'), 'email', Customer.email.type.length), 'email')
+    check_unique(result, values['email'], 'email', Customer.email, lower=True)
+
+    values['name'] = check_text(result, text_values(frame, 'name'), 'name', Customer.name.type.length)
+    values['lastName'] = check_text(result, text_values(frame, 'lastName'), 'lastName', Customer.lastName.type.length)
+
+    raw_phones = text_values(frame, 'phoneNumber')
+    result.add_errors(raw_phones.isna(), 'phoneNumber', 'Required.')
+    values['phoneNumber'] = check_phone(result, raw_phones, 'phoneNumber')
+    check_unique(result, values['phoneNumber'], 'phoneNumber', Customer.phoneNumber)
+
+    values['dateAdded'] = check_date(result, text_values(frame, 'dateAdded'), 'dateAdded', required=False)
+
+    return values
+
+
+def rent_values(result, frame):
+    values = pd.DataFrame(index=frame.index)
+
+    values['id'] = check_integer(result, text_values(frame, 'id'), 'id', required=False, minimum=1)
+    check_unique(result, values['id'], 'id', Rent.id)
+
+    values['dressId'] = check_integer(result, text_values(frame, 'dressId'), 'dressId')
+    values['clientId'] = check_integer(result, text_values(frame, 'clientId'), 'clientId')
+
+    # Rent prices of the dresses, the rents are charged at them when the file has no totals
+    dress_ids = values['dressId']
+    rent_prices = dict(db.session.execute(
+        db.select(Dress.id, Dress.rentPrice).where(Dress.id.in_(json_values(dress_ids)))
+    ).all()) if dress_ids.notna().any() else {}
+    prices = dress_ids.map(rent_prices).astype('Int64')
+    result.add_errors(dress_ids.notna() & prices.isna(), 'dressId', 'Unknown dress.')
+
+    client_ids = values['clientId']
+    result.add_errors(client_ids.notna() & ~client_ids.isin(list(existing_values(Customer.id, client_ids))), 'clientId', 'Unknown customer.')
+
+    rent_dates = check_date(result, text_values(frame, 'rentDate'), 'rentDate')
+    return_dates = check_date(result, text_values(frame, 'returnDate'), 'returnDate', required=False)
+    result.add_errors(return_dates < rent_dates, 'returnDate', 'Before the rent date.')
+    values['rentDate'] = rent_dates.dt.date
+    values['returnDate'] = return_dates.fillna(rent_dates + RENT_DURATION).dt.date
+
+    raw_methods = text_values(frame, 'paymentMethod')
+    values['paymentMethod'] = raw_methods.str.lower().map({method.lower(): method for method in PAYMENT_METHODS})
+    result.add_errors(raw_methods.isna(), 'paymentMethod', 'Required.')
+    result.add_errors(raw_methods.notna() & values['paymentMethod'].isna(), 'paymentMethod', f'Not one of {", ".join(PAYMENT_METHODS)}.')
+
+    # Same total as rent_payment_total(), for the whole column
+    totals = check_integer(result, text_values(frame, 'paymentTotal'), 'paymentTotal', required=False, minimum=0)
+    values['paymentTotal'] = totals.fillna((prices + prices * RENT_TAX_RATE).floordiv(1).astype('Int64'))
+
+    return values
+
+
+IMPORT_VALIDATORS = {'dress': dress_values, 'customer': customer_values, 'rent': rent_values}
+
+
+def stored_values(series, column):
+    # Values of a column as the database stores them, None for missing ones
+    dialect = db.engine.dialect
+    process = column.type.dialect_impl(dialect).bind_processor(dialect)
+    values = [None if missing else value for value, missing in zip(series.tolist(), series.isna().tolist())]
+    if process:
+        values = [None if value is None else process(value) for value in values]
+    return values
+
+
+def insert_select(table, columns):
+    # INSERT ... SELECT of the rows of a JSON array of arrays. It is one statement however many
+    # rows: run per row, as executemany does, every statement flushes the pending full-text
+    # terms of the search index triggers, which makes the insert several times slower.
+    rows = db.func.json_each(bindparam('rows')).table_valued('value')
+    select = db.select(*[
+        db.func.json_extract(rows.c.value, f'$[{position}]').label(name) for position, name in enumerate(columns)
+    ])
+    return db.insert(table).from_select(columns, select)
+
+
+def insert_rows(result, table, values, chunk_size):
+    # Insert the rows of values in transactions of chunk_size rows, a chunk that fails is
+    # reported against all its rows and the next ones go on
+    lines = values.index.tolist()
+    columns = list(values.columns)
+    records = list(zip(*[stored_values(values[name], table.c[name]) for name in columns]))
+    statement = insert_select(table, columns)
+
+    for start in range(0, len(records), chunk_size):
+        chunk = records[start:start + chunk_size]
+        try:
+            db.session.execute(statement, {'rows': json.dumps(chunk)})
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logging.exception(f'Import of {result.kind} rows {start} to {start + len(chunk)} failed')
+            result.add_errors(pd.Series(True, index=lines[start:start + chunk_size]), '', f'Not saved: {e.__class__.__name__}.')
+        else:
+            result.inserted += len(chunk)
+
+
+def import_frame(kind, frame, chunk_size=None):
+    # Validate and insert the rows of frame, returning an ImportResult with the errors of the
+    # rows left out. Raises ImportFileError when the columns don't fit the kind.
+    if kind not in IMPORT_COLUMNS:
+        raise ImportFileError(f'Unknown import kind {kind}.')
+
+    frame = rename_headers(kind, frame.reset_index(drop=True))
+    result = ImportResult(kind, len(frame))
+
+    values = IMPORT_VALIDATORS[kind](result, frame)
+    if 'dateAdded' in values:
+        values['dateAdded'] = values['dateAdded'].fillna(pd.Timestamp(datetime.utcnow()))
+    if 'id' in values and values['id'].isna().all():
+        # Let the database number them
+        values = values.drop(columns='id')
+
+    values = values.drop(index=result.failed_rows())
+    insert_rows(result, IMPORT_MODELS[kind].__table__, values, chunk_size or IMPORT_CHUNK_SIZE)
+
+    if kind == 'rent' and result.inserted:
+        # The rents went in without the ORM, recompute the rent columns of the dresses
+        Dress.update_statuses()
+        Dress.backfill_last_activity()
+        db.session.commit()
+
+    logging.debug(f'Imported {result.inserted} of {result.rows} {kind} rows')
+
+    return result
+
+
+def import_file(kind, source, file_format, chunk_size=None):
+    return import_frame(kind, read_import(source, file_format), chunk_size)
+
+
+# Command to import a CSV or XLSX file of dresses, customers or rents
+@click.command('import-data')
+@click.argument('kind', type=click.Choice(list(IMPORT_COLUMNS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--report', type=click.Path(dir_okay=False), help='Write the rows that failed to this CSV file.')
+@click.option('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, show_default=True, help='Rows per transaction.')
+@with_appcontext
+def import_data_command(kind, path, report, chunk_size):
+    try:
+        result = import_file(kind, path, import_format(path), chunk_size)
+    except ImportFileError as e:
+        raise click.ClickException(str(e))
+
+    click.echo(f'Imported {result.inserted} of {result.rows} {kind} rows, {result.failed} failed.')
+
+    if report:
+        result.write_report(report)
+        click.echo(f'Error report written to {report}.')
+    else:
+        for error in result.to_dict(max_errors=20)['errors']:
+            click.echo(f'  line {error["line"]}, {error["column"]}: {error["error"]}')
+
+
+def init_app(app):
+    app.cli.add_command(import_data_command)
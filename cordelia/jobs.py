@@ -0,0 +1,142 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cordelia.excel import EXPORT_SHEETS
+from cordelia.export import write_export, export_extension
+
+
+SHEET_NAMES = dict(EXPORT_SHEETS)
+
+
+class ExportJob:
+    def __init__(self, export_format):
+        self.id = uuid.uuid4().hex
+        self.format = export_format
+        self.status = 'pending'
+        # Rows written so far, by sheet
+        self.progress = {}
+        self.file_path = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.future = None
+
+    @property
+    def file_name(self):
+        created = time.strftime('%B-%d-%Y_%H-%M-%S', time.localtime(self.created))
+        return f'database_data_{created}.{export_extension(self.format)}'
+
+    def update_progress(self, name, rows_written):
+        self.progress[SHEET_NAMES[name]] = rows_written
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'format': self.format,
+            'status': self.status,
+            'progress': dict(self.progress),
+            'rows': sum(self.progress.values()),
+            'error': self.error,
+        }
+
+
+# Runs database exports on a small thread pool outside the request, keeping the finished
+# files under instance/exports until EXPORT_JOB_TTL seconds after they are done.
+class ExportJobs:
+    def __init__(self):
+        self.app = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def init_app(self, app):
+        self.app = app
+
+    @property
+    def result_dir(self):
+        return os.path.join(self.app.instance_path, 'exports')
+
+    @property
+    def ttl(self):
+        return self.app.config['EXPORT_JOB_TTL']
+
+    def submit(self, export_format):
+        self.cleanup()
+
+        job = ExportJob(export_format)
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.app.config['EXPORT_JOB_WORKERS'],
+                    thread_name_prefix='export-job'
+                )
+            self._jobs[job.id] = job
+            job.future = self._executor.submit(self._run, job)
+
+        return job
+
+    def get(self, job_id):
+        self.cleanup()
+
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job):
+        job.status = 'running'
+
+        os.makedirs(self.result_dir, exist_ok=True)
+        file_path = os.path.join(self.result_dir, f'{job.id}.{export_extension(job.format)}')
+        part_path = file_path + '.part'
+
+        try:
+            with self.app.app_context():
+                with open(part_path, 'wb') as output:
+                    write_export(job.format, output, progress=job.update_progress)
+
+            os.replace(part_path, file_path)
+            job.file_path = file_path
+            job.status = 'done'
+        except Exception as e:
+            logging.exception(f'Export job {job.id} failed')
+            job.status = 'failed'
+            job.error = str(e)
+
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        finally:
+            job.finished = time.time()
+
+    def cleanup(self):
+        # Forget jobs past their TTL and delete their files, along with anything
+        # left in the result folder by a previous run of the app
+        now = time.time()
+
+        with self._lock:
+            expired = [job for job in self._jobs.values() if job.finished and now - job.finished > self.ttl]
+            for job in expired:
+                del self._jobs[job.id]
+
+        for job in expired:
+            if job.file_path and os.path.exists(job.file_path):
+                os.remove(job.file_path)
+
+        if not os.path.isdir(self.result_dir):
+            return
+
+        for entry in os.scandir(self.result_dir):
+            try:
+                if entry.is_file() and now - entry.stat().st_mtime > self.ttl:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+export_jobs = ExportJobs()
+
+
+def init_app(app):
+    export_jobs.init_app(app)
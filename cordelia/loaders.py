@@ -0,0 +1,112 @@
+import pandas as pd
+from cordelia.db import db
+from cordelia.models import Dress, Customer, Rent, Maintenance, Sale, maintenance_association
+
+
+# Ids of the dresses in each maintenance as a '3, 8, 11' list, aggregated from the association
+# table in the same statement instead of lazy loading Maintenance.dresses row by row
+maintenance_dress_ids = db.select(
+    db.func.group_concat(maintenance_association.c.dress_id, ', ')
+).where(
+    maintenance_association.c.maintenance_id == Maintenance.id
+).scalar_subquery()
+
+
+# Columns read for each table as (label, column, dtype). Only these columns are selected,
+# so building a frame never hydrates ORM objects. A dtype of None keeps what pandas infers.
+TABLE_COLUMNS = {
+    'dress': [
+        ('Id', Dress.id, None),
+        ('Size', Dress.size, None),
+        ('Color', Dress.color, 'category'),
+        ('Style', Dress.style, 'category'),
+        ('Brand', Dress.brand, 'category'),
+        ('Cost', Dress.cost, None),
+        ('Date Added', Dress.dateAdded, 'datetime64[ns]'),
+        ('Market Price', Dress.marketPrice, None),
+        ('Rent Price', Dress.rentPrice, None),
+        ('Rents for Returns', Dress.rentsForReturns, None),
+        ('Times Rented', Dress.timesRented, None),
+        ('Sellable', Dress.sellable, 'boolean'),
+        ('Rent Status', Dress.rentStatus, 'boolean'),
+        ('Maintenance Status', Dress.maintenanceStatus, 'boolean'),
+    ],
+    'customer': [
+        ('Id', Customer.id, None),
+        ('Email', Customer.email, None),
+        ('Name', Customer.name, None),
+        ('Last Name', Customer.lastName, None),
+        ('Phone Number', Customer.phoneNumber, 'string'),
+        ('Date Added', Customer.dateAdded, 'datetime64[ns]'),
+    ],
+    'rent': [
+        ('Id', Rent.id, None),
+        ('Dress Id', Rent.dressId, None),
+        ('Customer Id', Rent.clientId, None),
+        ('Rent Date', Rent.rentDate, 'datetime64[ns]'),
+        ('Return Date', Rent.returnDate, 'datetime64[ns]'),
+        ('Payment Total', Rent.paymentTotal, None),
+        ('Payment Method', Rent.paymentMethod, 'category'),
+    ],
+    'maintenance': [
+        ('Id', Maintenance.id, None),
+        ('Type', Maintenance.maintenance_type, 'category'),
+        ('Date', Maintenance.date, 'datetime64[ns]'),
+        ('Return Date', Maintenance.returnDate, 'datetime64[ns]'),
+        ('Total Cost', Maintenance.cost, None),
+        ('Dresses', maintenance_dress_ids, None),
+    ],
+    'sale': [
+        ('Id', Sale.id, None),
+        ('Customer Id', Sale.customer_id, None),
+        ('Dress Id', Sale.dress_id, None),
+        ('Sale Date', Sale.sale_date, 'datetime64[ns]'),
+        ('Sale Price', Sale.sale_price, None),
+    ],
+}
+
+
+def table_dtypes(name):
+    return {label: dtype for label, column, dtype in TABLE_COLUMNS[name] if dtype}
+
+
+def table_select(name):
+    # Column-only select of a table with the export labels, in primary key order
+    columns = TABLE_COLUMNS[name]
+    return db.select(*[column.label(label) for label, column, dtype in columns]).order_by(columns[0][1])
+
+
+def apply_dtypes(frame, dtypes):
+    for label, dtype in dtypes.items():
+        if label not in frame:
+            continue
+        if dtype.startswith('datetime64'):
+            frame[label] = pd.to_datetime(frame[label])
+        else:
+            frame[label] = frame[label].astype(dtype)
+    return frame
+
+
+def read_select(statement, dtypes=None):
+    # DataFrame straight from the rows of a select, read on a connection of its own so it only
+    # sees committed rows, the same writes the data versions the frames are cached under count
+    with db.engine.connect() as connection:
+        result = connection.execute(statement)
+        frame = pd.DataFrame(result.all(), columns=list(result.keys()))
+    return apply_dtypes(frame, dtypes or {})
+
+
+def load_table(name):
+    return read_select(table_select(name), table_dtypes(name))
+
+
+def table_labels(name):
+    return [label for label, column, dtype in TABLE_COLUMNS[name]]
+
+
+def iter_table(name, chunksize=1000):
+    # Raw rows of a table in chunks, streamed from the cursor with yield_per so only
+    # one chunk is held in memory at a time
+    statement = table_select(name).execution_options(yield_per=chunksize)
+    for rows in db.session.execute(statement).partitions():
+        yield rows
@@ -0,0 +1,112 @@
+import unicodedata
+from bisect import bisect_left
+from cordelia.db import db, get_data_version
+from cordelia.models import Dress, Customer
+from cordelia.cache import LRUCache
+
+
+# Autocomplete for the dress and customer pickers of the dashboard forms. Each table has a
+# small in-memory index: a sorted list of (word, id) pairs, where the words are the id,
+# names, phone number and so on of a row. A lookup is a binary search per typed word for the
+# range of words it is a prefix of, so it never touches the database. Indexes are rebuilt,
+# from only the columns they need, when one of those columns changes in any process, not on
+# the counter and status updates every rent makes to its dress.
+
+LOOKUP_LIMIT = 10
+
+
+def normalize(text):
+    # Lowercase without accents, so 'perez' finds 'Pérez'
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+class LookupIndex:
+    def __init__(self, rows):
+        # rows are (id, label, words)
+        self.labels = {}
+        entries = set()
+
+        for row_id, label, words in rows:
+            self.labels[row_id] = label
+            for word in words:
+                if word is not None and word != '':
+                    entries.add((normalize(word), row_id))
+
+        self.entries = sorted(entries)
+        self.words = [word for word, row_id in self.entries]
+
+    def prefix_ids(self, prefix):
+        # Ids with a word starting with prefix, and those with a word equal to it
+        matches, exact = set(), set()
+
+        position = bisect_left(self.words, prefix)
+        while position < len(self.words) and self.words[position].startswith(prefix):
+            word, row_id = self.entries[position]
+            matches.add(row_id)
+            if word == prefix:
+                exact.add(row_id)
+            position += 1
+
+        return matches, exact
+
+    def search(self, text, limit=LOOKUP_LIMIT):
+        # Rows matching every typed word as a prefix, exact word matches first, then by id
+        terms = normalize(text).replace('+', '').split()
+        if not terms:
+            return []
+
+        matches, exact_counts = None, {}
+        for term in terms:
+            term_matches, term_exact = self.prefix_ids(term)
+            matches = term_matches if matches is None else matches & term_matches
+            if not matches:
+                return []
+            for row_id in term_exact:
+                exact_counts[row_id] = exact_counts.get(row_id, 0) + 1
+
+        ranked = sorted(matches, key=lambda row_id: (-exact_counts.get(row_id, 0), row_id))
+        return [{'id': row_id, 'label': self.labels[row_id]} for row_id in ranked[:limit]]
+
+
+def dress_rows():
+    statement = db.select(Dress.id, Dress.brand, Dress.color, Dress.style, Dress.size, Dress.sold)
+    for dress_id, brand, color, style, size, sold in db.session.execute(statement):
+        label = f'D-{dress_id:02} {brand} {color} {style} size {size}' + (' (sold)' if sold else '')
+        words = [str(dress_id), f'd-{dress_id}', f'd-{dress_id:02}', brand, color, style] + str(style).split() + str(brand).split()
+        yield dress_id, label, words
+
+
+def customer_rows():
+    statement = db.select(Customer.id, Customer.name, Customer.lastName, Customer.phoneNumber)
+    for customer_id, name, last_name, phone_number in db.session.execute(statement):
+        label = f'C-{customer_id:02} {name} {last_name}'
+        words = [str(customer_id), f'c-{customer_id}', f'c-{customer_id:02}', phone_number] + str(name).split() + str(last_name).split()
+        yield customer_id, label, words
+
+
+LOOKUPS = {
+    'dress': dress_rows,
+    'customer': customer_rows,
+}
+
+# Version counters of the columns each index reads, the column groups are declared in models
+LOOKUP_VERSIONS = {'dress': 'dress_lookup', 'customer': 'customer_lookup'}
+
+# Built indexes by (kind, table version)
+lookup_indexes = LRUCache(maxsize=8)
+
+
+def lookup_index(kind):
+    key = (kind, get_data_version(LOOKUP_VERSIONS[kind]))
+
+    index = lookup_indexes.get(key)
+    if index is None:
+        index = LookupIndex(LOOKUPS[kind]())
+        lookup_indexes.set(key, index)
+
+    return index
+
+
+def lookup(kind, text, limit=LOOKUP_LIMIT):
+    return lookup_index(kind).search(text, limit)
@@ -1,9 +1,26 @@
-from cordelia.db import db
+from cordelia.db import db, track_columns
+from sqlalchemy import event
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 
 
+def current_date():
+    # The one clock for rent and maintenance statuses: the current UTC date
+    return datetime.utcnow().date()
+
+
+# How long a dress is out for a rent and for a maintenance, both ends included
+RENT_DURATION = timedelta(days=3)
+MAINTENANCE_DURATION = timedelta(days=2)
+
+# Tax added to the rent price of a dress
+RENT_TAX_RATE = 0.16
+
+
+def rent_payment_total(rent_price):
+    return int(rent_price + rent_price * RENT_TAX_RATE)
+
 
 class Dress(db.Model):
     __tablename__ = 'dress'
@@ -22,13 +39,36 @@ class Dress(db.Model):
     timesRented = db.Column(db.Integer, index=True, default=0)
     rentStatus = db.Column(db.Boolean, index=True, default=False)
     maintenanceStatus = db.Column(db.Boolean, index=True, default=False)
+    # SHA-256 of the dress photo in the image store, see cordelia.images
     imageData = db.Column(db.String(255), default=None)
     sold = db.Column(db.Boolean, index=True, default=False)
 
+    # Denormalized pointers to the latest rent and maintenance, kept up to date on every write
+    # so the dashboard can sort by them without aggregating the whole rent history.
+    last_rent_date = db.Column(db.Date, index=True, default=None)
+    last_maintenance_date = db.Column(db.Date, index=True, default=None)
+    last_rent_id = db.Column(db.Integer, index=True, default=None)
+    last_customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), index=True, default=None)
+
+    # Row version, every ORM update of a dress is made on the version it was read at and bumps it,
+    # so two transactions booking the same dress can't both commit (see cordelia.booking)
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+
+    __table_args__ = (
+        # Covers the default 'status' sort of the dress dashboard
+        db.Index('ix_dress_status_order', 'rentStatus', 'maintenanceStatus', 'last_rent_date', 'last_maintenance_date', 'dateAdded'),
+    )
+
+    __mapper_args__ = {'version_id_col': version}
+
     # Relationship with Customer through the Rent association table with customers in the dress model
     customers = db.relationship('Customer', secondary='rent', back_populates='dresses', viewonly=True) 
     # One-to-One relationship with DressSale, allowing a dress to be sold only once
     sale = db.relationship('Sale', uselist=False, back_populates='dress')
+    # Latest rent, without a database level foreign key to avoid a dress <-> rent cycle
+    last_rent = db.relationship('Rent', primaryjoin='foreign(Dress.last_rent_id) == Rent.id', post_update=True)
+    # Customer of the latest rent
+    last_customer = db.relationship('Customer', foreign_keys=[last_customer_id])
 
     def __init__(self, *args, **kwargs):
         super(Dress, self).__init__(*args, **kwargs)
@@ -45,25 +85,6 @@ class Dress(db.Model):
         else:
             return None
     
-    def update_maintenance_status(self):
-        if self.rents:
-            sorted_maintenances = sorted(self.maintenances, key=lambda maintenance: maintenance.date, reverse=True)
-            latest_maintenance = sorted_maintenances[0]
-
-            # Check if the latest rent has been returned
-            self.maintenanceStatus = not latest_maintenance.is_returned()
-        else:
-            self.maintenanceStatus = False
-    
-    def check_maintenance_status(self):
-        if self.maintenances:
-            sorted_maintenances = sorted(self.maintenances, key=lambda maintenance: maintenance.date, reverse=True)
-            latest_maintenance = sorted_maintenances[0]
-
-            return not latest_maintenance.is_returned()
-        else:
-            return False
-
     def get_last_rent(self):
         if self.rents:
             sorted_rents = sorted(self.rents, key=lambda rent: rent.rentDate, reverse=True)
@@ -82,44 +103,162 @@ class Dress(db.Model):
         else:
             return None
         
-    def update_rent_status(self):
-        if self.rents:
-            sorted_rents = sorted(self.rents, key=lambda rent: rent.rentDate, reverse=True)
-            latest_rent = sorted_rents[0]
-
-            self.rentStatus = not latest_rent.is_returned()
-        else:
-            self.rentStatus = False
-
-    def check_status(self):
-        if self.rents:
-            sorted_rents = sorted(self.rents, key=lambda rent: rent.rentDate, reverse=True)
-            latest_rent = sorted_rents[0]
-
-            return not latest_rent.is_returned()
-        else:
-            return False    
+    def set_last_rent(self, rent):
+        # Point the dress to the given rent if it is its most recent one
+        if self.last_rent_date is None or rent.rentDate >= self.last_rent_date:
+            self.last_rent = rent
+            self.last_rent_date = rent.rentDate
+            self.last_customer_id = rent.clientId
+            return True
+        return False
+
+    def update_last_rent(self, exclude=None):
+        # Recompute the latest rent from the database, skipping a rent that is being deleted
+        query = Rent.query.filter(Rent.dressId == self.id)
+        if exclude is not None:
+            query = query.filter(Rent.id != exclude.id)
+        latest_rent = query.order_by(Rent.rentDate.desc(), Rent.id.desc()).first()
+
+        self.last_rent = latest_rent
+        self.last_rent_date = latest_rent.rentDate if latest_rent else None
+        self.last_customer_id = latest_rent.clientId if latest_rent else None
+
+        return latest_rent
+
+    def set_last_maintenance(self, maintenance):
+        if self.last_maintenance_date is None or maintenance.date >= self.last_maintenance_date:
+            self.last_maintenance_date = maintenance.date
+            return True
+        return False
+
+    def update_last_maintenance(self, exclude=None):
+        query = Maintenance.query.join(
+            maintenance_association,
+            maintenance_association.c.maintenance_id == Maintenance.id
+        ).filter(maintenance_association.c.dress_id == self.id)
+        if exclude is not None:
+            query = query.filter(Maintenance.id != exclude.id)
+        latest_maintenance = query.order_by(Maintenance.date.desc(), Maintenance.id.desc()).first()
+
+        self.last_maintenance_date = latest_maintenance.date if latest_maintenance else None
+
+        return latest_maintenance
+
+    # Incremental updates of timesRented, sellable, rentStatus and maintenanceStatus, called from
+    # the session hooks below with the record being added or removed. update_statuses() recomputes
+    # the same columns from scratch.
+    def record_rent(self, rent):
+        self.timesRented = (self.timesRented or 0) + 1
+        self.sellable = self.timesRented > self.rentsForReturns
+
+        self.set_last_rent(rent)
+        # A booking that has not started yet is activated by update_statuses() or the scheduler
+        if rent.is_active():
+            self.rentStatus = True
+
+    def forget_rent(self, rent):
+        self.timesRented = max((self.timesRented or 0) - 1, 0)
+        self.sellable = self.timesRented > self.rentsForReturns
+
+        if self.last_rent_id is None or self.last_rent_id == rent.id:
+            self.update_last_rent(exclude=rent)
+        if self.rentStatus:
+            self.rentStatus = self.has_active_rent(exclude=rent)
+
+    def has_active_rent(self, exclude=None):
+        # Whether another rent of the dress covers today
+        today = current_date()
+        query = Rent.query.filter(Rent.dressId == self.id, Rent.rentDate <= today, Rent.returnDate >= today)
+        if exclude is not None:
+            query = query.filter(Rent.id != exclude.id)
+        return db.session.query(query.exists()).scalar()
+
+    def record_maintenance(self, maintenance):
+        if self.set_last_maintenance(maintenance):
+            self.maintenanceStatus = not maintenance.is_returned()
+
+    def forget_maintenance(self, maintenance):
+        if self.last_maintenance_date is None or self.last_maintenance_date == maintenance.date:
+            latest_maintenance = self.update_last_maintenance(exclude=maintenance)
+            self.maintenanceStatus = not latest_maintenance.is_returned() if latest_maintenance else False
 
-    def update_times_rented(self):
-        if self.rents:
-            num_of_rents = len(self.rents)
-            # Update the timesRented and sellable attributes
-            self.timesRented = num_of_rents
-            self.sellable = num_of_rents > self.rentsForReturns
-        else:
-            self.timesRented = 0
-            self.sellable = self.timesRented > self.rentsForReturns
+    @classmethod
+    def backfill_last_activity(cls):
+        # Fill the last rent / last maintenance columns of every dress in a single UPDATE
+        latest_rent = db.select(Rent).where(Rent.dressId == cls.id).order_by(Rent.rentDate.desc(), Rent.id.desc()).limit(1)
+
+        statement = db.update(cls).values(
+            last_rent_id=latest_rent.with_only_columns(Rent.id).scalar_subquery(),
+            last_rent_date=latest_rent.with_only_columns(Rent.rentDate).scalar_subquery(),
+            last_customer_id=latest_rent.with_only_columns(Rent.clientId).scalar_subquery(),
+            last_maintenance_date=db.select(db.func.max(Maintenance.date)).join(
+                maintenance_association,
+                maintenance_association.c.maintenance_id == Maintenance.id
+            ).where(maintenance_association.c.dress_id == cls.id).scalar_subquery()
+        ).execution_options(synchronize_session=False)
+
+        return db.session.execute(statement).rowcount
 
     @classmethod
-    def update_statuses(cls):
-        dresses = cls.query.all()
-
-        for dress in dresses:
-            if dress.rents:
-                dress.update_times_rented()
-                dress.update_rent_status()
-            if dress.maintenances:
-                dress.update_maintenance_status()
+    def update_statuses(cls, dress_ids=None):
+        # Recompute timesRented, sellable, rentStatus and maintenanceStatus for the whole inventory
+        # (or only for dress_ids) with a single UPDATE ... FROM over per-dress aggregates.
+        # Returns the number of dresses whose columns actually changed.
+        today = current_date()
+
+        # Number of rents of each dress and whether one of them covers today (started and not returned)
+        rent_stats = db.select(
+            Rent.dressId.label('dress_id'),
+            db.func.count().label('times_rented'),
+            db.func.max(db.case(
+                (db.and_(Rent.rentDate <= today, Rent.returnDate >= today), 1), else_=0
+            )).label('active')
+        ).group_by(Rent.dressId).subquery()
+
+        # Return date of the latest maintenance of each dress
+        ranked_maintenances = db.select(
+            maintenance_association.c.dress_id,
+            Maintenance.returnDate.label('return_date'),
+            db.func.row_number().over(
+                partition_by=maintenance_association.c.dress_id,
+                order_by=(Maintenance.date.desc(), Maintenance.id.desc())
+            ).label('position')
+        ).join(
+            Maintenance,
+            maintenance_association.c.maintenance_id == Maintenance.id
+        ).subquery()
+        maintenance_stats = db.select(ranked_maintenances).where(ranked_maintenances.c.position == 1).subquery()
+
+        dress = db.aliased(cls)
+        stats = db.select(
+            dress.id.label('dress_id'),
+            db.func.coalesce(rent_stats.c.times_rented, 0).label('times_rented'),
+            rent_stats.c.active.label('rent_active'),
+            maintenance_stats.c.return_date.label('maintenance_return_date')
+        ).outerjoin(
+            rent_stats, rent_stats.c.dress_id == dress.id
+        ).outerjoin(
+            maintenance_stats, maintenance_stats.c.dress_id == dress.id
+        )
+        if dress_ids is not None:
+            stats = stats.where(dress.id.in_(dress_ids))
+        stats = stats.subquery()
+
+        values = {
+            'timesRented': stats.c.times_rented,
+            'sellable': db.case((stats.c.times_rented > cls.rentsForReturns, True), else_=False),
+            'rentStatus': db.case((stats.c.rent_active == 1, True), else_=False),
+            'maintenanceStatus': db.case((stats.c.maintenance_return_date >= today, True), else_=False),
+        }
+
+        statement = db.update(cls).where(
+            cls.id == stats.c.dress_id
+        ).where(
+            # Only touch the rows that drifted so the rowcount reports real changes
+            db.or_(*[getattr(cls, column).is_distinct_from(value) for column, value in values.items()])
+        ).values(values).execution_options(synchronize_session=False)
+
+        return db.session.execute(statement).rowcount
     
     def __repr__(self):
         return f"D-{self.id:02}"
@@ -128,7 +267,9 @@ class Dress(db.Model):
 # Explicitly defined association table for the many-to-many relationship between Dress and Maintenance
 maintenance_association = db.Table('maintenance_association',
     db.Column('maintenance_id', db.Integer, db.ForeignKey('maintenance.id'), primary_key=True),
-    db.Column('dress_id', db.Integer, db.ForeignKey('dress.id'), primary_key=True)
+    db.Column('dress_id', db.Integer, db.ForeignKey('dress.id'), primary_key=True),
+    # The primary key leads with maintenance_id, this one finds the maintenances of a dress
+    db.Index('ix_maintenance_association_dress', 'dress_id', 'maintenance_id')
 )
 
 
@@ -148,13 +289,10 @@ class Maintenance(db.Model):
         super(Maintenance, self).__init__(*args, **kwargs)
 
         if self.date:
-            self.returnDate = self.date + timedelta(days=2)
+            self.returnDate = self.date + MAINTENANCE_DURATION
     
     def is_returned(self):
-        current_datetime = datetime.utcnow()
-        current_date = current_datetime.date()
-
-        return current_date > self.returnDate if self.returnDate else False
+        return current_date() > self.returnDate if self.returnDate else False
 
     def __repr__(self):
         return f"M-{self.id:02}"
@@ -176,13 +314,10 @@ class Customer(db.Model):
     sales = db.relationship('Sale', back_populates='customer')
 
     def check_status(self):
-        if self.rents:
-            sorted_rents = sorted(self.rents, key=lambda rent: rent.rentDate, reverse=True)
-            latest_rent = sorted_rents[0]
-
-            return not latest_rent.is_returned()
-        else:
-            return False
+        # Whether the customer has a dress out today, a booking that has not started doesn't count
+        today = current_date()
+        query = Rent.query.filter(Rent.clientId == self.id, Rent.rentDate <= today, Rent.returnDate >= today)
+        return db.session.query(query.exists()).scalar()
         
     def get_last_rent(self):
         if self.rents:
@@ -235,6 +370,11 @@ class Rent(db.Model):
     paymentMethod = db.Column(db.String(20), index=True, nullable=False)
     paymentTotal = db.Column(db.Integer, index=True)
 
+    __table_args__ = (
+        # Rent intervals of a dress in date order, for the availability checks
+        db.Index('ix_rent_dress_interval', 'dressId', 'rentDate', 'returnDate'),
+    )
+
     # Many-to-One relationship with Dress
     dress = db.relationship('Dress', backref='rents')
     # Many-to-One relationship with Customer
@@ -243,25 +383,30 @@ class Rent(db.Model):
     def __init__(self, *args, **kwargs):
         super(Rent, self).__init__(*args, **kwargs)
 
-        if self.dressId:
-            self.dress = Dress.query.filter_by(id=self.dressId).first()
-             
-        if self.clientId:
-            self.customer = Customer.query.filter_by(id=self.clientId).first()
-            
+        # From the identity map when the caller already has them loaded, see cordelia.rents
+        if self.dress is None and self.dressId:
+            self.dress = db.session.get(Dress, self.dressId)
+
+        if self.customer is None and self.clientId:
+            self.customer = db.session.get(Customer, self.clientId)
+
+        # The column is a Date, keep datetimes out so rent dates compare with each other
+        if isinstance(self.rentDate, datetime):
+            self.rentDate = self.rentDate.date()
+
         if not self.returnDate:
-            self.returnDate = self.rentDate + timedelta(days=3)
+            self.returnDate = self.rentDate + RENT_DURATION
 
         # Added Tax.
-        if self.dress:
-            tax = self.dress.rentPrice * 0.16
-            self.paymentTotal = int(self.dress.rentPrice + tax)
+        if self.dress and self.paymentTotal is None:
+            self.paymentTotal = rent_payment_total(self.dress.rentPrice)
 
     def is_returned(self):
-        current_datetime = datetime.utcnow()
-        current_date = current_datetime.date()
+        return current_date() > self.returnDate if self.returnDate else False
 
-        return current_date > self.returnDate if self.returnDate else False
+    def is_active(self):
+        # The dress is out with this rent: it has started and has not been returned
+        return self.rentDate <= current_date() and not self.is_returned()
     
     def __repr__(self):
         return f"R-{self.id:02}"
@@ -288,4 +433,82 @@ class User(UserMixin, db.Model):
         if self.isAdmin:
             return f"ADMIN-{self.id:02}"
         else:
-            return f"USER-{self.id:02}"
\ No newline at end of file
+            return f"USER-{self.id:02}"
+
+
+# Column groups with a version counter of their own, read by the dashboard lookup indexes
+# (see cordelia.lookup) so they are not rebuilt on the counter and status updates of a rent
+track_columns('dress_lookup', Dress.__table__, ['brand', 'color', 'style', 'size', 'sold'])
+track_columns('customer_lookup', Customer.__table__, ['name', 'lastName', 'phoneNumber'])
+
+
+def _get_dress(session, dress, dress_id):
+    # Related dress of a rent or sale, from the identity map when possible
+    if dress is None and dress_id is not None:
+        dress = session.get(Dress, dress_id)
+    return dress
+
+
+# Keep the denormalized dress columns (timesRented, sellable, rentStatus, maintenanceStatus, sold and
+# the last rent / maintenance pointers) in sync in the same flush that writes a rent, maintenance or sale.
+# Each change only touches the affected dresses, so a full Dress.update_statuses() sweep is not needed.
+@event.listens_for(db.session, 'before_flush')
+def update_dress_counters(session, flush_context, instances):
+    for obj in list(session.new):
+        if isinstance(obj, Rent):
+            dress = _get_dress(session, obj.dress, obj.dressId)
+            if dress is not None:
+                dress.record_rent(obj)
+        elif isinstance(obj, Maintenance):
+            for dress in obj.dresses:
+                dress.record_maintenance(obj)
+        elif isinstance(obj, Sale):
+            dress = _get_dress(session, obj.dress, obj.dress_id)
+            if dress is not None:
+                dress.sold = True
+
+    for obj in list(session.dirty):
+        if isinstance(obj, Rent):
+            # A rent moved to another dress or to other dates: take it off the dress it had
+            # (the database still holds its old values) and record it again with the new ones
+            state = db.inspect(obj)
+            dress_history = state.attrs.dress.history
+            if dress_history.added:
+                obj.dressId = dress_history.added[0].id if dress_history.added[0] is not None else None
+            dress_id_history = state.attrs.dressId.history
+            if not any(state.attrs[key].history.has_changes() for key in ('dressId', 'rentDate', 'returnDate')):
+                continue
+
+            if dress_id_history.deleted:
+                old_dress_id = dress_id_history.deleted[0]
+            elif dress_id_history.has_changes():
+                # The old value was not loaded (e.g. expired by a commit)
+                old_dress_id = session.execute(db.select(Rent.dressId).where(Rent.id == obj.id)).scalar()
+            else:
+                old_dress_id = obj.dressId
+            old_dress = _get_dress(session, None, old_dress_id)
+            new_dress = _get_dress(session, None, obj.dressId)
+            if old_dress is not None:
+                old_dress.forget_rent(obj)
+            if new_dress is not None:
+                new_dress.record_rent(obj)
+        elif isinstance(obj, Maintenance):
+            # Dresses added to or removed from an existing maintenance
+            history = db.inspect(obj).attrs.dresses.history
+            for dress in history.added:
+                dress.record_maintenance(obj)
+            for dress in history.deleted:
+                dress.forget_maintenance(obj)
+
+    for obj in list(session.deleted):
+        if isinstance(obj, Rent):
+            dress = _get_dress(session, obj.dress, obj.dressId)
+            if dress is not None:
+                dress.forget_rent(obj)
+        elif isinstance(obj, Maintenance):
+            for dress in obj.dresses:
+                dress.forget_maintenance(obj)
+        elif isinstance(obj, Sale):
+            dress = _get_dress(session, obj.dress, obj.dress_id)
+            if dress is not None:
+                dress.sold = False
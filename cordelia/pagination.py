@@ -0,0 +1,246 @@
+import json
+import math
+import logging
+import threading
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import date, datetime
+from flask import request, current_app
+from sqlalchemy import Table, and_, or_, false, literal
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+from sqlalchemy.sql.util import find_tables
+from cordelia.db import db, get_data_version
+from cordelia.cache import LRUCache
+
+
+# Keyset (seek) pagination for the dashboard listings. Instead of OFFSET, each page starts
+# right after the sort key of the last row of the previous one, so deep pages cost the same
+# as the first. Cursors travel in the 'after' / 'before' query parameters.
+
+
+def encode_cursor(values):
+    def encode(value):
+        if isinstance(value, datetime):
+            return {'dt': value.isoformat()}
+        if isinstance(value, date):
+            return {'d': value.isoformat()}
+        return value
+
+    data = json.dumps([encode(value) for value in values], separators=(',', ':'))
+    return urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    def decode(value):
+        if isinstance(value, dict):
+            if 'dt' in value:
+                return datetime.fromisoformat(value['dt'])
+            return date.fromisoformat(value['d'])
+        return value
+
+    try:
+        data = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return [decode(value) for value in json.loads(data)]
+    except (ValueError, TypeError, KeyError):
+        # A mangled cursor just sends the user back to the first page
+        return None
+
+
+def sort_keys(order_by, primary_key):
+    # (expression, descending) pairs for a list of order_by clauses, ending with the primary
+    # key so every row has a unique position
+    keys = []
+    for clause in order_by:
+        if hasattr(clause, '__clause_element__'):
+            clause = clause.__clause_element__()
+
+        if isinstance(clause, UnaryExpression) and clause.modifier in (operators.desc_op, operators.asc_op):
+            keys.append((clause.element, clause.modifier is operators.desc_op))
+        else:
+            keys.append((clause, False))
+
+    if not any(expression.compare(primary_key) for expression, descending in keys):
+        keys.append((primary_key, False))
+
+    return keys
+
+
+def after_predicate(keys, values):
+    # Rows sorting strictly after the given key values. SQLite sorts NULL as the smallest value,
+    # NULLs come first ascending and last descending, and so do these comparisons.
+    predicate = false()
+
+    for (expression, descending), value in reversed(list(zip(keys, values))):
+        if value is None:
+            strictly_after = false() if descending else expression.isnot(None)
+            equal = expression.is_(None)
+        else:
+            # Bound with the column type so booleans compare as the 0 / 1 they are stored as
+            value = literal(value, expression.type)
+            strictly_after = or_(expression < value, expression.is_(None)) if descending else expression > value
+            equal = expression == value
+
+        predicate = or_(strictly_after, and_(equal, predicate))
+
+    return predicate
+
+
+# Row counts of the dashboard listings keyed by their count statement. Each entry keeps the
+# version of the tables it was counted at: a matching version means the count is exact, an
+# older one still makes a good estimate while a fresh count runs in the background.
+count_cache = LRUCache(maxsize=256)
+
+# Background recounts in flight, by cache key
+count_refreshes = {}
+count_refreshes_lock = threading.Lock()
+
+
+def count_key(statement):
+    compiled = statement.compile(dialect=db.engine.dialect)
+    return (str(compiled), repr(sorted(compiled.params.items())))
+
+
+def count_tables(statement):
+    tables = find_tables(statement, include_joins=True, include_aliases=True, check_columns=True)
+    return sorted({table.name for table in tables if isinstance(table, Table)})
+
+
+def count_statement(statement, limit=None):
+    if limit is not None:
+        statement = statement.limit(limit)
+    return db.select(db.func.count()).select_from(statement.subquery())
+
+
+def refresh_count(app, key, statement, version):
+    def run():
+        try:
+            with app.app_context():
+                total = db.session.execute(count_statement(statement)).scalar()
+            count_cache.set(key, (version, total))
+        except Exception:
+            logging.exception('Background row count failed')
+        finally:
+            with count_refreshes_lock:
+                count_refreshes.pop(key, None)
+
+    with count_refreshes_lock:
+        if key in count_refreshes:
+            return
+        thread = threading.Thread(target=run, name='row-count', daemon=True)
+        count_refreshes[key] = thread
+    thread.start()
+
+
+def count_rows(query):
+    # Total rows of a query as (total, estimate). estimate is None for an exact count, 'about'
+    # for a count taken before the last writes and 'over' when all that is known is a lower bound.
+    statement = query.order_by(None).statement
+    key = count_key(statement)
+    version = get_data_version(*count_tables(statement))
+
+    cached = count_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1], None
+
+    # Count no further than EXACT_COUNT_LIMIT rows, the scan stops there however large the table
+    limit = current_app.config['EXACT_COUNT_LIMIT']
+    total = db.session.execute(count_statement(statement, limit + 1)).scalar()
+
+    if total <= limit:
+        count_cache.set(key, (version, total))
+        return total, None
+
+    refresh_count(current_app._get_current_object(), key, statement, version)
+
+    if cached is not None:
+        return cached[1], 'about'
+    return limit, 'over'
+
+
+class KeysetPagination:
+    def __init__(self, items, page, per_page, total, has_prev, has_next, first_values, last_values, estimate=None):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.estimate = estimate
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.prev_num = page - 1 if has_prev else None
+        self.next_num = page + 1 if has_next else None
+        self.prev_cursor = encode_cursor(first_values) if has_prev and first_values else None
+        self.next_cursor = encode_cursor(last_values) if has_next and last_values else None
+
+    @property
+    def pages(self):
+        return max(math.ceil(self.total / self.per_page), 1)
+
+    @property
+    def total_display(self):
+        if self.estimate == 'about':
+            return f'about {self.total:,}'
+        if self.estimate == 'over':
+            return f'{self.total:,}+'
+        return str(self.total)
+
+
+def paginate(query, order_by, per_page=12, count_query=None):
+    # Page of a query ordered by order_by, read from the page / after / before / last request
+    # arguments. count_query, when given, counts the same rows without the joins needed to sort.
+    page = max(request.args.get('page', 1, type=int), 1)
+    after = request.args.get('after')
+    before = request.args.get('before')
+    last = request.args.get('last', type=int) == 1
+
+    entity = query.column_descriptions[0]['entity']
+    keys = sort_keys(order_by, entity.__mapper__.primary_key[0])
+
+    total, estimate = count_rows(count_query if count_query is not None else query)
+
+    cursor = decode_cursor(before or after) if (before or after) else None
+    if cursor is not None and len(cursor) != len(keys):
+        cursor = None
+
+    # Walk backwards for the previous and the last page, then flip the rows back
+    backwards = last or (before is not None and cursor is not None)
+
+    page_query = query.order_by(None).add_columns(
+        *[expression.label(f'sort_key_{i}') for i, (expression, descending) in enumerate(keys)]
+    ).order_by(*[
+        expression.desc() if descending != backwards else expression.asc()
+        for expression, descending in keys
+    ])
+
+    if cursor is not None and not last:
+        walked_keys = [(expression, descending != backwards) for expression, descending in keys]
+        page_query = page_query.filter(after_predicate(walked_keys, cursor))
+    elif page > 1 and not last:
+        # Direct jump to a page number without a cursor, e.g. an old bookmark
+        page_query = page_query.offset((page - 1) * per_page)
+
+    if last:
+        # The last page holds whatever is left after the full pages, so walking back
+        # from it lands on the same pages as walking forward. That takes an exact total.
+        page = max(math.ceil(total / per_page), 1)
+        last_page_size = total - (page - 1) * per_page if estimate is None else per_page
+        rows = page_query.limit(last_page_size or per_page).all()
+        rows.reverse()
+        has_prev, has_next = page > 1, False
+    else:
+        rows = page_query.limit(per_page + 1).all()
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+
+        if backwards:
+            rows.reverse()
+            has_prev, has_next = has_more, True
+            if not has_prev:
+                page = 1
+        else:
+            has_prev, has_next = page > 1, has_more
+
+    items = [row[0] for row in rows]
+    first_values = list(rows[0][1:]) if rows else None
+    last_values = list(rows[-1][1:]) if rows else None
+
+    return KeysetPagination(items, page, per_page, total, has_prev, has_next, first_values, last_values, estimate)
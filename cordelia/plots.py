@@ -1,112 +1,47 @@
-import pandas as pd
-from cordelia.models import Dress, Rent, Customer, Maintenance, Sale
+from cordelia.analytics import analytics
+from cordelia.cache import LRUCache
 import matplotlib
 import matplotlib.pyplot as plt 
 from matplotlib.ticker import FuncFormatter, MultipleLocator
 from io import BytesIO
-import base64
-
-
-# Create Dataframes
-def create_dataframes():
-
-    dress_db = Dress.query.all()
-    customer_db = Customer.query.all()
-    rent_db = Rent.query.all()
-    maintenance_db = Maintenance.query.all()
-    sale_db = Sale.query.all()
-
-    if dress_db:
-        dress_data = {
-            'Id': [dress.id for dress in dress_db],
-            'Size': [dress.size for dress in dress_db],
-            'Color': [dress.color for dress in dress_db],
-            'Style': [dress.style for dress in dress_db],
-            'Brand': [dress.brand for dress in dress_db],
-            'Cost': [dress.cost for dress in dress_db],
-            'Date Added': [dress.dateAdded.strftime('%Y-%m-%d') for dress in dress_db],
-            'Market Price': [dress.marketPrice for dress in dress_db],
-            'Rent Price': [dress.rentPrice for dress in dress_db],
-            'Rents for Returns': [dress.rentsForReturns for dress in dress_db],
-            'Times Rented': [dress.timesRented for dress in dress_db],
-            'Sellable': [dress.sellable for dress in dress_db],
-            'Rent Status': [dress.rentStatus for dress in dress_db],
-            'Maintenance Status': [dress.maintenanceStatus for dress in dress_db],
-        }
-        df_dress = pd.DataFrame(dress_data)
-
-    if customer_db:
-        customer_data = {
-            'Id': [customer.id if customer.id else None for customer in customer_db],
-            'Email': [customer.email for customer in customer_db],
-            'Name': [customer.name for customer in customer_db],
-            'Last Name': [customer.lastName for customer in customer_db],
-            'Phone Number': [str(customer.phoneNumber) for customer in customer_db],
-            'Date Added': [customer.dateAdded.strftime('%Y-%m-%d') for customer in customer_db],
-        }
-        df_customer = pd.DataFrame(customer_data)
-
-    if rent_db:
-        rent_data = {
-            'Id': [rent.id for rent in rent_db],
-            'Dress Id': [rent.dressId for rent in rent_db],
-            'Customer Id': [rent.clientId for rent in rent_db],
-            'Rent Date': [rent.rentDate.strftime('%Y-%m-%d') for rent in rent_db],
-            'Return Date': [rent.returnDate.strftime('%Y-%m-%d') if rent.returnDate else '' for rent in rent_db],
-            'Payment Total': [rent.paymentTotal for rent in rent_db],
-        }
-        df_rent = pd.DataFrame(rent_data)
-
-    if maintenance_db:
-        maintenance_data = {
-            'Id': [maintenance.id for maintenance in maintenance_db],
-            'Type': [maintenance.maintenance_type for maintenance in maintenance_db],
-            'Date': [maintenance.date.strftime('%Y-%m-%d') for maintenance in maintenance_db],
-            'Return Date': [maintenance.returnDate.strftime('%Y-%m-%d') if maintenance.returnDate else '' for maintenance in maintenance_db],
-            'Total Cost': [maintenance.cost for maintenance in maintenance_db]
-        }
-        df_maintenance = pd.DataFrame(maintenance_data)
-
-    if sale_db:
-        sale_data = {
-            'Id': [sale.id for sale in sale_db],
-            'Customer Id': [sale.customer_id for sale in sale_db],
-            'Dress Id': [sale.dress_id for sale in sale_db],
-            'Sale Date': [sale.sale_date for sale in sale_db],
-            'Sale Price': [sale.sale_price for sale in sale_db]
-        }
-        df_sale = pd.DataFrame(sale_data)
-        
-    return df_dress, df_customer, df_rent, df_maintenance, df_sale
-
-
-df_dress, df_customer, df_rent, df_maintenance, df_sale= create_dataframes()
+import threading
 
 
+IMAGE_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+IMAGE_DPIS = (72, 100, 150, 200)
 
-# Plot top customers by rents & spending
-def top_customers():
 
-    if not df_rent.empty:
+# Rendered images keyed by (img_num, data version, format, dpi)
+plot_cache = LRUCache(maxsize=32)
 
-        matplotlib.use('Agg')
+# pyplot keeps global state, render one figure at a time
+render_lock = threading.Lock()
 
-        # Group by customer ID and calculate total rentals and total spending
-        customer_rentals = df_rent.groupby('Customer Id').agg({'Id': 'count', 'Payment Total': 'sum'})
 
-        customer_rentals = customer_rentals.rename(columns={'Id': 'Total Rentals', 'Payment Total': 'Total Spending'})
+def save_figure(fig, image_format='png', dpi=100):
+    buffer = BytesIO()
+    fig.savefig(buffer, format=image_format, dpi=dpi)
+    plt.close(fig)
 
-        # Sort customers by the number of rentals
-        top_customers_by_rentals = customer_rentals.sort_values(by='Total Rentals', ascending=False)
+    image_data = buffer.getvalue()
+    buffer.close()
 
-        # Get the top 15 customers
-        top_15_customers = top_customers_by_rentals.head(15)
+    return image_data
 
-        # Reverse the order of the top 15 customers
-        top_15_customers = top_15_customers.iloc[::-1]
 
-        # Sort customers by total spending
-        top_customers_by_spending = customer_rentals.sort_values(by='Total Spending', ascending=False)
+# Plot top customers by rents & spending
+def top_customers(image_format='png', dpi=100):
+
+    # Top 15 customers by each measure, grouped and ranked in SQL
+    top_customers_by_rentals = analytics.get('top_customers_by_rentals')
+    top_customers_by_spending = analytics.get('top_customers_by_spending')
+
+    if not top_customers_by_rentals.empty:
+
+        matplotlib.use('Agg')
+
+        # Reverse the order of the top 15 customers
+        top_15_customers = top_customers_by_rentals.iloc[::-1]
 
         plt.style.use('ggplot')
 
@@ -134,7 +69,7 @@ def top_customers():
         axs[0].grid(color='0.9')
 
         # Plot the top customers by total spending
-        top_customers_by_spending.head(15).plot(kind='bar', y='Total Spending', legend=True, ax=axs[1], color='#a58d72')
+        top_customers_by_spending.plot(kind='bar', y='Total Spending', legend=True, ax=axs[1], color='#a58d72')
         axs[1].set_title('Top Customers by Total Spending')
         axs[1].set_xlabel('Customer ID')
         axs[1].set_ylabel('Total Spending')
@@ -143,8 +78,8 @@ def top_customers():
         axs[1].set_xticklabels(axs[1].get_xticklabels(), rotation=0)
 
         # Find the maximum and minimum spending among the top customers
-        max_spending = top_customers_by_spending.head(15)['Total Spending'].max()
-        min_spending = top_customers_by_spending.head(15)['Total Spending'].min()
+        max_spending = top_customers_by_spending['Total Spending'].max()
+        min_spending = top_customers_by_spending['Total Spending'].min()
 
         # Adjust the lower y-axis limit to be slightly below the minimum spending value
         axs[1].set_ylim(min_spending - 500, max_spending)
@@ -160,53 +95,24 @@ def top_customers():
 
         plt.tight_layout()
 
-        buffer = BytesIO()
-        plt.savefig(buffer, format="png")
-        buffer.seek(0)
-
-        image_data = base64.b64encode(buffer.read()).decode()
-        buffer.close()
-
-        return image_data
+        return save_figure(fig, image_format, dpi)
     
     return None
 
 
 
-def costs_vs_earnings():
+def costs_vs_earnings(image_format='png', dpi=100):
 
-    if not df_rent.empty and not df_maintenance.empty and not df_dress.empty and not df_sale.empty:
+    # Monthly totals, summed in SQL
+    df_rents = analytics.get('rents_by_month')
+    df_costs = analytics.get('costs_by_month')
+
+    if not df_rents.empty and df_costs.notna().any().all():
 
         matplotlib.use('Agg')
 
-        # Convert date columns to datetime
-        df_rent['Rent Date'] = pd.to_datetime(df_rent['Rent Date'])
-        df_maintenance['Date'] = pd.to_datetime(df_maintenance['Date'])
-        df_dress['Date Added'] = pd.to_datetime(df_dress['Date Added'])
-        df_sale['Sale Date'] = pd.to_datetime(df_sale['Sale Date'])
-
-        # Create the 'YearMonth' column for each dataframe
-        df_rent['YearMonth'] = df_rent['Rent Date'].dt.to_period('M')
-        df_maintenance['YearMonth'] = df_maintenance['Date'].dt.to_period('M')
-        df_dress['YearMonth'] = df_dress['Date Added'].dt.to_period('M')
-        df_sale['YearMonth'] = df_sale['Sale Date'].dt.to_period('M')
-
-        # Convert 'YearMonth' to ordinal for use as x-values
-        df_costs_earnings = pd.DataFrame(index=df_rent['YearMonth'].unique())
-        df_costs_earnings['YearMonth'] = df_costs_earnings.index.to_timestamp(freq='M').to_period('M').to_timestamp().map(lambda x: x.to_pydatetime().toordinal())
-
-        # Group and aggregate the data by month
-        rents_by_month = df_rent.groupby('YearMonth')['Payment Total'].sum()
-        maintenance_by_month = df_maintenance.groupby('YearMonth')['Total Cost'].sum()
-        dress_costs_by_month = df_dress.groupby('YearMonth')['Cost'].sum()
-        sales_by_month = df_sale.groupby('YearMonth')['Sale Price'].sum()
-
-        # Combine the data into a single dataframe
-        df_costs_earnings['Earnings'] = rents_by_month
-        df_costs_earnings['Maintenance Costs'] = maintenance_by_month
-        df_costs_earnings['Dress Acquisition Costs'] = dress_costs_by_month
-        df_costs_earnings['Sales'] = sales_by_month
-        df_costs_earnings = df_costs_earnings.fillna(0)
+        # Costs and sales on the months with rents
+        df_costs_earnings = df_rents[['Earnings']].join(df_costs, how='left').fillna(0)
 
         # Sort the data and x-axis labels in chronological order
         df_costs_earnings = df_costs_earnings.sort_index()
@@ -270,23 +176,20 @@ def costs_vs_earnings():
 
         plt.tight_layout()
 
-        buffer = BytesIO()
-        plt.savefig(buffer, format="png")
-        buffer.seek(0)
-
-        image_data = base64.b64encode(buffer.read()).decode()
-        buffer.close()
-
-        return image_data
+        return save_figure(fig, image_format, dpi)
 
     return None
 
 
 
 
-def plot_combined_statistics():
+def plot_combined_statistics(image_format='png', dpi=100):
+
+    # Rents per month and per weekday, counted in SQL
+    df_rents = analytics.get('rents_by_month')
+    df_weekdays = analytics.get('rents_by_weekday')
 
-    if df_rent is None or df_rent.empty:
+    if df_rents.empty:
         return None
 
     matplotlib.use('Agg')
@@ -299,10 +202,7 @@ def plot_combined_statistics():
     fig.set_facecolor('#DCC6B6')
 
     # Plot number of rents by month
-    df_rent['Rent Date'] = pd.to_datetime(df_rent['Rent Date'])
-    df_rent['YearMonth'] = df_rent['Rent Date'].dt.to_period('M')
-
-    counts = df_rent['YearMonth'].value_counts().sort_index()
+    counts = df_rents['Rents'].sort_index()
     x_values = [period.ordinal for period in counts.index]
 
     axs[0].bar(x_values, counts.values, color='#918272', label='Rents')
@@ -330,11 +230,12 @@ def plot_combined_statistics():
     axs[0].grid(color='0.9')
 
     # Plot the pie chart
-    day_of_week_counts = df_rent['Rent Date'].dt.day_name().value_counts()
-    labels = day_of_week_counts.index
-    sizes = day_of_week_counts.values
-    colors = ['#08F7FE', '#FE53BB', '#00ff41', '#ff9900', '#b64fff', '#FA8072']
-    explode = (0.075, 0.05, 0.025, 0, 0, 0)
+    labels = df_weekdays.index
+    sizes = df_weekdays['Rents'].values
+    colors = ['#08F7FE', '#FE53BB', '#00ff41', '#ff9900', '#b64fff', '#FA8072', '#a58d72'][:len(sizes)]
+
+    # Pull out the three busiest weekdays, the counts come sorted from the query
+    explode = ((0.075, 0.05, 0.025) + (0,) * len(sizes))[:len(sizes)]
 
     axs[1].pie(sizes, explode=explode, labels=labels, colors=colors, autopct='%1.1f%%', shadow=True, startangle=140)
     axs[1].axis('equal')
@@ -345,15 +246,42 @@ def plot_combined_statistics():
 
     plt.tight_layout()
 
-    buffer = BytesIO()
-    plt.savefig(buffer, format="png")
-    buffer.seek(0)
+    return save_figure(fig, image_format, dpi)
 
-    image_data = base64.b64encode(buffer.read()).decode()
-    buffer.close()
 
-    return image_data
+
+plt.style.use('default')
 
 
+# Plot functions and the datasets they read, by the img_num of /admin/dashboard/plot/<img_num>
+PLOTS = {
+    1: (costs_vs_earnings, ['rents_by_month', 'costs_by_month']),
+    2: (top_customers, ['top_customers_by_rentals', 'top_customers_by_spending']),
+    3: (plot_combined_statistics, ['rents_by_month', 'rents_by_weekday']),
+}
 
-plt.style.use('default')
\ No newline at end of file
+
+def plot_version(img_num, image_format='png', dpi=100):
+    # Cache key of a rendered plot, changes whenever one of its tables is written
+    datasets = PLOTS[img_num][1]
+    return (img_num, analytics.version(*datasets), image_format, dpi)
+
+
+def plot_modified(img_num):
+    datasets = PLOTS[img_num][1]
+    return analytics.modified(*datasets)
+
+
+def render_plot(img_num, image_format='png', dpi=100):
+    # Rendered image bytes from the cache, drawing the plot only when its data changed
+    key = plot_version(img_num, image_format, dpi)
+
+    image_data = plot_cache.get(key)
+    if image_data is None:
+        plot_function = PLOTS[img_num][0]
+        with render_lock:
+            image_data = plot_function(image_format=image_format, dpi=dpi)
+        if image_data is not None:
+            plot_cache.set(key, image_data)
+
+    return image_data
@@ -0,0 +1,104 @@
+from datetime import datetime
+from sqlalchemy.orm.util import identity_key
+from cordelia.db import db
+from cordelia.models import Dress, Customer, Rent, RENT_DURATION, rent_payment_total
+
+
+# Building rents in volume. The dresses and customers of a batch are loaded with one IN query
+# each into the identity map, the return date and total of every rent are worked out in Python,
+# and the whole batch is written in a single flush. Callers commit.
+#
+# No availability check is made here, this is meant for imports and sample data where the
+# rents are records of what happened. Live bookings go through cordelia.booking.
+
+
+# Ids per IN query, below SQLite's limit on bound parameters
+ID_CHUNK_SIZE = 500
+
+
+def existing_ids(model, ids):
+    ids = list(set(ids))
+    found = set()
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        chunk = ids[start:start + ID_CHUNK_SIZE]
+        found.update(db.session.execute(db.select(model.id).where(model.id.in_(chunk))).scalars())
+    return found
+
+
+def load_by_id(model, ids):
+    # {id: object} for the given ids, taking the ones already in the session from the identity map
+    loaded = {}
+    missing = []
+
+    for object_id in set(ids):
+        obj = db.session.identity_map.get(identity_key(model, object_id))
+        if obj is not None:
+            loaded[object_id] = obj
+        else:
+            missing.append(object_id)
+
+    for start in range(0, len(missing), ID_CHUNK_SIZE):
+        for obj in model.query.filter(model.id.in_(missing[start:start + ID_CHUNK_SIZE])):
+            loaded[obj.id] = obj
+
+    return loaded
+
+
+def build_rent(dress, customer, rent_date, payment_method, return_date=None):
+    if isinstance(rent_date, datetime):
+        rent_date = rent_date.date()
+
+    return Rent(
+        dress=dress,
+        customer=customer,
+        rentDate=rent_date,
+        returnDate=return_date or rent_date + RENT_DURATION,
+        paymentMethod=payment_method,
+        paymentTotal=rent_payment_total(dress.rentPrice),
+    )
+
+
+def create_rent(dress, customer, rent_date, payment_method, return_date=None):
+    # dress and customer can be objects or ids
+    if not isinstance(dress, Dress):
+        dress = db.session.get(Dress, dress)
+    if not isinstance(customer, Customer):
+        customer = db.session.get(Customer, customer)
+    if dress is None or customer is None:
+        raise ValueError('Unknown dress or customer.')
+
+    rent = build_rent(dress, customer, rent_date, payment_method, return_date)
+    db.session.add(rent)
+
+    return rent
+
+
+def create_rents(rows, batch_size=1000):
+    # Add a rent for every (dress_id, customer_id, rent_date, payment_method) row, flushing once
+    # per batch_size rows, and return them. Raises ValueError before adding anything when a row
+    # names a dress or customer that doesn't exist.
+    rows = list(rows)
+
+    dress_ids = existing_ids(Dress, [row[0] for row in rows])
+    customer_ids = existing_ids(Customer, [row[1] for row in rows])
+    missing = [row for row in rows if row[0] not in dress_ids or row[1] not in customer_ids]
+    if missing:
+        raise ValueError(f'Unknown dress or customer in {len(missing)} rows, e.g. {missing[0]}.')
+
+    rents = []
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+
+        dresses = load_by_id(Dress, [row[0] for row in batch])
+        customers = load_by_id(Customer, [row[1] for row in batch])
+
+        batch_rents = [
+            build_rent(dresses[dress_id], customers[customer_id], rent_date, payment_method)
+            for dress_id, customer_id, rent_date, payment_method in batch
+        ]
+        db.session.add_all(batch_rents)
+        db.session.flush()
+
+        rents.extend(batch_rents)
+
+    return rents
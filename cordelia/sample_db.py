@@ -1,5 +1,6 @@
 from cordelia.models import Dress, Customer, Rent, Maintenance, Sale
 from cordelia.db import db
+from cordelia.rents import create_rents
 from faker import Faker
 import random
 from flask import current_app
@@ -116,32 +117,31 @@ def generate_random_customers(num_customers):
 
 
 def generate_sample_rents(num_rents):
-    for _ in range(num_rents):
-        dress = random.choice(Dress.query.all())
-        customer = Customer.query.order_by(db.func.random()).first()
+    dress_ids = db.session.execute(db.select(Dress.id)).scalars().all()
+    customer_ids = db.session.execute(db.select(Customer.id)).scalars().all()
 
-        if dress and customer:
-            today = datetime.now()
-            four_months_ago = today - timedelta(days=6 * 30)
+    if not dress_ids or not customer_ids:
+        return
 
-            # Generate a random date within the specified range
-            rent_date = fake.date_time_between_dates(datetime_start=four_months_ago, datetime_end=today)
+    today = datetime.now()
+    four_months_ago = today - timedelta(days=6 * 30)
 
-            # Check if the generated date is a Sunday and regenerate if it is
-            while rent_date.weekday() == 6:
-                rent_date = fake.date_time_between_dates(datetime_start=four_months_ago, datetime_end=today)
+    rows = []
+    for _ in range(num_rents):
+        # Generate a random date within the specified range
+        rent_date = fake.date_time_between_dates(datetime_start=four_months_ago, datetime_end=today)
 
-            payment_method = random.choice(['Credit Card', 'Cash', 'Transfer'])
+        # Check if the generated date is a Sunday and regenerate if it is
+        while rent_date.weekday() == 6:
+            rent_date = fake.date_time_between_dates(datetime_start=four_months_ago, datetime_end=today)
 
-            new_rent = Rent(
-                dressId=dress.id,
-                clientId=customer.id,
-                rentDate=rent_date,
-                paymentMethod=payment_method,
-            )
+        payment_method = random.choice(['Credit Card', 'Cash', 'Transfer'])
 
-            db.session.add(new_rent)
-            db.session.commit()
+        rows.append((random.choice(dress_ids), random.choice(customer_ids), rent_date, payment_method))
+
+    # All the rents in one flush and one commit
+    create_rents(rows)
+    db.session.commit()
 
 
 
@@ -212,6 +212,7 @@ def generate_sample_sales(num_sales):
 
 def update_dress_db():
     Dress.update_statuses()
+    Dress.backfill_last_activity()
     db.session.commit()
     
 
@@ -0,0 +1,241 @@
+import heapq
+import threading
+import logging
+from datetime import datetime, timedelta
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event
+from cordelia.db import db, get_table_version
+from cordelia.models import Dress, Rent, Maintenance, maintenance_association, current_date
+
+
+def expire_statuses(today=None, since=None):
+    # Clear rentStatus / maintenanceStatus of the dresses that are no longer rented or in maintenance.
+    # A record counts as returned the day after its returnDate (see Rent.is_returned()), so only
+    # return dates before 'today' expire. 'since' narrows the returnDate range to scan.
+    today = today or current_date()
+
+    active_rents = db.select(Rent.id).where(
+        Rent.dressId == Dress.id,
+        Rent.rentDate <= today,
+        Rent.returnDate >= today
+    )
+    expired_rents = db.select(Rent.id).where(Rent.dressId == Dress.id, Rent.returnDate < today)
+    if since is not None:
+        expired_rents = expired_rents.where(Rent.returnDate >= since)
+
+    rent_statement = db.update(Dress).where(
+        Dress.rentStatus == True,
+        expired_rents.exists(),
+        ~active_rents.exists()
+    ).values(rentStatus=False).execution_options(synchronize_session=False)
+
+    expired_maintenances = db.select(maintenance_association.c.dress_id).join(
+        Maintenance,
+        maintenance_association.c.maintenance_id == Maintenance.id
+    ).where(
+        maintenance_association.c.dress_id == Dress.id,
+        Maintenance.date == Dress.last_maintenance_date,
+        Maintenance.returnDate < today
+    )
+    if since is not None:
+        expired_maintenances = expired_maintenances.where(Maintenance.returnDate >= since)
+
+    maintenance_statement = db.update(Dress).where(
+        Dress.maintenanceStatus == True,
+        expired_maintenances.exists()
+    ).values(maintenanceStatus=False).execution_options(synchronize_session=False)
+
+    rents_expired = db.session.execute(rent_statement).rowcount
+    maintenances_expired = db.session.execute(maintenance_statement).rowcount
+
+    return rents_expired, maintenances_expired
+
+
+def activate_statuses(today=None, since=None):
+    # Set rentStatus on the dresses whose booking has started and is not returned yet.
+    # 'since' narrows the rentDate range to scan.
+    today = today or current_date()
+
+    started_rents = db.select(Rent.id).where(
+        Rent.dressId == Dress.id,
+        Rent.rentDate <= today,
+        Rent.returnDate >= today
+    )
+    if since is not None:
+        started_rents = started_rents.where(Rent.rentDate >= since)
+
+    statement = db.update(Dress).where(
+        Dress.rentStatus.isnot(True),
+        started_rents.exists()
+    ).values(rentStatus=True).execution_options(synchronize_session=False)
+
+    return db.session.execute(statement).rowcount
+
+
+def upcoming_return_dates(today=None):
+    # Distinct return dates that have not passed yet, read from the returnDate indexes
+    today = today or current_date()
+
+    rent_dates = db.select(Rent.returnDate).where(Rent.returnDate >= today)
+    maintenance_dates = db.select(Maintenance.returnDate).where(Maintenance.returnDate >= today)
+
+    return set(db.session.execute(db.union(rent_dates, maintenance_dates)).scalars())
+
+
+def upcoming_rent_dates(today=None):
+    # Distinct start dates of the bookings that have not started yet
+    today = today or current_date()
+
+    return set(db.session.execute(db.select(Rent.rentDate).where(Rent.rentDate > today).distinct()).scalars())
+
+
+# In-process scheduler that keeps a min-heap of the days on which a status expires or a booking
+# starts, and runs expire_statuses() / activate_statuses() for just that window when each day starts (UTC).
+class StatusScheduler:
+    # Longest sleep between checks of the rent / maintenance versions, so return dates
+    # written by other processes (imports, cron, other workers) are picked up
+    RELOAD_INTERVAL = 300
+
+    def __init__(self):
+        self.app = None
+        self._heap = []
+        self._scheduled = set()
+        self._versions = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        self.app = app
+
+        if app.testing or not app.config.get('STATUS_SCHEDULER', True):
+            return
+
+        # Start with the first request so CLI commands don't spawn the thread
+        app.before_request(self.start)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='status-scheduler', daemon=True)
+        self._thread.start()
+
+    def schedule(self, return_date):
+        # A status stays active through its return date and expires the day after
+        self._push(return_date + timedelta(days=1))
+
+    def schedule_start(self, rent_date):
+        # A booking becomes active on its rent date
+        self._push(rent_date)
+
+    def _push(self, due_date):
+        with self._lock:
+            if due_date in self._scheduled:
+                return
+            self._scheduled.add(due_date)
+            heapq.heappush(self._heap, due_date)
+
+        self._wakeup.set()
+
+    def _pop_due(self, today):
+        due_dates = []
+        with self._lock:
+            while self._heap and self._heap[0] <= today:
+                due_date = heapq.heappop(self._heap)
+                self._scheduled.discard(due_date)
+                due_dates.append(due_date)
+        return due_dates
+
+    def _expire(self, since=None):
+        with self.app.app_context():
+            rents_expired, maintenances_expired = expire_statuses(since=since)
+            rents_activated = activate_statuses(since=since)
+            db.session.commit()
+        logging.debug(
+            f"Status scheduler expired {rents_expired} rent and {maintenances_expired} maintenance statuses, "
+            f"activated {rents_activated} rent statuses"
+        )
+
+    def _reload(self):
+        # Re-seed the heap from the database when a rent or maintenance was committed since the last load
+        with self.app.app_context():
+            versions = get_table_version('rent', 'maintenance')
+            if versions == self._versions:
+                return False
+            return_dates = upcoming_return_dates()
+            rent_dates = upcoming_rent_dates()
+
+        for return_date in return_dates:
+            self.schedule(return_date)
+        for rent_date in rent_dates:
+            self.schedule_start(rent_date)
+        self._versions = versions
+        return True
+
+    def _run(self):
+        try:
+            # Catch up on anything that expired or started while the app was down
+            self._expire()
+        except Exception:
+            logging.exception('Status scheduler failed to expire statuses')
+
+        while True:
+            try:
+                self._reload()
+            except Exception:
+                logging.exception('Status scheduler could not load the return dates')
+
+            with self._lock:
+                next_due = self._heap[0] if self._heap else None
+
+            now = datetime.utcnow()
+            if next_due is None or next_due > now.date():
+                # Sleep until the next due day starts, or until the next version check,
+                # waking up early when a new date is scheduled
+                timeout = self.RELOAD_INTERVAL
+                if next_due is not None:
+                    timeout = min(timeout, (datetime.combine(next_due, datetime.min.time()) - now).total_seconds())
+                self._wakeup.wait(timeout=timeout)
+                self._wakeup.clear()
+                continue
+
+            due_dates = self._pop_due(now.date())
+            try:
+                self._expire(since=min(due_dates) - timedelta(days=1))
+            except Exception:
+                logging.exception('Status scheduler failed to expire statuses')
+
+
+scheduler = StatusScheduler()
+
+
+# Schedule the return dates of rents and maintenances, and the start of bookings, as they are written
+@event.listens_for(db.session, 'after_flush')
+def schedule_return_dates(session, flush_context):
+    if scheduler._thread is None:
+        return
+
+    today = current_date()
+    for obj in session.new:
+        if isinstance(obj, (Rent, Maintenance)) and obj.returnDate and obj.returnDate >= today:
+            scheduler.schedule(obj.returnDate)
+        if isinstance(obj, Rent) and obj.rentDate and obj.rentDate > today:
+            scheduler.schedule_start(obj.rentDate)
+
+
+# Command to expire and activate statuses from cron when several workers run without the in-process scheduler.
+@click.command('expire-statuses')
+@with_appcontext
+def expire_statuses_command():
+    rents_expired, maintenances_expired = expire_statuses()
+    rents_activated = activate_statuses()
+    db.session.commit()
+    click.echo(f'Expired {rents_expired} rent and {maintenances_expired} maintenance statuses.')
+    click.echo(f'Activated {rents_activated} rent statuses.')
+
+
+def init_app(app):
+    app.cli.add_command(expire_statuses_command)
+    scheduler.init_app(app)
@@ -0,0 +1,266 @@
+import re
+from datetime import date, datetime, timedelta
+from sqlalchemy import DDL, event, table, column, literal_column, bindparam, and_, types
+from cordelia.db import db
+from cordelia.models import Dress, Customer
+
+
+# Full-text indexes of the dashboard searches. Each is an FTS5 table over the text columns of a
+# model, storing no copy of the rows (content=...) and kept in sync by triggers, so inserts,
+# updates and deletes made by any code path, ORM or bulk SQL, are indexed.
+SEARCH_INDEXES = {
+    Dress: ('dress_fts', ['brand', 'color', 'style']),
+    Customer: ('customer_fts', ['name', 'lastName', 'email']),
+}
+
+
+def search_index_ddl(model):
+    fts_name, columns = SEARCH_INDEXES[model]
+    table_name = model.__tablename__
+
+    column_list = ', '.join(f'"{name}"' for name in columns)
+    new_values = ', '.join(f'new."{name}"' for name in columns)
+    old_values = ', '.join(f'old."{name}"' for name in columns)
+
+    return [
+        # Prefix indexes make 'term*' queries of 2 and 3 characters a direct lookup
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {fts_name} USING fts5('
+        f"{column_list}, content='{table_name}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+
+        f'CREATE TRIGGER IF NOT EXISTS {fts_name}_ai AFTER INSERT ON "{table_name}" BEGIN '
+        f'INSERT INTO {fts_name}(rowid, {column_list}) VALUES (new.id, {new_values}); END',
+
+        f'CREATE TRIGGER IF NOT EXISTS {fts_name}_ad AFTER DELETE ON "{table_name}" BEGIN '
+        f"INSERT INTO {fts_name}({fts_name}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END",
+
+        # Only reindex when an indexed column changes, not on every status or counter update
+        f'CREATE TRIGGER IF NOT EXISTS {fts_name}_au AFTER UPDATE OF {column_list} ON "{table_name}" BEGIN '
+        f"INSERT INTO {fts_name}({fts_name}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+        f'INSERT INTO {fts_name}(rowid, {column_list}) VALUES (new.id, {new_values}); END',
+    ]
+
+
+# Create the indexes together with their tables
+for model in SEARCH_INDEXES:
+    for statement in search_index_ddl(model):
+        event.listen(model.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+
+def rebuild_search_indexes():
+    # Create missing indexes and triggers on an existing database and reindex every row
+    with db.engine.begin() as connection:
+        for model, (fts_name, columns) in SEARCH_INDEXES.items():
+            for statement in search_index_ddl(model):
+                connection.exec_driver_sql(statement)
+            connection.exec_driver_sql(f"INSERT INTO {fts_name}({fts_name}) VALUES ('rebuild')")
+
+
+def searchable_columns(model):
+    return SEARCH_INDEXES[model][1] if model in SEARCH_INDEXES else []
+
+
+def match_query(search, columns=None):
+    # FTS5 query matching rows that contain every word of the search as a word prefix.
+    # Only word characters are kept, so user input can't inject FTS syntax.
+    terms = re.findall(r'\w+', search or '')
+    if not terms:
+        return None
+
+    query = ' '.join(f'"{term}"*' for term in terms)
+    if columns:
+        query = '{' + ' '.join(columns) + '} : (' + query + ')'
+
+    return query
+
+
+def match_select(model, search, columns=None):
+    # Ids of the matching rows, best matches first (FTS5 rank is bm25)
+    query = match_query(search, columns)
+    if query is None:
+        return None
+
+    fts_name = SEARCH_INDEXES[model][0]
+    fts_table = table(fts_name, column('rowid'), column('rank'))
+
+    return db.select(fts_table.c.rowid).where(
+        literal_column(fts_name).op('MATCH')(bindparam('fts_query', query))
+    ).order_by(fts_table.c.rank)
+
+
+def search_filter(model, search, columns=None):
+    # Criterion for query.filter() limiting a model to the rows matching the search
+    statement = match_select(model, search, columns)
+    if statement is None:
+        return None
+    return model.id.in_(statement.order_by(None))
+
+
+def ranked_search(query, model, search, columns=None):
+    # (query joined with the matching rows of the index, rank column to sort on, best first),
+    # or None when the search has no words
+    match = match_query(search, columns)
+    if match is None:
+        return None
+
+    fts_name = SEARCH_INDEXES[model][0]
+    fts_table = table(fts_name, column('rowid'), column('rank'))
+    matches = db.select(fts_table.c.rowid, fts_table.c.rank).where(
+        literal_column(fts_name).op('MATCH')(bindparam('fts_query', match))
+    ).subquery(f'{fts_name}_matches')
+
+    return query.join(matches, matches.c.rowid == model.id), matches.c.rank
+
+
+def search_ids(model, search, columns=None, limit=None):
+    # Matching ids in rank order
+    statement = match_select(model, search, columns)
+    if statement is None:
+        return []
+    if limit is not None:
+        statement = statement.limit(limit)
+    return list(db.session.execute(statement).scalars())
+
+
+# Typed column searches. Numbers, dates and booleans are parsed from the search text and
+# compared with the column as they are stored, as plain comparisons and half open ranges
+# SQLite can answer from the column index, instead of a LIKE on the column cast to text.
+
+RANGE_SEPARATOR = '..'
+
+COMPARISONS = {
+    '>=': lambda column, value: column >= value,
+    '<=': lambda column, value: column <= value,
+    '>': lambda column, value: column > value,
+    '<': lambda column, value: column < value,
+    '=': lambda column, value: column == value,
+}
+
+BOOLEAN_VALUES = {
+    'true': True, 'yes': True, 'y': True, '1': True,
+    'false': False, 'no': False, 'n': False, '0': False,
+}
+
+
+class SearchError(ValueError):
+    pass
+
+
+def split_search(text):
+    # (operator, value) or ('..', (low, high)) for a comparison or a range, either side optional
+    text = text.strip()
+
+    if RANGE_SEPARATOR in text:
+        low, high = (part.strip() for part in text.split(RANGE_SEPARATOR, 1))
+        if not low and not high:
+            raise SearchError('Empty range.')
+        return RANGE_SEPARATOR, (low or None, high or None)
+
+    for operator in COMPARISONS:
+        if text.startswith(operator):
+            return operator, text[len(operator):].strip()
+
+    return '=', text
+
+
+def parse_number(text):
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        raise SearchError(f"'{text}' is not a number.")
+
+
+def number_predicate(column, text):
+    operator, value = split_search(text)
+
+    if operator == RANGE_SEPARATOR:
+        # Inclusive on both ends, as in 1500..2000
+        low, high = value
+        criteria = []
+        if low is not None:
+            criteria.append(column >= parse_number(low))
+        if high is not None:
+            criteria.append(column <= parse_number(high))
+        return and_(*criteria)
+
+    return COMPARISONS[operator](column, parse_number(value))
+
+
+def parse_period(text):
+    # First day of a year, month or day written in ISO form and the first day after it
+    text = text.strip()
+    try:
+        if re.fullmatch(r'\d{4}', text):
+            start = date(int(text), 1, 1)
+            return start, date(start.year + 1, 1, 1)
+
+        if re.fullmatch(r'\d{4}-\d{1,2}', text):
+            year, month = map(int, text.split('-'))
+            start = date(year, month, 1)
+            return start, date(year + month // 12, month % 12 + 1, 1)
+
+        start = date.fromisoformat(text)
+        return start, start + timedelta(days=1)
+    except ValueError:
+        raise SearchError(f"'{text}' is not a date, use YYYY, YYYY-MM or YYYY-MM-DD.")
+
+
+def date_predicate(column, text):
+    # Every date search is a half open range over whole periods: 2023-06 is
+    # date >= 2023-06-01 and date < 2023-07-01
+    if isinstance(column.type, types.DateTime):
+        bound = lambda day: datetime.combine(day, datetime.min.time())
+    else:
+        bound = lambda day: day
+
+    operator, value = split_search(text)
+
+    if operator == RANGE_SEPARATOR:
+        low, high = value
+        criteria = []
+        if low is not None:
+            criteria.append(column >= bound(parse_period(low)[0]))
+        if high is not None:
+            criteria.append(column < bound(parse_period(high)[1]))
+        return and_(*criteria)
+
+    start, end = parse_period(value)
+
+    if operator == '=':
+        return and_(column >= bound(start), column < bound(end))
+    if operator == '>':
+        return column >= bound(end)
+    if operator == '>=':
+        return column >= bound(start)
+    if operator == '<':
+        return column < bound(start)
+    return column < bound(end)
+
+
+def boolean_predicate(column, text):
+    value = BOOLEAN_VALUES.get(text.strip().lower())
+    if value is None:
+        raise SearchError(f"'{text}' is not yes or no.")
+    return column == value
+
+
+def column_predicate(model, name, text):
+    # Criterion for a search on one column of a model, according to its type. Raises
+    # SearchError when the text doesn't parse as the column's type.
+    column = getattr(model, name)
+    column_type = model.__table__.columns[name].type
+
+    if name in searchable_columns(model):
+        return search_filter(model, text, [name])
+    if isinstance(column_type, types.Boolean):
+        return boolean_predicate(column, text)
+    if isinstance(column_type, (types.Date, types.DateTime)):
+        return date_predicate(column, text)
+    if isinstance(column_type, (types.Integer, types.Numeric, types.Float)):
+        return number_predicate(column, text)
+
+    return column.ilike(f"%{text}%")
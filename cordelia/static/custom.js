@@ -28,6 +28,99 @@ function confirmAction(message) {
     }
 }
 
+/* Background database export */
+
+function startExportJob(event, message) {
+    event.preventDefault();
+
+    if (!confirm(message)) {
+        alert('Action canceled.');
+        return false;
+    }
+
+    var form = event.target;
+    var progress = form.parentElement.querySelector('.export-progress');
+    var data = new FormData();
+    data.append('format', form.elements['format'].value);
+    data.append('csrf_token', form.dataset.csrfToken);
+
+    fetch(form.dataset.jobUrl, {method: 'POST', body: data, credentials: 'same-origin'})
+        .then(function(response) { return response.json(); })
+        .then(function(job) {
+            if (!job.status_url) {
+                // Fall back to the direct download
+                form.submit();
+                return;
+            }
+            pollExportJob(job, progress);
+        });
+
+    return false;
+}
+
+function pollExportJob(job, progress) {
+    fetch(job.status_url, {credentials: 'same-origin'})
+        .then(function(response) { return response.json(); })
+        .then(function(status) {
+            if (status.status === 'done') {
+                progress.textContent = '';
+                window.location = job.download_url;
+            } else if (status.status === 'failed') {
+                progress.textContent = '';
+                alert('Export failed: ' + status.error);
+            } else {
+                progress.textContent = status.rows + ' rows';
+                setTimeout(function() { pollExportJob(job, progress); }, 1000);
+            }
+        });
+}
+
+/* Dress and customer lookup */
+
+var lookupTimers = {};
+
+function lookupAutocomplete(input) {
+    var container = input.parentElement;
+    var results = container.querySelector('.lookup-results');
+    var hidden = container.querySelector('input[type=hidden]');
+
+    // A new search clears the previous pick
+    hidden.value = '';
+
+    clearTimeout(lookupTimers[input.dataset.lookupUrl]);
+    lookupTimers[input.dataset.lookupUrl] = setTimeout(function() {
+        var query = input.value.trim();
+        if (!query) {
+            results.innerHTML = '';
+            return;
+        }
+
+        fetch(input.dataset.lookupUrl + '?q=' + encodeURIComponent(query), {credentials: 'same-origin'})
+            .then(function(response) { return response.json(); })
+            .then(function(data) {
+                // Ignore answers to a query that has since changed
+                if (input.value.trim() !== query) {
+                    return;
+                }
+
+                results.innerHTML = '';
+                data.results.forEach(function(result) {
+                    var item = document.createElement('button');
+                    item.type = 'button';
+                    item.className = 'list-group-item list-group-item-action py-1';
+                    item.style.fontSize = '12px';
+                    item.textContent = result.label;
+                    item.onclick = function() {
+                        hidden.value = result.id;
+                        input.value = result.label;
+                        results.innerHTML = '';
+                    };
+                    results.appendChild(item);
+                });
+            });
+    }, 150);
+}
+
 /* Maintenance modal */
 
 var dressCount = parseInt(document.getElementById('dressCountInput').value);
@@ -0,0 +1,108 @@
+from collections import defaultdict
+from sqlalchemy.orm import joinedload
+from cordelia.db import db
+from cordelia.models import Rent, Maintenance, Sale, maintenance_association
+
+
+# Precomputed row state for the dashboard templates. Resolving a whole page at once
+# replaces per-row lazy loads and Python sorts of the rents and maintenances of each dress.
+class DressStatus:
+    def __init__(self, rents, maintenances, sale=None):
+        # Both histories are expected newest first
+        self.rents = rents
+        self.maintenances = maintenances
+        self.sale = sale
+
+        self.last_rent = rents[0] if rents else None
+        self.last_customer = self.last_rent.customer if self.last_rent else None
+        self.last_maintenance = maintenances[0] if maintenances else None
+
+        # The latest rent may be a booking that has not started yet
+        self.rented = any(rent.is_active() for rent in rents)
+        self.in_maintenance = not self.last_maintenance.is_returned() if self.last_maintenance else False
+
+        # A rented dress needs a check unless it went through maintenance after its last rent
+        self.needs_check = bool(self.last_rent) and (
+            self.last_maintenance is None or self.last_rent.rentDate > self.last_maintenance.date
+        )
+
+
+class CustomerStatus:
+    def __init__(self, rents):
+        self.rents = rents
+
+        self.last_rent = rents[0] if rents else None
+        self.last_dress = self.last_rent.dress if self.last_rent else None
+
+        self.active = any(rent.is_active() for rent in rents)
+
+
+def resolve_dress_statuses(dresses):
+    # Resolve the statuses of a page of dresses with one query per related table
+    dress_ids = [dress.id for dress in dresses]
+    if not dress_ids:
+        return {}
+
+    rents = defaultdict(list)
+    rent_query = Rent.query.options(joinedload(Rent.customer)).filter(
+        Rent.dressId.in_(dress_ids)
+    ).order_by(Rent.rentDate.desc(), Rent.id.desc())
+    for rent in rent_query:
+        rents[rent.dressId].append(rent)
+
+    maintenances = defaultdict(list)
+    maintenance_query = db.session.query(maintenance_association.c.dress_id, Maintenance).join(
+        Maintenance,
+        maintenance_association.c.maintenance_id == Maintenance.id
+    ).filter(
+        maintenance_association.c.dress_id.in_(dress_ids)
+    ).order_by(Maintenance.date.desc(), Maintenance.id.desc())
+    for dress_id, maintenance in maintenance_query:
+        maintenances[dress_id].append(maintenance)
+
+    # Only sold dresses have a sale to show
+    sold_ids = [dress.id for dress in dresses if dress.sold]
+    sales = {}
+    if sold_ids:
+        sales = {sale.dress_id: sale for sale in Sale.query.filter(Sale.dress_id.in_(sold_ids))}
+
+    return {
+        dress_id: DressStatus(rents[dress_id], maintenances[dress_id], sales.get(dress_id))
+        for dress_id in dress_ids
+    }
+
+
+def resolve_customer_statuses(customers):
+    customer_ids = [customer.id for customer in customers]
+    if not customer_ids:
+        return {}
+
+    rents = defaultdict(list)
+    rent_query = Rent.query.options(joinedload(Rent.dress)).filter(
+        Rent.clientId.in_(customer_ids)
+    ).order_by(Rent.rentDate.desc(), Rent.id.desc())
+    for rent in rent_query:
+        rents[rent.clientId].append(rent)
+
+    return {customer_id: CustomerStatus(rents[customer_id]) for customer_id in customer_ids}
+
+
+def resolve_maintenance_dresses(maintenances):
+    # Dress ids of a page of maintenances, grouped in SQL with one query on the association table
+    maintenance_ids = [maintenance.id for maintenance in maintenances]
+    if not maintenance_ids:
+        return {}
+
+    statement = db.select(
+        maintenance_association.c.maintenance_id,
+        db.func.group_concat(maintenance_association.c.dress_id)
+    ).where(
+        maintenance_association.c.maintenance_id.in_(maintenance_ids)
+    ).group_by(maintenance_association.c.maintenance_id)
+
+    dress_ids = {
+        maintenance_id: sorted(int(dress_id) for dress_id in concatenated.split(','))
+        for maintenance_id, concatenated in db.session.execute(statement)
+    }
+
+    return {maintenance_id: dress_ids.get(maintenance_id, []) for maintenance_id in maintenance_ids}
@@ -3,7 +3,7 @@ import tempfile
 import pytest
 from cordelia import create_app
 from cordelia.db import db, get_session, close_session
-from cordelia.models import User
+from cordelia.models import User, Dress, Customer
 
 
 
@@ -50,6 +50,35 @@ def app():
 
 
 
+# Field values of the dresses and customers made by add_stock, overridable per row
+DRESS_FIELDS = {'size': 4, 'color': 'Red', 'style': 'Gown', 'brand': 'Zara', 'cost': 1000, 'rentPrice': 1800}
+CUSTOMER_FIELDS = {'name': 'Ana', 'lastName': 'Pérez'}
+
+
+@pytest.fixture
+def add_stock(app):
+    # Adds dresses and customers in one commit and returns their ids. Each of dresses and customers
+    # is a count or a list of per-row field overrides. Call it inside an app context.
+    def add(dresses=1, customers=1):
+        if isinstance(dresses, int):
+            dresses = [{}] * dresses
+        if isinstance(customers, int):
+            customers = [{}] * customers
+
+        dress_rows = [Dress(**{**DRESS_FIELDS, **fields}) for fields in dresses]
+        customer_rows = [
+            Customer(**{**CUSTOMER_FIELDS, 'email': f'ana{i or ""}@example.com', **fields})
+            for i, fields in enumerate(customers)
+        ]
+        db.session.add_all(dress_rows + customer_rows)
+        db.session.commit()
+
+        return [dress.id for dress in dress_rows], [customer.id for customer in customer_rows]
+
+    return add
+
+
+
 @pytest.fixture
 def client(app):
     return app.test_client()
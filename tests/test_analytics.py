@@ -0,0 +1,116 @@
+from cordelia.models import Dress, Customer, Rent
+import sqlite3
+from cordelia.db import db, get_table_version, get_table_modified
+from cordelia.analytics import analytics
+from cordelia.loaders import load_table
+from datetime import date
+
+
+
+def test_table_versions_bump_on_commit(app):
+    with app.app_context():
+        version = get_table_version('customer')
+
+        customer = Customer(email='test_customer@example.com', name='test', lastName='customer', phoneNumber=6641234567)
+        db.session.add(customer)
+        db.session.flush()
+        assert get_table_version('customer') == version
+
+        db.session.commit()
+        assert get_table_version('customer') != version
+
+        version = get_table_version('customer')
+        db.session.execute(db.update(Customer).values(name='updated'))
+        db.session.rollback()
+        assert get_table_version('customer') == version
+
+
+def test_analytics_rebuilds_changed_tables(app):
+    with app.app_context():
+        analytics.clear()
+        assert analytics.get('dress').empty
+
+        db.session.add(Dress(size=4, color='example color', style='example style', brand='example brand', cost=4200, rentPrice=1800))
+        db.session.commit()
+
+        df_dress = analytics.get('dress')
+        assert len(df_dress) == 1
+
+        # Mutating a returned frame doesn't touch the cached one
+        df_dress['Cost'] = 0
+        assert analytics.get('dress')['Cost'].tolist() == [4200]
+
+
+def test_analytics_ignore_uncommitted_rows(app):
+    with app.app_context():
+        analytics.clear()
+
+        # A flushed but uncommitted row is not cached under the committed version
+        db.session.add(Dress(size=4, color='example color', style='example style', brand='example brand', cost=4200, rentPrice=1800))
+        db.session.flush()
+        assert analytics.get('dress').empty
+
+        db.session.rollback()
+        assert analytics.get('dress').empty
+
+
+def test_aggregate_datasets(app):
+    with app.app_context():
+        analytics.clear()
+        assert analytics.get('rents_by_month').empty
+
+        dress = Dress(size=4, color='example color', style='example style', brand='example brand', cost=4200, rentPrice=1800)
+        customers = [
+            Customer(email=f'test_customer{i}@example.com', name='test', lastName='customer', phoneNumber=6641234560 + i)
+            for i in range(2)
+        ]
+        db.session.add_all([dress] + customers)
+        db.session.commit()
+
+        # Monday, Monday and Wednesday
+        for customer, rent_date in [(customers[0], date(2023, 1, 2)), (customers[0], date(2023, 1, 9)), (customers[1], date(2023, 2, 1))]:
+            db.session.add(Rent(dressId=dress.id, clientId=customer.id, rentDate=rent_date, paymentMethod='Cash'))
+        db.session.commit()
+
+        df_rents = analytics.get('rents_by_month')
+        assert [str(month) for month in df_rents.index] == ['2023-01', '2023-02']
+        assert list(df_rents['Rents']) == [2, 1]
+        assert list(df_rents['Earnings']) == [4176, 2088]
+
+        df_top = analytics.get('top_customers_by_rentals')
+        assert list(df_top.index) == [customers[0].id, customers[1].id]
+        assert list(df_top['Total Rentals']) == [2, 1]
+
+        df_weekdays = analytics.get('rents_by_weekday')
+        assert df_weekdays['Rents'].to_dict() == {'Monday': 2, 'Wednesday': 1}
+
+
+def test_load_table_dtypes(app):
+    with app.app_context():
+        assert list(load_table('rent').columns) == ['Id', 'Dress Id', 'Customer Id', 'Rent Date', 'Return Date', 'Payment Total', 'Payment Method']
+
+        db.session.add(Dress(size=4, color='example color', style='example style', brand='example brand', cost=4200, rentPrice=1800))
+        db.session.commit()
+
+        df_dress = load_table('dress')
+        assert str(df_dress['Date Added'].dtype) == 'datetime64[ns]'
+        assert str(df_dress['Color'].dtype) == 'category'
+        assert df_dress.loc[0, 'Brand'] == 'example brand'
+
+
+def test_table_versions_see_other_connections(app):
+    with app.app_context():
+        analytics.clear()
+        assert analytics.get('customer').empty
+        version = get_table_version('customer')
+        modified = get_table_modified('customer')
+
+        # As another worker or a CLI command would, without the app's session
+        connection = sqlite3.connect(db.engine.url.database)
+        connection.execute("INSERT INTO customer (name, lastName, email) VALUES ('Ana', 'Pérez', 'ana@example.com')")
+        connection.commit()
+        connection.close()
+
+        assert get_table_version('customer') != version
+        assert get_table_modified('customer') >= modified
+        assert analytics.get('customer')['Name'].tolist() == ['Ana']
@@ -0,0 +1,115 @@
+import sqlite3
+from datetime import date
+from cordelia.models import Dress, Customer, Rent, Maintenance
+from cordelia.db import db
+from cordelia.availability import available_dresses, conflicting_bookings, is_available
+
+
+
+def add_bookings(add_stock):
+    dress_ids, (customer_id,) = add_stock(dresses=[{}, {}, {'size': 6}, {'style': 'Cocktail'}])
+
+    # Dress 1 out June 1 to 4, dress 2 in maintenance June 10 to 12, dress 3 rented years ago
+    db.session.add(Rent(dressId=dress_ids[0], clientId=customer_id, rentDate=date(2023, 6, 1), paymentMethod='Cash'))
+    db.session.add(Maintenance(date=date(2023, 6, 10), maintenance_type='Cleaning', cost=100, dresses=[db.session.get(Dress, dress_ids[1])]))
+    db.session.add(Rent(dressId=dress_ids[2], clientId=customer_id, rentDate=date(2019, 1, 1), paymentMethod='Cash'))
+    db.session.commit()
+
+    return dress_ids
+
+
+def test_available_dresses(app, add_stock):
+    with app.app_context():
+        first, second, third, fourth = add_bookings(add_stock)
+
+        def free(start, end, **filters):
+            return [dress.id for dress in available_dresses(start, end, **filters)]
+
+        assert free(date(2023, 5, 25), date(2023, 5, 31)) == [first, second, third, fourth]
+        # Both ends of a booking are taken
+        assert free(date(2023, 5, 25), date(2023, 6, 1)) == [second, third, fourth]
+        assert free(date(2023, 6, 4), date(2023, 6, 4)) == [second, third, fourth]
+        assert free(date(2023, 6, 5), date(2023, 6, 9)) == [first, second, third, fourth]
+        # A range covering a whole booking
+        assert free(date(2023, 6, 9), date(2023, 6, 13)) == [first, third, fourth]
+        assert free(date(2023, 5, 1), date(2023, 7, 1), size=4) == [fourth]
+        assert free(date(2023, 5, 1), date(2023, 7, 1), style='Gown') == [third]
+
+
+def test_conflicting_bookings(app, add_stock):
+    with app.app_context():
+        first, second, third, fourth = add_bookings(add_stock)
+
+        rent = Rent.query.filter_by(dressId=first).one()
+        assert conflicting_bookings(first, date(2023, 6, 3), date(2023, 6, 6)) == [rent]
+        assert conflicting_bookings(first, date(2023, 6, 3), date(2023, 6, 6), exclude_rent_id=rent.id) == []
+        assert [booking.maintenance_type for booking in conflicting_bookings(second, date(2023, 6, 12), date(2023, 6, 15))] == ['Cleaning']
+
+        assert not is_available(first, date(2023, 5, 29), date(2023, 6, 1))
+        assert is_available(first, date(2023, 6, 5), date(2023, 6, 8))
+
+        db.session.get(Dress, fourth).sold = True
+        db.session.commit()
+        assert not is_available(fourth, date(2023, 6, 5), date(2023, 6, 8))
+        assert not is_available(12345, date(2023, 6, 5), date(2023, 6, 8))
+
+
+def test_availability_endpoint(app, client, add_stock):
+    with app.app_context():
+        first, second, third, fourth = add_bookings(add_stock)
+
+    response = client.get('/availability?start=2023-06-02&end=2023-06-11&size=4')
+    assert response.status_code == 200
+    assert response.json == {'start': '2023-06-02', 'end': '2023-06-11', 'count': 1, 'dresses': [fourth]}
+
+    assert client.get('/availability?start=2023-06-02&end=2023-06-01').status_code == 400
+    assert client.get('/availability?start=June').status_code == 400
+
+
+def test_overlapping_rent_rejected(app, client, auth, add_stock):
+    with app.app_context():
+        first, second, third, fourth = add_bookings(add_stock)
+        customer_id = Customer.query.first().id
+
+    auth.login()
+    data = {'customerId': customer_id, 'dressId': first, 'rentDate': '2023-05-30', 'paymentMethod': 'Cash'}
+    response = client.post('/admin/dashboard/update/Rent/rent', data=data)
+    assert b'Dress not available for those dates.' in response.data
+
+    data['rentDate'] = '2023-06-05'
+    response = client.post('/admin/dashboard/update/Rent/rent', data=data)
+    assert response.status_code == 302
+
+    with app.app_context():
+        assert Rent.query.filter_by(dressId=first).count() == 2
+
+
+def test_rents_of_deleted_dresses(app, add_stock):
+    with app.app_context():
+        first, second, third, fourth = add_bookings(add_stock)
+
+        # Its rent stays, with a NULL dressId
+        db.session.delete(db.session.get(Dress, first))
+        db.session.commit()
+        assert Rent.query.filter(Rent.dressId.is_(None)).count() == 1
+
+        assert [dress.id for dress in available_dresses(date(2023, 6, 2), date(2023, 6, 3))] == [second, third, fourth]
+
+
+def test_long_rent_written_elsewhere(app, add_stock):
+    with app.app_context():
+        first, second, third, fourth = add_bookings(add_stock)
+        customer_id = Customer.query.first().id
+        assert is_available(fourth, date(2023, 3, 20), date(2023, 3, 25))
+
+        # A month long rent imported by another process, starting well before the range
+        connection = sqlite3.connect(db.engine.url.database)
+        connection.execute(
+            "INSERT INTO rent (dressId, clientId, rentDate, returnDate, paymentMethod) VALUES (?, ?, '2023-03-01', '2023-03-31', 'Cash')",
+            (fourth, customer_id)
+        )
+        connection.commit()
+        connection.close()
+
+        assert not is_available(fourth, date(2023, 3, 20), date(2023, 3, 25))
+        assert fourth not in [dress.id for dress in available_dresses(date(2023, 3, 20), date(2023, 3, 25))]
@@ -0,0 +1,115 @@
+import threading
+from datetime import date
+import pytest
+from cordelia.models import Dress, Rent
+from cordelia.db import db
+from cordelia.booking import book_rent, run_with_retry, BookingError, BookingConflict
+
+
+
+def test_book_rent(app, add_stock):
+    with app.app_context():
+        (dress_id,), (customer_id,) = add_stock()
+
+        rent = book_rent(dress_id, customer_id, date(2023, 6, 1), 'Cash')
+        assert rent.returnDate == date(2023, 6, 4)
+        # Recording the rent moved the dress to a new version
+        assert db.session.get(Dress, dress_id).version > 1
+
+        with pytest.raises(BookingError, match='not available'):
+            book_rent(dress_id, customer_id, date(2023, 6, 3), 'Cash')
+        with pytest.raises(BookingError, match='not found'):
+            book_rent(12345, customer_id, date(2023, 6, 3), 'Cash')
+
+        assert Rent.query.count() == 1
+
+
+def test_stale_dress_is_retried(app, add_stock):
+    with app.app_context():
+        (dress_id,), (customer_id,) = add_stock()
+        attempts = []
+
+        def transaction():
+            dress = db.session.get(Dress, dress_id, populate_existing=True)
+            if not attempts:
+                # Someone else updates the dress between our read and our write
+                with db.engine.begin() as connection:
+                    connection.exec_driver_sql('UPDATE dress SET version = version + 1')
+            attempts.append(dress.version)
+            dress.color = 'Blue'
+            db.session.flush()
+
+        run_with_retry(transaction, base_delay=0)
+        assert attempts == [1, 2]
+        assert db.session.get(Dress, dress_id).version == 3
+
+        def always_stale():
+            dress = db.session.get(Dress, dress_id, populate_existing=True)
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql('UPDATE dress SET version = version + 1')
+            dress.color = 'Green'
+            db.session.flush()
+
+        with pytest.raises(BookingConflict):
+            run_with_retry(always_stale, attempts=3, base_delay=0)
+        assert db.session.get(Dress, dress_id, populate_existing=True).color == 'Blue'
+
+
+def test_concurrent_bookings(app, add_stock):
+    with app.app_context():
+        (dress_id,), (customer_id,) = add_stock()
+
+    results = []
+    barrier = threading.Barrier(6)
+
+    def book():
+        with app.app_context():
+            barrier.wait()
+            try:
+                book_rent(dress_id, customer_id, date(2023, 6, 1), 'Cash')
+                results.append('booked')
+            except BookingError as e:
+                results.append(type(e).__name__)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=book) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Exactly one booking, the others find the dress taken
+    assert results.count('booked') == 1
+    with app.app_context():
+        assert Rent.query.count() == 1
+        dress = db.session.get(Dress, dress_id)
+        assert dress.timesRented == 1
+
+
+def test_cart_checkout(app, client, auth, add_stock):
+    with app.app_context():
+        (dress_id,), _ = add_stock(customers=0)
+
+    auth.login()
+    response = client.get(f'/cart/{dress_id}')
+    assert response.status_code == 200
+    assert b'Payment Method' in response.data
+
+    data = {'rentDate': '2023-06-01', 'paymentMethod': 'Transfer'}
+    response = client.post(f'/cart/{dress_id}', data=data)
+    assert response.status_code == 302
+
+    with app.app_context():
+        rent = Rent.query.one()
+        assert (rent.dressId, rent.rentDate, rent.paymentMethod, rent.paymentTotal) == (dress_id, date(2023, 6, 1), 'Transfer', 2088)
+        rent_id = rent.id
+
+    response = client.get(response.headers['Location'])
+    assert response.status_code == 200
+    assert b'Transfer' in response.data
+    assert client.get(f'/checkout/{rent_id + 1}').status_code == 404
+
+    # The same dates again
+    response = client.post(f'/cart/{dress_id}', data=data)
+    assert b'Dress not available for those dates.' in response.data
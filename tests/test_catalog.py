@@ -0,0 +1,70 @@
+from werkzeug.datastructures import MultiDict
+from cordelia.models import Dress
+from cordelia.db import db
+from cordelia.catalog import catalog_filters, facet_counts, price_range, facet_cache
+
+
+
+# One rented and one sold dress
+CATALOG_DRESSES = [
+    {'rentPrice': 1500},
+    {'color': 'Blue', 'rentPrice': 2000, 'rentStatus': True},
+    {'size': 6, 'style': 'Cocktail', 'brand': 'Mango', 'rentPrice': 2500},
+    {'size': 8, 'brand': 'Mango', 'rentPrice': 3000, 'sold': True},
+]
+
+
+def test_catalog_filters():
+    filters = catalog_filters(MultiDict([('size', '6'), ('size', '4'), ('size', 'x'), ('color', 'Red'), ('color', ''),
+                                         ('min_price', '1000'), ('available', '1')]))
+    assert filters == {'size': (4, 6), 'color': ('Red',), 'min_price': 1000, 'available': True}
+
+
+def test_facet_counts(app, add_stock):
+    with app.app_context():
+        facet_cache.clear()
+        dress_ids, _ = add_stock(dresses=CATALOG_DRESSES, customers=0)
+
+        # Sold dresses are left out, a facet's own filter doesn't narrow its counts
+        facets = facet_counts({'color': ('Red',)})
+        assert facets['color'] == [('Blue', 1), ('Red', 2)]
+        assert facets['size'] == [(4, 1), (6, 1)]
+        assert facets['brand'] == [('Mango', 1), ('Zara', 1)]
+        assert facets['available'] == 2
+        assert facet_counts({'available': True})['size'] == [(4, 1), (6, 1)]
+        assert price_range() == (1500, 2500)
+
+        # Cached until the inventory changes
+        cached_entries = len(facet_cache)
+        assert facet_counts({'color': ('Red',)}) == facets
+        assert len(facet_cache) == cached_entries
+
+        db.session.get(Dress, dress_ids[2]).color = 'Blue'
+        db.session.commit()
+        assert facet_counts({'color': ('Red',)})['color'] == [('Blue', 2), ('Red', 1)]
+
+
+def test_catalog_page(app, client, add_stock):
+    with app.app_context():
+        add_stock(dresses=CATALOG_DRESSES, customers=0)
+
+    response = client.get('/catalog?color=Red&sort=price')
+    assert response.status_code == 200
+    assert b'Zara &middot; Gown' in response.data
+    assert b'Mango &middot; Cocktail' in response.data
+    # Sold
+    assert b'$3000' not in response.data
+
+    response = client.get('/catalog?available=1&max_price=2000')
+    assert b'$1500' in response.data
+    assert b'$2000' not in response.data
+    assert b'$2500' not in response.data
+
+    with app.app_context():
+        for i in range(30):
+            db.session.add(Dress(size=10, color='Green', style='Gown', brand='Zara', cost=1000, rentPrice=1000 + i))
+        db.session.commit()
+
+    response = client.get('/catalog?color=Green&sort=price')
+    assert response.data.count(b'card-title') == 24
+    assert b'color=Green' in response.data and b'after=' in response.data
@@ -0,0 +1,79 @@
+from cordelia.models import Dress, Customer, Maintenance
+from cordelia.db import db
+from cordelia.excel import write_workbook
+from datetime import datetime, timedelta
+from io import BytesIO
+import os
+import zipfile
+import gzip
+import json
+import pandas as pd
+
+
+
+def test_write_workbook_in_chunks(app):
+    with app.app_context():
+        dresses = [
+            Dress(size=4, color='example color', style='example style', brand=f'brand {i}', cost=4200, rentPrice=1800)
+            for i in range(5)
+        ]
+        db.session.add_all(dresses)
+        db.session.commit()
+
+        maintenance = Maintenance(date=datetime.utcnow().date(), returnDate=datetime.utcnow().date() + timedelta(days=2), maintenance_type='Cleaning', cost=200)
+        maintenance.dresses.extend(dresses[:2])
+        db.session.add(maintenance)
+        db.session.commit()
+
+        output = BytesIO()
+        write_workbook(output, chunksize=2)
+
+    sheets = pd.read_excel(BytesIO(output.getvalue()), sheet_name=None)
+    assert list(sheets) == ['Dresses', 'Maintenances']
+    assert list(sheets['Dresses']['Brand']) == [f'brand {i}' for i in range(5)]
+    assert list(sheets['Maintenances']['Dresses']) == ['1, 2']
+
+
+def test_download_excel_streams(app, client, auth):
+    auth.login()
+
+    with app.app_context():
+        db.session.add(Customer(email='test_customer@example.com', name='test', lastName='customer', phoneNumber=6641234567))
+        db.session.commit()
+
+    uploads = os.path.join(app.instance_path, 'uploads')
+    files_before = set(os.listdir(uploads)) if os.path.isdir(uploads) else set()
+
+    response = client.get('/admin/download/db-xlsx')
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert 'attachment' in response.headers['Content-Disposition']
+
+    sheets = pd.read_excel(BytesIO(response.get_data()), sheet_name=None)
+    assert list(sheets['Customers']['Email']) == ['test_customer@example.com']
+
+    files_after = set(os.listdir(uploads)) if os.path.isdir(uploads) else set()
+    assert files_after == files_before
+
+
+def test_download_export_formats(app, client, auth):
+    auth.login()
+
+    with app.app_context():
+        db.session.add(Customer(email='test_customer@example.com', name='test', lastName='customer', phoneNumber=6641234567))
+        db.session.commit()
+
+    response = client.get('/admin/download/db-xlsx?format=csv')
+    assert response.status_code == 200
+    archive = zipfile.ZipFile(BytesIO(response.get_data()))
+    assert archive.namelist() == ['Dresses.csv', 'Customers.csv', 'Rents.csv', 'Maintenances.csv']
+    assert list(pd.read_csv(archive.open('Customers.csv'))['Email']) == ['test_customer@example.com']
+
+    response = client.get('/admin/download/db-xlsx?format=ndjson.gz')
+    rows = [json.loads(line) for line in gzip.decompress(response.get_data()).splitlines()]
+    assert rows == [{
+        'table': 'customer', 'Id': 1, 'Email': 'test_customer@example.com', 'Name': 'test',
+        'Last Name': 'customer', 'Phone Number': 6641234567, 'Date Added': rows[0]['Date Added']
+    }]
+
+    assert client.get('/admin/download/db-xlsx?format=pdf').status_code == 404
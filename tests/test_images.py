@@ -0,0 +1,103 @@
+import os
+from base64 import b64encode
+from io import BytesIO
+from PIL import Image
+import pytest
+from cordelia.models import Dress
+from cordelia.db import db
+from cordelia.images import store_image, image_path, variant_path, migrate_images, image_variants, image_srcset, ImageError, IMAGE_VARIANT_WIDTHS
+
+
+
+def png_bytes(color):
+    output = BytesIO()
+    Image.new('RGB', (4, 4), color).save(output, format='PNG')
+    return output.getvalue()
+
+
+@pytest.fixture
+def image_app(app, tmp_path):
+    app.instance_path = str(tmp_path)
+    return app
+
+
+def test_store_image(image_app):
+    with image_app.app_context():
+        image_hash = store_image(png_bytes('red'))
+
+        assert store_image(png_bytes('red')) == image_hash
+        assert store_image(png_bytes('blue')) != image_hash
+        with open(image_path(image_hash), 'rb') as file:
+            assert file.read() == png_bytes('red')
+
+        with pytest.raises(ImageError):
+            store_image(b'not an image')
+        with pytest.raises(ImageError):
+            image_path('../../config.py')
+
+
+def test_dress_image_endpoint(image_app, client):
+    with image_app.app_context():
+        image_hash = store_image(png_bytes('red'))
+
+    response = client.get(f'/images/{image_hash}')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+    assert response.data == png_bytes('red')
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == 31536000
+
+    response = client.get(f'/images/{image_hash}', headers={'If-None-Match': f'"{image_hash}"'})
+    assert response.status_code == 304
+
+    assert client.get('/images/' + '0' * 64).status_code == 404
+    assert client.get('/images/not-a-hash').status_code == 404
+
+
+def test_migrate_images(image_app):
+    with image_app.app_context():
+        inline = Dress(size=4, color='Red', style='Gown', brand='Zara', cost=1000, rentPrice=1800,
+                       imageData=b64encode(png_bytes('red')).decode())
+        broken = Dress(size=4, color='Red', style='Gown', brand='Zara', cost=1000, rentPrice=1800,
+                       imageData='not base64!')
+        empty = Dress(size=4, color='Red', style='Gown', brand='Zara', cost=1000, rentPrice=1800)
+        db.session.add_all([inline, broken, empty])
+        db.session.commit()
+
+        assert migrate_images(batch_size=1) == (1, 1)
+
+        dress = db.session.get(Dress, inline.id)
+        assert os.path.exists(image_path(dress.imageData))
+        assert db.session.get(Dress, broken.id).imageData == 'not base64!'
+        assert db.session.get(Dress, empty.id).imageData is None
+
+        # Already migrated photos are left alone
+        assert migrate_images() == (0, 1)
+
+
+def test_image_variants(image_app, client):
+    with image_app.app_context():
+        output = BytesIO()
+        Image.new('RGB', (800, 1200), 'red').save(output, format='JPEG')
+        image_hash = store_image(output.getvalue())
+
+        # Until the variants exist the original is served, uncached
+        response = client.get(f'/images/{image_hash}/160.webp')
+        assert response.status_code == 200
+        assert response.mimetype == 'image/jpeg'
+        assert not response.cache_control.immutable
+
+        image_variants.submit(image_hash).result(timeout=60)
+
+        for width in IMAGE_VARIANT_WIDTHS:
+            with Image.open(variant_path(image_hash, width)) as variant:
+                assert variant.format == 'WEBP'
+                # Never upscaled
+                assert variant.size[0] == min(width, 800)
+
+        assert f'/images/{image_hash}/640.webp 640w' in image_srcset(image_hash)
+
+    response = client.get(f'/images/{image_hash}/160.webp')
+    assert response.mimetype == 'image/webp'
+    assert response.cache_control.immutable
+    assert client.get(f'/images/{image_hash}/100.webp').status_code == 404
@@ -0,0 +1,134 @@
+import io
+from datetime import date
+import pandas as pd
+from cordelia.models import Dress, Customer, Rent
+from cordelia.db import db, get_data_version
+from cordelia.importer import import_frame, import_file, ImportFileError
+
+
+def frame(rows):
+    return pd.DataFrame(rows, dtype=str)
+
+
+def test_import_dresses(app):
+    with app.app_context():
+        version = get_data_version('dress')
+        dresses = frame([
+            {'Brand': 'Zara', 'Size': '4', 'Color': 'Red', 'Style': 'Gown', 'Cost': '1,000', 'Rent Price': '500'},
+            {'Brand': 'Mango', 'Size': 'small', 'Color': 'Blue', 'Style': 'Gown', 'Cost': '800', 'Rent Price': '0'},
+            {'Brand': '', 'Size': '6', 'Color': 'Green', 'Style': 'A very long style name', 'Cost': '900', 'Rent Price': '300'},
+            {'Brand': 'Mango', 'Size': '8', 'Color': 'Black', 'Style': 'Cocktail', 'Cost': '900', 'Rent Price': '300'},
+        ])
+
+        result = import_frame('dress', dresses, chunk_size=1)
+
+        assert (result.rows, result.inserted, result.failed) == (4, 2, 2)
+        assert result.errors.to_dict('records') == [
+            {'line': 3, 'column': 'size', 'error': 'Not a whole number.'},
+            {'line': 3, 'column': 'rentPrice', 'error': 'Less than 1.'},
+            {'line': 4, 'column': 'style', 'error': 'Longer than 15 characters.'},
+            {'line': 4, 'column': 'brand', 'error': 'Required.'},
+        ]
+
+        zara, mango = Dress.query.order_by(Dress.id).all()
+        assert (zara.cost, zara.rentsForReturns, zara.timesRented, zara.version) == (1000, 2, 0, 1)
+        assert mango.brand == 'Mango' and mango.dateAdded is not None
+        assert get_data_version('dress') != version
+
+
+def test_import_customers(app):
+    with app.app_context():
+        db.session.add(Customer(name='Ana', lastName='Pérez', email='ana@example.com', phoneNumber=526441234567))
+        db.session.commit()
+
+        customers = frame([
+            {'name': 'Eva', 'lastName': 'Luna', 'email': 'Eva@Example.com', 'phoneNumber': '644 765 4321'},
+            {'name': 'Ana', 'lastName': 'Pérez', 'email': 'ANA@example.com', 'phoneNumber': '+52 644 111 2222'},
+            {'name': 'Sol', 'lastName': 'Ruiz', 'email': 'sol@example', 'phoneNumber': '6441234567'},
+            {'name': 'Eva', 'lastName': 'Luna', 'email': 'eva@example.com', 'phoneNumber': '123'},
+        ])
+
+        result = import_frame('customer', customers)
+
+        assert result.inserted == 1
+        assert result.errors.to_dict('records') == [
+            {'line': 3, 'column': 'email', 'error': 'Already exists.'},
+            {'line': 4, 'column': 'email', 'error': 'Invalid email.'},
+            {'line': 4, 'column': 'phoneNumber', 'error': 'Already exists.'},
+            {'line': 5, 'column': 'email', 'error': 'Duplicate of an earlier row.'},
+            {'line': 5, 'column': 'phoneNumber', 'error': 'Invalid phone number.'},
+        ]
+
+        eva = Customer.query.filter_by(name='Eva').one()
+        assert (eva.email, eva.phoneNumber) == ('eva@example.com', 526447654321)
+
+
+def test_import_rents(app):
+    with app.app_context():
+        customer = Customer(name='Ana', lastName='Pérez', email='ana@example.com')
+        dress = Dress(size=4, color='Red', style='Gown', brand='Zara', cost=1000, rentPrice=500)
+        db.session.add_all([customer, dress])
+        db.session.commit()
+
+        rents = frame([
+            {'Dress Id': str(dress.id), 'Customer Id': str(customer.id), 'Rent Date': '2023-06-01', 'Payment Method': 'cash'},
+            {'Dress Id': str(dress.id), 'Customer Id': str(customer.id), 'Rent Date': '2023-07-01',
+             'Return Date': '2023-07-10', 'Payment Method': 'Transfer', 'Payment Total': '600'},
+            {'Dress Id': '999', 'Customer Id': str(customer.id), 'Rent Date': 'June', 'Payment Method': 'Cheque'},
+        ])
+
+        result = import_frame('rent', rents)
+
+        assert result.inserted == 2
+        assert result.errors.to_dict('records') == [
+            {'line': 4, 'column': 'dressId', 'error': 'Unknown dress.'},
+            {'line': 4, 'column': 'rentDate', 'error': 'Not a date.'},
+            {'line': 4, 'column': 'paymentMethod', 'error': 'Not one of Transfer, Cash, Credit Card.'},
+        ]
+
+        first, second = Rent.query.order_by(Rent.rentDate).all()
+        assert (first.returnDate, first.paymentMethod, first.paymentTotal) == (date(2023, 6, 4), 'Cash', 580)
+        assert (second.returnDate, second.paymentTotal) == (date(2023, 7, 10), 600)
+
+        # The dress counters are brought up to date after the insert
+        db.session.refresh(dress)
+        assert (dress.timesRented, dress.last_rent_id, dress.last_rent_date) == (2, second.id, date(2023, 7, 1))
+
+
+def test_import_xlsx_and_missing_columns(app):
+    with app.app_context():
+        buffer = io.BytesIO()
+        frame([{'size': '4', 'color': 'Red', 'style': 'Gown', 'brand': 'Zara', 'cost': '1000', 'rentPrice': '500'}]).to_excel(buffer, index=False)
+        buffer.seek(0)
+
+        assert import_file('dress', buffer, 'xlsx').inserted == 1
+
+        try:
+            import_frame('dress', frame([{'size': '4', 'color': 'Red'}]))
+        except ImportFileError as e:
+            assert 'style, brand, cost, rentPrice' in str(e)
+        else:
+            assert False, 'expected ImportFileError'
+
+
+def test_import_command_and_endpoint(app, runner, client, auth, tmp_path):
+    path = tmp_path / 'dresses.csv'
+    path.write_text('brand,size,color,style,cost,rentPrice\nZara,4,Red,Gown,1000,500\nZara,x,Red,Gown,1000,500\n')
+    report = tmp_path / 'errors.csv'
+
+    result = runner.invoke(args=['import-data', 'dress', str(path), '--report', str(report)])
+    assert 'Imported 1 of 2 dress rows, 1 failed.' in result.output
+    assert report.read_text().splitlines() == ['line,column,error', '3,size,Not a whole number.']
+
+    auth.login()
+    data = {'kind': 'dress', 'file': (io.BytesIO(path.read_bytes()), 'dresses.csv')}
+    response = client.post('/admin/import', data=data, content_type='multipart/form-data')
+    assert response.mimetype == 'text/csv'
+    assert b'3,size,Not a whole number.' in response.data
+
+    data = {'kind': 'dress', 'file': (io.BytesIO(b'brand\nZara\n'), 'dresses.txt')}
+    response = client.post('/admin/import', data=data, content_type='multipart/form-data')
+    assert response.status_code == 302
+
+    with app.app_context():
+        assert Dress.query.count() == 2
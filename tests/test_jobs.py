@@ -0,0 +1,42 @@
+from cordelia.models import Customer
+from cordelia.db import db
+from cordelia.jobs import export_jobs
+from io import BytesIO
+import os
+import time
+import zipfile
+
+
+
+def test_export_job(app, client, auth):
+    auth.login()
+
+    with app.app_context():
+        db.session.add(Customer(email='test_customer@example.com', name='test', lastName='customer', phoneNumber=6641234567))
+        db.session.commit()
+
+    assert client.post('/admin/download/jobs', data={'format': 'pdf'}).status_code == 400
+
+    response = client.post('/admin/download/jobs', data={'format': 'csv'})
+    assert response.status_code == 202
+    job = response.get_json()
+
+    export_jobs.get(job['id']).future.result(timeout=30)
+
+    status = client.get(job['status_url']).get_json()
+    assert status['status'] == 'done'
+    assert status['progress'] == {'Customers': 1}
+
+    response = client.get(job['download_url'])
+    assert response.status_code == 200
+    archive = zipfile.ZipFile(BytesIO(response.get_data()))
+    assert 'Customers.csv' in archive.namelist()
+    response.close()
+
+    # Finished files are removed once their TTL passes
+    file_path = export_jobs.get(job['id']).file_path
+    app.config['EXPORT_JOB_TTL'] = 0
+    time.sleep(0.01)
+
+    assert client.get(job['status_url']).status_code == 404
+    assert not os.path.exists(file_path)
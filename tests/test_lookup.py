@@ -0,0 +1,96 @@
+import sqlite3
+from datetime import date
+from cordelia.models import Dress, Customer, Rent, Sale
+from cordelia.db import db
+from cordelia.lookup import lookup, lookup_index, lookup_indexes
+
+
+
+def add_rows():
+    db.session.add_all([
+        Customer(name='Ana', lastName='Pérez', email='ana@example.com', phoneNumber=526441234567),
+        Customer(name='Mariana', lastName='Anaya', email='mariana@example.com', phoneNumber=526449876543),
+        Dress(size=4, color='Red', style='Silk gown', brand='Zara', cost=1000, rentPrice=1800),
+        Dress(size=6, color='Blue', style='Cocktail', brand='Mango', cost=1000, rentPrice=1800),
+    ])
+    db.session.commit()
+
+
+def test_lookup(app):
+    with app.app_context():
+        add_rows()
+
+        def ids(kind, text):
+            return [result['id'] for result in lookup(kind, text)]
+
+        # Exact word matches before prefix matches
+        assert ids('customer', 'ana') == [1, 2]
+        assert ids('customer', 'an') == [1, 2]
+        assert ids('customer', 'perez') == [1]
+        assert ids('customer', 'ana per') == [1]
+        assert ids('customer', '+52644987') == [2]
+        assert ids('customer', 'c-02') == [2]
+        assert ids('customer', 'nobody') == []
+        assert lookup('customer', '1') == [{'id': 1, 'label': 'C-01 Ana Pérez'}]
+
+        assert ids('dress', 'gown') == [1]
+        assert ids('dress', 'd-2') == [2]
+
+        # Rebuilt when the table changes
+        cached_indexes = len(lookup_indexes)
+        assert ids('dress', 'mango') == [2]
+        assert len(lookup_indexes) == cached_indexes
+        db.session.get(Dress, 2).brand = 'Zara'
+        db.session.commit()
+        assert ids('dress', 'zara') == [1, 2]
+
+
+def test_lookup_endpoint(app, client, auth):
+    with app.app_context():
+        add_rows()
+
+    assert client.get('/admin/lookup/customer?q=ana').status_code == 302
+
+    auth.login()
+    response = client.get('/admin/lookup/customer?q=ana&limit=1')
+    assert response.json == {'results': [{'id': 1, 'label': 'C-01 Ana Pérez'}]}
+    assert client.get('/admin/lookup/user?q=a').status_code == 404
+
+
+def test_sell_dress_checks_submitted_ids(app, client, auth):
+    with app.app_context():
+        add_rows()
+
+    auth.login()
+    data = {'dress_id': 2, 'customer_id': 99, 'sale_date': '2023-06-01', 'sale_price': 5000}
+    client.post('/admin/sell-dress/', data=data)
+    with app.app_context():
+        assert Sale.query.count() == 0
+
+    data['customer_id'] = 1
+    client.post('/admin/sell-dress/', data=data)
+    with app.app_context():
+        sale = Sale.query.one()
+        assert (sale.dress_id, sale.customer_id, sale.sale_date.date()) == (2, 1, date(2023, 6, 1))
+        assert db.session.get(Dress, 2).sold
+
+
+def test_lookup_index_versions(app):
+    with app.app_context():
+        add_rows()
+        dress_index = lookup_index('dress')
+        customer_index = lookup_index('customer')
+
+        # A rent updates the counters of its dress, not the columns the index reads
+        db.session.add(Rent(dressId=1, clientId=1, rentDate=date(2023, 6, 1), paymentMethod='Cash'))
+        db.session.commit()
+        assert lookup_index('dress') is dress_index
+
+        # A customer added by another process
+        connection = sqlite3.connect(db.engine.url.database)
+        connection.execute("INSERT INTO customer (name, lastName, email) VALUES ('Eva', 'Luna', 'eva@example.com')")
+        connection.commit()
+        connection.close()
+
+        assert lookup_index('customer') is not customer_index
+        assert [result['label'] for result in lookup('customer', 'eva')] == ['C-03 Eva Luna']
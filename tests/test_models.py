@@ -64,7 +64,7 @@ def test_create_rent(app, sample_dress, sample_customer):
         db.session.commit()
 
         rent_date = datetime.utcnow().date()
-        new_rent = Rent(dressId=sample_dress.id, clientId=sample_customer.id, rentDate=rent_date)
+        new_rent = Rent(dressId=sample_dress.id, clientId=sample_customer.id, rentDate=rent_date, paymentMethod='Cash')
         db.session.add(new_rent)
         db.session.commit()
 
@@ -76,6 +76,7 @@ def test_create_rent(app, sample_dress, sample_customer):
         assert rent.rentDate == rent_date
         assert rent.returnDate == rent_date + timedelta(days=3)
         assert rent.paymentTotal == int(sample_dress.rentPrice + (sample_dress.rentPrice * 0.16))
+        assert rent.paymentMethod == 'Cash'
 
 
 def test_rent_is_returned(app, sample_dress, sample_customer):
@@ -146,4 +147,285 @@ def test_maintenance_is_returned(app):
 
         test_maintenance.dresses.extend([dress1, dress2, dress3])
 
-        assert test_maintenance.is_returned()
\ No newline at end of file
+        assert test_maintenance.is_returned()
+
+def test_dress_last_rent(app, sample_dress, sample_customer):
+    with app.app_context():
+        db.session.add(sample_dress)
+        db.session.add(sample_customer)
+        db.session.commit()
+
+        older_date = datetime.utcnow().date() - timedelta(days=10)
+        newer_date = datetime.utcnow().date() - timedelta(days=5)
+
+        newer_rent = Rent(dressId=sample_dress.id, clientId=sample_customer.id, rentDate=newer_date, paymentMethod='Cash')
+        older_rent = Rent(dressId=sample_dress.id, clientId=sample_customer.id, rentDate=older_date, paymentMethod='Cash')
+        db.session.add_all([newer_rent, older_rent])
+        sample_dress.set_last_rent(newer_rent)
+        sample_dress.set_last_rent(older_rent)
+        db.session.commit()
+
+        assert sample_dress.last_rent_id == newer_rent.id
+        assert sample_dress.last_rent_date == newer_date
+        assert sample_dress.last_customer_id == sample_customer.id
+
+        db.session.delete(newer_rent)
+        sample_dress.update_last_rent(exclude=newer_rent)
+        db.session.commit()
+
+        assert sample_dress.last_rent_id == older_rent.id
+        assert sample_dress.last_rent_date == older_date
+
+
+def test_backfill_dress_db(app, runner, sample_dress, sample_customer):
+    with app.app_context():
+        db.session.add(sample_dress)
+        db.session.add(sample_customer)
+        db.session.commit()
+
+        rent_date = datetime.utcnow().date() - timedelta(days=5)
+        rent = Rent(dressId=sample_dress.id, clientId=sample_customer.id, rentDate=rent_date, paymentMethod='Cash')
+        maintenance = Maintenance(maintenance_type='Cleaning', date=rent_date + timedelta(days=3), cost=120)
+        maintenance.dresses.append(sample_dress)
+        db.session.add_all([rent, maintenance])
+        db.session.commit()
+
+        result = runner.invoke(args=['backfill-dress-db'])
+        assert 'Backfilled 1 dresses.' in result.output
+
+        dress = db.session.get(Dress, sample_dress.id)
+        db.session.refresh(dress)
+
+        assert dress.last_rent_id == rent.id
+        assert dress.last_rent_date == rent_date
+        assert dress.last_customer_id == sample_customer.id
+        assert dress.last_maintenance_date == rent_date + timedelta(days=3)
+
+
+def test_resolve_dress_statuses(app, sample_dress, sample_customer):
+    from cordelia.status import resolve_dress_statuses, resolve_customer_statuses
+
+    with app.app_context():
+        idle_dress = Dress(size=8, color='example color 2', style='example style 2', brand='example brand 2', cost=4000, rentPrice=1800)
+        db.session.add_all([sample_dress, idle_dress, sample_customer])
+        db.session.commit()
+
+        today = datetime.utcnow().date()
+        old_rent = Rent(dressId=sample_dress.id, clientId=sample_customer.id, rentDate=today - timedelta(days=10), paymentMethod='Cash')
+        new_rent = Rent(dressId=sample_dress.id, clientId=sample_customer.id, rentDate=today, paymentMethod='Cash')
+        db.session.add_all([old_rent, new_rent])
+        db.session.commit()
+
+        statuses = resolve_dress_statuses([sample_dress, idle_dress])
+
+        assert statuses[sample_dress.id].rented
+        assert statuses[sample_dress.id].last_rent == new_rent
+        assert statuses[sample_dress.id].last_customer == sample_customer
+        assert statuses[sample_dress.id].rents == [new_rent, old_rent]
+        assert statuses[sample_dress.id].needs_check
+        assert not statuses[idle_dress.id].rented
+        assert not statuses[idle_dress.id].in_maintenance
+        assert statuses[idle_dress.id].last_customer is None
+
+        customer_statuses = resolve_customer_statuses([sample_customer])
+
+        assert customer_statuses[sample_customer.id].active
+        assert customer_statuses[sample_customer.id].last_dress == sample_dress
+
+
+def test_update_statuses(app, sample_dress, sample_customer):
+    with app.app_context():
+        idle_dress = Dress(size=8, color='example color 2', style='example style 2', brand='example brand 2', cost=4000, rentPrice=1800)
+        db.session.add_all([sample_dress, idle_dress, sample_customer])
+        db.session.commit()
+
+        today = datetime.utcnow().date()
+        db.session.add_all([
+            Rent(dressId=sample_dress.id, clientId=sample_customer.id, rentDate=today - timedelta(days=10), paymentMethod='Cash'),
+            Rent(dressId=sample_dress.id, clientId=sample_customer.id, rentDate=today - timedelta(days=20), paymentMethod='Cash'),
+            Rent(dressId=sample_dress.id, clientId=sample_customer.id, rentDate=today, paymentMethod='Cash'),
+        ])
+        maintenance = Maintenance(maintenance_type='Cleaning', date=today, cost=120)
+        maintenance.dresses.append(idle_dress)
+        db.session.add(maintenance)
+        db.session.commit()
+
+        # Reset the denormalized columns as an out of date database would have them
+        db.session.execute(db.update(Dress).values(timesRented=0, sellable=False, rentStatus=False, maintenanceStatus=False))
+        db.session.commit()
+
+        assert Dress.update_statuses(dress_ids=[sample_dress.id]) == 1
+        assert Dress.update_statuses() == 1
+        assert Dress.update_statuses() == 0
+        db.session.commit()
+
+        dress = db.session.get(Dress, sample_dress.id)
+        assert dress.timesRented == 3
+        assert dress.sellable == (3 > dress.rentsForReturns)
+        assert dress.rentStatus and not dress.maintenanceStatus
+
+        dress = db.session.get(Dress, idle_dress.id)
+        assert dress.timesRented == 0
+        assert not dress.rentStatus and dress.maintenanceStatus
+
+
+def test_session_hooks_update_dress(app, sample_dress, sample_customer):
+    from cordelia.models import Sale
+
+    with app.app_context():
+        db.session.add_all([sample_dress, sample_customer])
+        db.session.commit()
+
+        today = datetime.utcnow().date()
+        old_rent = Rent(dressId=sample_dress.id, clientId=sample_customer.id, rentDate=today - timedelta(days=10), paymentMethod='Cash')
+        db.session.add(old_rent)
+        db.session.commit()
+
+        assert sample_dress.timesRented == 1
+        assert not sample_dress.rentStatus
+        assert sample_dress.last_rent_id == old_rent.id
+
+        new_rent = Rent(dressId=sample_dress.id, clientId=sample_customer.id, rentDate=today, paymentMethod='Cash')
+        db.session.add(new_rent)
+        db.session.commit()
+
+        assert sample_dress.timesRented == 2
+        assert sample_dress.rentStatus
+        assert sample_dress.last_rent_id == new_rent.id
+
+        db.session.delete(new_rent)
+        db.session.commit()
+
+        assert sample_dress.timesRented == 1
+        assert not sample_dress.rentStatus
+        assert sample_dress.last_rent_id == old_rent.id
+
+        maintenance = Maintenance(maintenance_type='Cleaning', date=today, cost=120)
+        db.session.add(maintenance)
+        db.session.commit()
+        maintenance.dresses.append(sample_dress)
+        db.session.commit()
+
+        assert sample_dress.maintenanceStatus
+        assert sample_dress.last_maintenance_date == today
+
+        db.session.delete(maintenance)
+        db.session.commit()
+
+        assert not sample_dress.maintenanceStatus
+        assert sample_dress.last_maintenance_date is None
+
+        sale = Sale(dress_id=sample_dress.id, customer_id=sample_customer.id, sale_date=datetime.utcnow(), sale_price=3000)
+        db.session.add(sale)
+        db.session.commit()
+
+        assert sample_dress.sold
+
+        db.session.delete(sale)
+        db.session.commit()
+
+        assert not sample_dress.sold
+        assert Dress.update_statuses() == 0
+
+
+def test_session_hooks_move_rent_to_another_dress(app, sample_dress, sample_customer):
+    with app.app_context():
+        other_dress = Dress(size=8, color='example color 2', style='example style 2', brand='example brand 2', cost=4000, rentPrice=1800)
+        db.session.add_all([sample_dress, other_dress, sample_customer])
+        db.session.commit()
+
+        today = datetime.utcnow().date()
+        old_rent = Rent(dressId=sample_dress.id, clientId=sample_customer.id, rentDate=today - timedelta(days=10), paymentMethod='Cash')
+        rent = Rent(dressId=sample_dress.id, clientId=sample_customer.id, rentDate=today, paymentMethod='Cash')
+        db.session.add_all([old_rent, rent])
+        db.session.commit()
+
+        rent.dressId = other_dress.id
+        db.session.commit()
+
+        assert (sample_dress.timesRented, sample_dress.rentStatus, sample_dress.last_rent_id) == (1, False, old_rent.id)
+        assert (other_dress.timesRented, other_dress.rentStatus, other_dress.last_rent_id) == (1, True, rent.id)
+
+        # Moving it back through the relationship
+        rent.dress = sample_dress
+        db.session.commit()
+
+        assert (sample_dress.timesRented, sample_dress.rentStatus, sample_dress.last_rent_id) == (2, True, rent.id)
+        assert (other_dress.timesRented, other_dress.rentStatus, other_dress.last_rent_id) == (0, False, None)
+        assert Dress.update_statuses() == 0
+
+
+def test_session_hooks_change_rent_date(app, sample_dress, sample_customer):
+    with app.app_context():
+        db.session.add_all([sample_dress, sample_customer])
+        db.session.commit()
+
+        today = datetime.utcnow().date()
+        old_rent = Rent(dressId=sample_dress.id, clientId=sample_customer.id, rentDate=today - timedelta(days=10), paymentMethod='Cash')
+        rent = Rent(dressId=sample_dress.id, clientId=sample_customer.id, rentDate=today - timedelta(days=20), paymentMethod='Cash')
+        db.session.add_all([old_rent, rent])
+        db.session.commit()
+
+        assert (sample_dress.rentStatus, sample_dress.last_rent_id) == (False, old_rent.id)
+
+        # Moved to today it becomes the latest rent and the dress is out
+        rent.rentDate = today
+        rent.returnDate = today + timedelta(days=3)
+        db.session.commit()
+
+        assert (sample_dress.timesRented, sample_dress.rentStatus, sample_dress.last_rent_id) == (2, True, rent.id)
+        assert sample_customer.check_status()
+
+        # Postponed to next week it is a booking that has not started yet
+        rent.rentDate = today + timedelta(days=7)
+        rent.returnDate = today + timedelta(days=10)
+        db.session.commit()
+
+        assert (sample_dress.timesRented, sample_dress.rentStatus, sample_dress.last_rent_id) == (2, False, rent.id)
+        assert not sample_customer.check_status()
+        assert Dress.update_statuses() == 0
+
+
+def test_session_hooks_change_return_date(app, sample_dress, sample_customer):
+    with app.app_context():
+        db.session.add_all([sample_dress, sample_customer])
+        db.session.commit()
+
+        today = datetime.utcnow().date()
+        rent = Rent(dressId=sample_dress.id, clientId=sample_customer.id, rentDate=today - timedelta(days=5), paymentMethod='Cash')
+        db.session.add(rent)
+        db.session.commit()
+
+        assert not sample_dress.rentStatus
+
+        # Extended past today the dress is still out
+        rent.returnDate = today + timedelta(days=1)
+        db.session.commit()
+
+        assert sample_dress.rentStatus
+
+        # Returned early
+        rent.returnDate = today - timedelta(days=1)
+        db.session.commit()
+
+        assert not sample_dress.rentStatus
+        assert (sample_dress.timesRented, sample_dress.last_rent_id) == (1, rent.id)
+        assert Dress.update_statuses() == 0
+
+
+def test_resolve_maintenance_dresses(app, sample_dress):
+    from cordelia.status import resolve_maintenance_dresses
+
+    with app.app_context():
+        dress = sample_dress
+        other_dress = Dress(size=4, color='example color', style='example style', brand='example brand', cost=4200, rentPrice=1800)
+        today = datetime.utcnow().date()
+
+        maintenance = Maintenance(date=today, returnDate=today + timedelta(days=2), maintenance_type='Cleaning', cost=200)
+        maintenance.dresses.extend([other_dress, dress])
+        empty_maintenance = Maintenance(date=today, returnDate=today + timedelta(days=2), maintenance_type='Repair', cost=100)
+        db.session.add_all([maintenance, empty_maintenance])
+        db.session.commit()
+
+        dresses = resolve_maintenance_dresses([maintenance, empty_maintenance])
+        assert dresses == {maintenance.id: sorted([dress.id, other_dress.id]), empty_maintenance.id: []}
@@ -0,0 +1,97 @@
+from cordelia.models import Dress
+from cordelia.db import db
+from cordelia.pagination import paginate, encode_cursor, decode_cursor, count_rows, count_cache, count_refreshes
+from sqlalchemy import desc
+from datetime import date, datetime, timedelta
+
+
+
+def walk_pages(app, query, order_by, per_page, **args):
+    # Follow the next links from the first page, then the previous links back from the last one
+    forward, backward = [], []
+
+    params = dict(args)
+    while True:
+        with app.test_request_context(query_string=params):
+            page = paginate(query, order_by, per_page=per_page)
+        forward.append([dress.id for dress in page.items])
+        if not page.has_next:
+            break
+        params = dict(args, page=page.next_num, after=page.next_cursor)
+
+    params = dict(args, last=1)
+    while True:
+        with app.test_request_context(query_string=params):
+            page = paginate(query, order_by, per_page=per_page)
+        backward.insert(0, [dress.id for dress in page.items])
+        if not page.has_prev:
+            assert page.page == 1
+            break
+        params = dict(args, page=page.prev_num, before=page.prev_cursor)
+
+    return forward, backward
+
+
+def test_keyset_pagination(app):
+    with app.app_context():
+        today = date(2023, 6, 1)
+        for i in range(11):
+            dress = Dress(size=4, color='example color', style='example style', brand='example brand', cost=1000 * (i % 3), rentPrice=1800)
+            dress.rentStatus = i % 4 == 0
+            # Leave some dates empty to page across NULLs
+            dress.last_rent_date = today - timedelta(days=i % 5) if i % 2 else None
+            dress.dateAdded = datetime(2023, 1, 1)
+            db.session.add(dress)
+        db.session.commit()
+
+        for order_by in (
+            [Dress.cost.desc()],
+            [Dress.id],
+            [desc(Dress.rentStatus), desc(Dress.last_rent_date), desc(Dress.dateAdded)],
+        ):
+            expected = [dress.id for dress in Dress.query.order_by(*order_by, Dress.id)]
+            pages = [expected[i:i + 3] for i in range(0, len(expected), 3)]
+
+            forward, backward = walk_pages(app, Dress.query, order_by, per_page=3)
+            assert forward == pages
+            assert backward == pages
+
+        # Page numbers without a cursor still work through an offset
+        with app.test_request_context(query_string={'page': 2}):
+            page = paginate(Dress.query, [Dress.id], per_page=3)
+        assert [dress.id for dress in page.items] == [4, 5, 6]
+        assert page.total == 11 and page.pages == 4
+
+
+def test_cursor_round_trip():
+    values = [True, None, date(2023, 6, 1), datetime(2023, 1, 1, 12, 30), 'Smith', 7]
+    assert decode_cursor(encode_cursor(values)) == values
+    assert decode_cursor('not a cursor') is None
+
+
+def test_cached_and_estimated_counts(app):
+    app.config['EXACT_COUNT_LIMIT'] = 3
+
+    with app.app_context():
+        count_cache.clear()
+
+        db.session.add_all([
+            Dress(size=4, color='example color', style='example style', brand='example brand', cost=4200, rentPrice=1800)
+            for i in range(5)
+        ])
+        db.session.commit()
+
+        # Too many rows to count in the request, a background count fills the cache
+        assert count_rows(Dress.query) == (3, 'over')
+        for thread in list(count_refreshes.values()):
+            thread.join(timeout=10)
+        assert count_rows(Dress.query) == (5, None)
+
+        # Writes invalidate the count, the previous one stands in until it is recounted
+        db.session.add(Dress(size=4, color='example color', style='example style', brand='example brand', cost=4200, rentPrice=1800))
+        db.session.commit()
+        assert count_rows(Dress.query) == (5, 'about')
+
+        with app.test_request_context():
+            page = paginate(Dress.query.filter(Dress.id <= 3), [Dress.id], per_page=2)
+        assert page.total == 3 and page.total_display == '3'
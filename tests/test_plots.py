@@ -0,0 +1,80 @@
+import sqlite3
+from cordelia.models import Dress, Customer, Rent, User
+from cordelia.db import db
+from cordelia.cache import LRUCache
+from datetime import datetime, timedelta
+
+
+
+def test_lru_cache_eviction():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+
+    cache.set('c', 3)
+    assert 'b' not in cache
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+
+def test_plot_image_conditional_get(app, client, auth):
+    auth.login()
+
+    assert client.get('/admin/dashboard/plot/2/image').status_code == 404
+    # The no data message instead of a broken image
+    response = client.get('/admin/dashboard/plot/2')
+    assert b'/admin/dashboard/plot/2/image' not in response.data
+    assert b'404' in response.data
+
+    with app.app_context():
+        dress = Dress(size=4, color='example color', style='example style', brand='example brand', cost=4200, rentPrice=1800)
+        customer = Customer(email='test_customer@example.com', name='test', lastName='customer', phoneNumber=6641234567)
+        db.session.add_all([dress, customer])
+        db.session.commit()
+
+        rent_date = datetime.utcnow().date() - timedelta(days=10)
+        db.session.add(Rent(dressId=dress.id, clientId=customer.id, rentDate=rent_date, paymentMethod='Cash'))
+        dress_id, customer_id = dress.id, customer.id
+        db.session.commit()
+
+    response = client.get('/admin/dashboard/plot/2')
+    assert b'/admin/dashboard/plot/2/image' in response.data
+
+    response = client.get('/admin/dashboard/plot/2/image')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+    etag = response.headers['ETag']
+
+    response = client.get('/admin/dashboard/plot/2/image', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    assert client.get('/admin/dashboard/plot/2/image?format=gif').status_code == 404
+
+    # A rent written by another process changes the ETag, the old one gets the new image
+    with app.app_context():
+        connection = sqlite3.connect(db.engine.url.database)
+        connection.execute(
+            "INSERT INTO rent (dressId, clientId, rentDate, returnDate, paymentMethod, paymentTotal) VALUES (?, ?, ?, ?, 'Cash', 2088)",
+            (dress_id, customer_id, rent_date.isoformat(), rent_date.isoformat())
+        )
+        connection.commit()
+        connection.close()
+
+    response = client.get('/admin/dashboard/plot/2/image', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_plot_links_for_admins_only(app, client, auth):
+    with app.app_context():
+        user = User(username='clerk', email='clerk@example.com')
+        user.set_password('clerkpassword')
+        db.session.add(user)
+        db.session.commit()
+
+    auth.login(email='clerk@example.com', password='clerkpassword')
+    assert b'/admin/dashboard/plot/' not in client.get('/admin/dashboard/dress-db').data
+    auth.logout()
+
+    auth.login()
+    assert b'/admin/dashboard/plot/1' in client.get('/admin/dashboard/dress-db').data
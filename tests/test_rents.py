@@ -0,0 +1,75 @@
+from datetime import date, datetime
+import pytest
+from sqlalchemy import event
+from cordelia.models import Dress, Customer, Rent
+from cordelia.db import db
+from cordelia.rents import create_rent, create_rents
+
+
+
+def count_statements(app):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split()[0].upper())
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    return statements
+
+
+def add_dresses_and_customers(add_stock, count):
+    # Dresses with different rent prices
+    return add_stock(dresses=[{'rentPrice': 1000 + 100 * i} for i in range(count)], customers=count)
+
+
+def test_rent_uses_identity_map(app, add_stock):
+    with app.app_context():
+        dress_ids, customer_ids = add_dresses_and_customers(add_stock, 1)
+        dress = db.session.get(Dress, dress_ids[0])
+        customer = db.session.get(Customer, customer_ids[0])
+
+        statements = count_statements(app)
+        rent = Rent(dressId=dress.id, clientId=customer.id, rentDate=datetime(2023, 6, 1, 10), paymentMethod='Cash')
+
+        assert statements == []
+        assert rent.dress is dress and rent.customer is customer
+        assert (rent.rentDate, rent.returnDate, rent.paymentTotal) == (date(2023, 6, 1), date(2023, 6, 4), 1160)
+
+
+def test_create_rents_in_one_flush(app, add_stock):
+    with app.app_context():
+        dress_ids, customer_ids = add_dresses_and_customers(add_stock, 20)
+        db.session.expunge_all()
+
+        rows = [(dress_ids[i % 20], customer_ids[(i * 7) % 20], date(2023, 1, 1 + i % 28), 'Cash') for i in range(100)]
+
+        statements = count_statements(app)
+        rents = create_rents(rows)
+        db.session.commit()
+
+        # Two id checks and two loads, whatever the number of rents
+        assert statements.count('SELECT') == 4
+        assert len(rents) == 100
+        assert Rent.query.count() == 100
+
+        dress = db.session.get(Dress, dress_ids[3])
+        assert dress.timesRented == 5
+        assert dress.last_rent_date == date(2023, 1, 28)
+        assert {rent.paymentTotal for rent in dress.rents} == {int(1300 * 1.16)}
+
+
+def test_create_rents_rejects_unknown_ids(app, add_stock):
+    with app.app_context():
+        dress_ids, customer_ids = add_dresses_and_customers(add_stock, 2)
+
+        with pytest.raises(ValueError):
+            create_rents([(dress_ids[0], customer_ids[0], date(2023, 1, 1), 'Cash'), (999, customer_ids[1], date(2023, 1, 1), 'Cash')])
+        assert Rent.query.count() == 0
+
+        rent = create_rent(dress_ids[1], customer_ids[1], date(2023, 1, 1), 'Cash')
+        db.session.commit()
+        assert rent.dressId == dress_ids[1]
+        with pytest.raises(ValueError):
+            create_rent(999, customer_ids[1], date(2023, 1, 1), 'Cash')
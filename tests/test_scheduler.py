@@ -0,0 +1,103 @@
+import sqlite3
+from cordelia.models import Dress, Rent, Maintenance, current_date
+from cordelia.db import db
+from cordelia.scheduler import expire_statuses, activate_statuses, upcoming_return_dates, upcoming_rent_dates, StatusScheduler
+from datetime import datetime, timedelta
+
+
+
+def test_expire_statuses(app, add_stock):
+    with app.app_context():
+        (dress_id,), (customer_id,) = add_stock()
+        dress = db.session.get(Dress, dress_id)
+
+        today = current_date()
+        rent = Rent(dressId=dress_id, clientId=customer_id, rentDate=today, paymentMethod='Cash')
+        maintenance = Maintenance(maintenance_type='Cleaning', date=today, cost=120)
+        maintenance.dresses.append(dress)
+        db.session.add_all([rent, maintenance])
+        db.session.commit()
+
+        assert dress.rentStatus and dress.maintenanceStatus
+        assert upcoming_return_dates() == {rent.returnDate, maintenance.returnDate}
+
+        # Maintenances are returned after two days and rents after three
+        assert expire_statuses(today=today + timedelta(days=3)) == (0, 1)
+        assert expire_statuses(today=today + timedelta(days=4), since=rent.returnDate) == (1, 0)
+        db.session.commit()
+
+        dress = db.session.get(Dress, dress.id)
+        assert not dress.rentStatus and not dress.maintenanceStatus
+
+
+def test_activate_booking(app, add_stock):
+    with app.app_context():
+        (dress_id,), (customer_id,) = add_stock()
+        dress = db.session.get(Dress, dress_id)
+
+        # A booking that starts in two days doesn't rent the dress out yet
+        today = current_date()
+        rent = Rent(dressId=dress_id, clientId=customer_id, rentDate=today + timedelta(days=2), paymentMethod='Cash')
+        db.session.add(rent)
+        db.session.commit()
+
+        assert not dress.rentStatus and dress.last_rent_id == rent.id
+        assert upcoming_rent_dates() == {rent.rentDate}
+        assert activate_statuses() == 0
+        assert Dress.update_statuses() == 0
+
+        # It is activated once its start date arrives, and expired after its return date
+        assert activate_statuses(today=today + timedelta(days=2), since=rent.rentDate) == 1
+        db.session.commit()
+        db.session.refresh(dress)
+        assert dress.rentStatus
+        assert expire_statuses(today=today + timedelta(days=5)) == (0, 0)
+        assert expire_statuses(today=today + timedelta(days=6)) == (1, 0)
+        db.session.commit()
+        db.session.refresh(dress)
+        assert not dress.rentStatus
+
+
+def test_expire_statuses_command(runner):
+    result = runner.invoke(args=['expire-statuses'])
+    assert 'Expired 0 rent and 0 maintenance statuses.' in result.output
+    assert 'Activated 0 rent statuses.' in result.output
+
+
+def test_scheduler_heap():
+    scheduler = StatusScheduler()
+    today = current_date()
+
+    scheduler.schedule(today + timedelta(days=2))
+    scheduler.schedule(today - timedelta(days=1))
+    scheduler.schedule(today - timedelta(days=1))
+
+    assert scheduler._pop_due(today) == [today]
+    assert scheduler._pop_due(today) == []
+    assert scheduler._pop_due(today + timedelta(days=3)) == [today + timedelta(days=3)]
+
+
+def test_scheduler_reload(app, add_stock):
+    scheduler = StatusScheduler()
+    scheduler.app = app
+    today = current_date()
+
+    with app.app_context():
+        (dress_id,), (customer_id,) = add_stock()
+
+    assert scheduler._reload()
+    assert scheduler._heap == []
+    assert not scheduler._reload()
+
+    # A rent committed by another process is picked up on the next check
+    with app.app_context():
+        connection = sqlite3.connect(db.engine.url.database)
+        connection.execute(
+            "INSERT INTO rent (dressId, clientId, rentDate, returnDate, paymentMethod) VALUES (?, ?, ?, ?, 'Cash')",
+            (dress_id, customer_id, today.isoformat(), (today + timedelta(days=3)).isoformat())
+        )
+        connection.commit()
+        connection.close()
+
+    assert scheduler._reload()
+    assert scheduler._pop_due(today + timedelta(days=4)) == [today + timedelta(days=4)]
@@ -0,0 +1,128 @@
+from cordelia.models import Dress, Customer, Rent
+from cordelia.db import db
+from cordelia.search import search_filter, search_ids, match_query, column_predicate, SearchError
+from datetime import date
+import pytest
+
+
+
+def matching_ids(model, search, columns=None):
+    return sorted(item.id for item in model.query.filter(search_filter(model, search, columns)))
+
+
+def test_match_query():
+    assert match_query('  ') is None
+    assert match_query('red "silk*') == '"red"* "silk"*'
+    assert match_query('ana', ['name', 'lastName']) == '{name lastName} : ("ana"*)'
+
+
+def test_search_index_follows_writes(app):
+    with app.app_context():
+        red = Dress(size=4, color='Red', style='Silk gown', brand='Zara', cost=1000, rentPrice=1800)
+        blue = Dress(size=6, color='Blue', style='Cotton dress', brand='Mango', cost=1000, rentPrice=1800)
+        db.session.add_all([red, blue])
+        db.session.commit()
+
+        # Prefix, case and word order don't matter
+        assert matching_ids(Dress, 're') == [red.id]
+        assert matching_ids(Dress, 'gown SILK') == [red.id]
+        assert matching_ids(Dress, 'dress') == [blue.id]
+        assert matching_ids(Dress, 'zara', ['color']) == []
+
+        blue.color = 'Dark red'
+        db.session.commit()
+        assert matching_ids(Dress, 'red', ['color']) == [red.id, blue.id]
+        assert matching_ids(Dress, 'blue') == []
+
+        db.session.delete(red)
+        db.session.commit()
+        assert matching_ids(Dress, 'red') == [blue.id]
+
+
+def test_search_ranking(app):
+    with app.app_context():
+        ana = Customer(name='Ana', lastName='Pérez', email='ana@example.com')
+        maria = Customer(name='María', lastName='Ana', email='maria.ana.ana@example.com')
+        db.session.add_all([ana, maria])
+        db.session.commit()
+
+        # Accents are ignored, best matches come first
+        assert search_ids(Customer, 'perez') == [ana.id]
+        assert search_ids(Customer, 'maria') == [maria.id]
+        assert search_ids(Customer, 'ana') == [maria.id, ana.id]
+
+
+def test_dashboard_text_search(client, auth, app):
+    with app.app_context():
+        db.session.add_all([
+            Dress(size=4, color='Emerald', style='Gown', brand='Zara', cost=1000, rentPrice=1800),
+            Dress(size=6, color='Blue', style='Gown', brand='Mango', cost=1000, rentPrice=1800),
+        ])
+        db.session.commit()
+
+    auth.login()
+    response = client.post('/admin/dashboard/dress-db', data={'category': 'text', 'search': 'emer'})
+    assert response.status_code == 200
+    assert b'Emerald' in response.data
+    assert b'Mango' not in response.data
+
+
+def test_dashboard_search_ranked(client, auth, app):
+    with app.app_context():
+        db.session.add_all([
+            Customer(name='Ana', lastName='Pérez', email='ana@example.com'),
+            Customer(name='María', lastName='Ana', email='maria.ana.ana@example.com'),
+            Customer(name='Eva', lastName='Luna', email='eva@example.com'),
+        ])
+        db.session.commit()
+
+    auth.login()
+    response = client.post('/admin/dashboard/customer-db', data={'category': 'text', 'search': 'ana'})
+    assert response.status_code == 200
+    # Best match first, not in id order
+    assert response.data.index(b'maria.ana.ana@example.com') < response.data.index(b'ana@example.com<')
+    assert b'eva@example.com' not in response.data
+
+    # Only the user-facing columns are offered
+    response = client.get('/admin/dashboard/dress-db')
+    assert b'value="brand"' in response.data
+    assert b'value="version"' not in response.data
+    assert b'value="last_rent_id"' not in response.data
+
+
+def test_typed_column_predicates(app):
+    with app.app_context():
+        customer = Customer(name='Ana', lastName='Pérez', email='ana@example.com')
+        dresses = [Dress(size=size, color='Red', style='Gown', brand='Zara', cost=cost, rentPrice=1800)
+                   for size, cost in [(2, 1000), (4, 1500), (6, 2000), (8, 2500)]]
+        dresses[1].sold = True
+        db.session.add_all([customer] + dresses)
+        db.session.flush()
+
+        for day in [date(2023, 5, 31), date(2023, 6, 1), date(2023, 6, 30), date(2023, 7, 1)]:
+            db.session.add(Rent(rentDate=day, dressId=dresses[0].id, clientId=customer.id, paymentMethod='Cash'))
+        db.session.commit()
+
+        def costs(search, name='cost'):
+            return sorted(dress.cost for dress in Dress.query.filter(column_predicate(Dress, name, search)))
+
+        def rent_days(search):
+            return sorted(rent.rentDate.day for rent in Rent.query.filter(column_predicate(Rent, 'rentDate', search)))
+
+        assert costs('1500') == [1500]
+        assert costs('1500..2000') == [1500, 2000]
+        assert costs('..1500') == [1000, 1500]
+        assert costs('>4', 'size') == [2000, 2500]
+        assert costs('<=4', 'size') == [1000, 1500]
+        assert costs('yes', 'sold') == [1500]
+        assert costs('no', 'sold') == [1000, 2000, 2500]
+
+        assert rent_days('2023-06') == [1, 30]
+        assert rent_days('2023-06-30') == [30]
+        assert rent_days('2023-05-31..2023-06-01') == [1, 31]
+        assert rent_days('>2023-06') == [1]
+        assert rent_days('2023') == [1, 1, 30, 31]
+
+        for name, search in [('cost', 'cheap'), ('rentDate', '2023-13'), ('sold', 'maybe')]:
+            with pytest.raises(SearchError):
+                column_predicate(Dress if name != 'rentDate' else Rent, name, search)